@@ -0,0 +1,383 @@
+"""
+Persistent store of past analyses (`GET /analyses`, `GET /analyses/{id}`).
+
+Every analysis served by `/webpage-analysis` is recorded with its inputs and validated
+`WebpageAnalysisResponse` in a SQLite file (`ANALYSIS_STORE_PATH`, WAL mode), so history, comparisons
+and repeated questions no longer need a new model call:
+
+- Inputs and results are stored as compressed JSON blobs: zstd when available (`compression.zstd` on
+  Python 3.14+, or the `zstandard` package), zlib otherwise. The codec is recorded per row, so a store
+  stays readable when the available codecs change.
+- Rows are indexed by content hash, page URL, label, model, result cache key and timestamp. Listing is
+  paginated by an opaque cursor (newest first) rather than by offset, so pages stay stable while new
+  analyses arrive.
+- Writes never run on the request path: `add` queues the record, and `run_writer` writes queued records
+  in batches (one transaction per `ANALYSIS_STORE_BATCH_SIZE` records or `ANALYSIS_STORE_FLUSH_SECONDS`),
+  compressing them in a worker thread. Queued records are already visible to `get` and `list`.
+- Recent records also stay in memory (`app.incremental.AnalysisHistory`), which serves the lookups of
+  incremental re-analysis without touching the disk.
+
+Records older than `ANALYSIS_STORE_TTL_SECONDS` are purged. The store keeps only the in-memory history
+unless `ANALYSIS_STORE_PATH` is set, since it persists every submitted page.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from .incremental import AnalysisHistory, PreviousAnalysis, content_hash
+from .models import WebpageAnalysisResponse
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# SQLite file of the store, e.g. in a data directory. Empty keeps only the in-memory history.
+ANALYSIS_STORE_PATH = os.getenv("ANALYSIS_STORE_PATH", "")
+ANALYSIS_STORE_BATCH_SIZE = int(os.getenv("ANALYSIS_STORE_BATCH_SIZE", "64"))
+ANALYSIS_STORE_FLUSH_SECONDS = float(os.getenv("ANALYSIS_STORE_FLUSH_SECONDS", "1"))
+# 0 keeps analyses forever
+ANALYSIS_STORE_TTL_SECONDS = float(os.getenv("ANALYSIS_STORE_TTL_SECONDS", str(90 * 24 * 60 * 60)))
+# Records waiting to be written; further records are dropped (and logged) while the disk lags behind
+ANALYSIS_STORE_QUEUE_SIZE = int(os.getenv("ANALYSIS_STORE_QUEUE_SIZE", "10000"))
+
+# Maximum page size of `GET /analyses`
+MAX_PAGE_SIZE = 200
+# How often the writer purges expired records
+_PURGE_INTERVAL_SECONDS = 3600
+
+_FILTERS = ("content_hash", "url", "label", "model", "request_key")
+_COLUMNS = "id, created_at, content_hash, context, url, label, model, request_key, codec, inputs, result"
+# Listing only needs the indexed columns and the executive summary, never the stored inputs
+_SUMMARY_COLUMNS = "id, created_at, content_hash, url, label, model, codec, result"
+
+
+def compress(data: bytes) -> tuple[str, bytes]:
+    """
+    Compresses a JSON blob with the best available codec.
+
+    Returns:
+        tuple[str, bytes]: The codec name ("zstd" or "zlib") and the compressed bytes.
+    """
+    if zstd is not None:
+        return "zstd", zstd.compress(data, level=3)
+    return "zlib", zlib.compress(data, 6)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """
+    Decompresses a blob written by `compress`.
+
+    Raises:
+        ValueError: For a zstd blob when no zstd implementation is installed.
+    """
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if zstd is None:
+        raise ValueError("Stored analysis is zstd-compressed, but zstd is not available")
+    return zstd.decompress(data)
+
+
+def _summary(record: PreviousAnalysis) -> dict:
+    return {"id": record.id, "created_at": record.created_at, "content_hash": record.content_hash, "url": record.url,
+            "label": record.label, "model": record.model, "executive_summary": record.result.Executive_Summary}
+
+
+def encode_cursor(summary: dict) -> str:
+    return f"{summary['created_at']!r}:{summary['id']}"
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """
+    Raises:
+        ValueError: For a malformed cursor.
+    """
+    created_at, _, record_id = cursor.partition(":")
+    if not record_id:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return float(created_at), record_id
+
+
+class SqliteAnalyses:
+    """
+    The SQLite table of stored analyses.
+
+    Methods are blocking; `AnalysisStore` runs them in a worker thread.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = ANALYSIS_STORE_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call: cheap for SQLite and safe across worker threads
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            if not self._initialized:
+                # Created on first use, so importing the app does not create the file
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analyses ("
+                    "id TEXT PRIMARY KEY, created_at REAL NOT NULL, content_hash TEXT NOT NULL, context TEXT NOT NULL, "
+                    "url TEXT, label TEXT, model TEXT, request_key TEXT, codec TEXT NOT NULL, inputs BLOB NOT NULL, result BLOB NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created_at, id)")
+                for column in _FILTERS:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS analyses_{column} ON analyses ({column}, created_at)")
+                self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def write(self, records: list[PreviousAnalysis]) -> None:
+        """
+        Compresses and inserts a batch of records in one transaction.
+        """
+        rows = []
+        for record in records:
+            inputs = json.dumps({"htmlText": record.htmlText, "specification": record.specification}).encode("utf-8")
+            codec, inputs = compress(inputs)
+            _, result = compress(record.result.model_dump_json(by_alias=True).encode("utf-8"))
+            rows.append((record.id, record.created_at, record.content_hash, record.context, record.url, record.label,
+                         record.model, record.request_key, codec, inputs, result))
+        with self._connect() as conn:
+            conn.executemany(f"INSERT OR REPLACE INTO analyses ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _record(self, row) -> PreviousAnalysis:
+        record_id, created_at, content_hash, context, url, label, model, request_key, codec, inputs, result = row
+        inputs = json.loads(decompress(codec, inputs))
+        return PreviousAnalysis(id=record_id, content_hash=content_hash, context=context, htmlText=inputs["htmlText"],
+                                result=WebpageAnalysisResponse.model_validate_json(decompress(codec, result)),
+                                specification=inputs.get("specification"), url=url, label=label, model=model,
+                                request_key=request_key, created_at=created_at)
+
+    def get(self, reference: str) -> PreviousAnalysis | None:
+        """
+        Returns the record with this id, or the latest one with this content hash.
+        """
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM analyses WHERE id = ?", (reference,)).fetchone()
+            if row is None:
+                row = conn.execute(f"SELECT {_COLUMNS} FROM analyses WHERE content_hash = ? ORDER BY created_at DESC LIMIT 1", (reference,)).fetchone()
+        return self._record(row) if row is not None else None
+
+    def list(self, filters: dict[str, str], since: float | None, until: float | None, before: tuple[float, str] | None, limit: int) -> list[dict]:
+        """
+        Returns the summaries of the newest records matching every filter, older than the `before` cursor
+        position. Inputs are not read, and results are only decoded for their executive summary.
+        """
+        clauses, params = [], []
+        for column, value in filters.items():
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if before is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend((before[0], before[0], before[1]))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {_SUMMARY_COLUMNS} FROM analyses {where} ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [{"id": record_id, "created_at": created_at, "content_hash": content_hash, "url": url, "label": label, "model": model,
+                 "executive_summary": json.loads(decompress(codec, result)).get("Executive Summary")}
+                for record_id, created_at, content_hash, url, label, model, codec, result in rows]
+
+    def purge(self) -> int:
+        """
+        Deletes records older than `ttl_seconds`.
+
+        Returns:
+            int: The number of deleted records.
+        """
+        if self.ttl_seconds <= 0:
+            return 0
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM analyses WHERE created_at <= ?", (self._clock() - self.ttl_seconds,)).rowcount
+
+
+class AnalysisStore:
+    """
+    Past analyses: recent ones in memory, all of them in SQLite, written in batches off the request path.
+
+    Attributes:
+        memory: The in-memory history of recent analyses.
+        disk: The SQLite table, or None when only the memory is used.
+        batch_size: Number of queued records that triggers a write.
+        flush_seconds: Maximum time a record waits in the queue while the writer runs.
+        queue_size: Maximum number of queued records.
+    """
+
+    def __init__(self, path: str | None = ANALYSIS_STORE_PATH, memory: AnalysisHistory | None = None, batch_size: int = ANALYSIS_STORE_BATCH_SIZE,
+                 flush_seconds: float = ANALYSIS_STORE_FLUSH_SECONDS, queue_size: int = ANALYSIS_STORE_QUEUE_SIZE, ttl_seconds: float = ANALYSIS_STORE_TTL_SECONDS):
+        self.memory = memory if memory is not None else AnalysisHistory()
+        self.disk = SqliteAnalyses(path, ttl_seconds) if path else None
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue_size = queue_size
+        self._queue: list[PreviousAnalysis] = []
+        self._write_lock = asyncio.Lock()
+        self._flush_tasks: set[asyncio.Task] = set()
+        self.stats = {"written": 0, "dropped": 0, "write_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory.enabled or self.disk is not None
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def add(self, htmlText: str, context: str, result: WebpageAnalysisResponse, **metadata) -> PreviousAnalysis:
+        """
+        Records an analysis. It is kept in memory at once and written to disk by the next batch.
+
+        Args:
+            htmlText (str): The analyzed HTML.
+            context (str): See `PreviousAnalysis.context`.
+            result (WebpageAnalysisResponse): The validated analysis.
+            **metadata: Other `PreviousAnalysis` fields (specification, url, label, model, request_key).
+
+        Returns:
+            PreviousAnalysis: The record, with its new id.
+        """
+        record = PreviousAnalysis(id=uuid.uuid4().hex, content_hash=content_hash(htmlText), context=context, htmlText=htmlText, result=result, **metadata)
+        if self.memory.enabled:
+            self.memory.put(record)
+        if self.disk is None:
+            return record
+        if len(self._queue) >= self.queue_size:
+            self.stats["dropped"] += 1
+            logging.warning(f"Analysis store queue full, analysis {record.id} is not persisted")
+            return record
+        self._queue.append(record)
+        if len(self._queue) >= self.batch_size:
+            # Written by a background task, never by the request that filled the batch
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        return record
+
+    async def flush(self) -> int:
+        """
+        Writes every queued record in one batch.
+
+        Returns:
+            int: The number of records written.
+        """
+        async with self._write_lock:
+            batch, self._queue = self._queue, []
+            if not batch or self.disk is None:
+                return 0
+            try:
+                await asyncio.to_thread(self.disk.write, batch)
+            except sqlite3.Error as e:
+                # A broken store must never fail the analyses it records
+                self.stats["write_errors"] += 1
+                logging.warning(f"Analysis store write of {len(batch)} records failed: {e}")
+                return 0
+            self.stats["written"] += len(batch)
+            return len(batch)
+
+    async def run_writer(self) -> None:
+        """
+        Writes queued records every `flush_seconds` and purges expired ones hourly. Meant to run as a
+        long-lived task for the app's lifetime; call `flush` after cancelling it.
+        """
+        last_purge = 0.0
+        while True:
+            if self.disk is not None and time.monotonic() - last_purge >= _PURGE_INTERVAL_SECONDS:
+                last_purge = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.disk.purge)
+                except sqlite3.Error as e:
+                    logging.warning(f"Analysis store purge failed: {e}")
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def get(self, reference: str) -> PreviousAnalysis | None:
+        """
+        Returns the analysis with this id, or the latest analysis of the HTML with this content hash.
+
+        Args:
+            reference (str): An id (`X-Analysis-Id`) or content hash (`X-Content-Hash`).
+
+        Returns:
+            PreviousAnalysis | None: The analysis, or None if it is unknown.
+        """
+        record = self.memory.get(reference)
+        if record is not None and record.id == reference:
+            return record
+        if self.disk is not None:
+            if self._queue and not self.memory.enabled:
+                await self.flush()
+            try:
+                stored = await asyncio.to_thread(self.disk.get, reference)
+            except (sqlite3.Error, ValueError) as e:
+                logging.warning(f"Analysis store read failed: {e}")
+                stored = None
+            # A content hash may have a newer analysis on disk than the one in memory
+            if stored is not None and (record is None or stored.created_at > record.created_at):
+                if self.memory.enabled:
+                    self.memory.put(stored)
+                return stored
+        return record
+
+    async def list(self, filters: dict[str, str] | None = None, since: float | None = None, until: float | None = None, cursor: str | None = None,
+                   limit: int = 50) -> dict:
+        """
+        Lists stored analyses, newest first.
+
+        Args:
+            filters (dict[str, str] | None, optional): Exact matches on content_hash, url, label, model or request_key.
+            since (float | None, optional): Only analyses created at or after this Unix timestamp.
+            until (float | None, optional): Only analyses created before this Unix timestamp.
+            cursor (str | None, optional): `next_cursor` of the previous page.
+            limit (int, optional): Page size, at most `MAX_PAGE_SIZE`.
+
+        Returns:
+            dict: `{"items": [summaries], "next_cursor": <cursor or None>}`.
+
+        Raises:
+            ValueError: For an unknown filter or a malformed cursor.
+        """
+        filters = {column: value for column, value in (filters or {}).items() if value is not None}
+        unknown = set(filters) - set(_FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        before = decode_cursor(cursor) if cursor else None
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if self.disk is None:
+            summaries = [_summary(record) for record in sorted(self.memory.records(), key=lambda record: (record.created_at, record.id), reverse=True)
+                       if all(getattr(record, column) == value for column, value in filters.items())
+                       and (since is None or record.created_at >= since) and (until is None or record.created_at < until)
+                       and (before is None or (record.created_at, record.id) < before)][:limit + 1]
+        else:
+            # Make queued records visible to the query
+            await self.flush()
+            try:
+                summaries = await asyncio.to_thread(self.disk.list, filters, since, until, before, limit + 1)
+            except (sqlite3.Error, ValueError) as e:
+                logging.warning(f"Analysis store read failed: {e}")
+                summaries = []
+        page = summaries[:limit]
+        return {"items": page, "next_cursor": encode_cursor(page[-1]) if len(summaries) > limit else None}
+
@@ -0,0 +1,245 @@
+"""
+Compaction of the `webAuditResults` payload before it is embedded in the prompt.
+
+Raw tool outputs are dominated by data the analysis never uses: axe-core `passes`/`inapplicable`
+lists, Lighthouse screenshots, traces and passing audits, Nu validator `info` messages. `compact_audits`
+keeps only what a reviewer would act on:
+
+    axeCoreResult       Violations (id, impact, help, affected selectors), most severe first.
+    pageSpeedResult     Category scores and failed audits (score below `AUDIT_PASS_SCORE`), lowest
+                        score first, with the selectors/URLs of their top offending items.
+    nuValidatorResult   Errors and warnings, grouped by message with their occurrence count.
+    responsivenessResult  Passed through as-is (already small).
+
+Each category is capped at `AUDIT_MAX_ITEMS` entries and each entry at `AUDIT_MAX_NODES` distinct
+selectors. Values that do not look like the tool's output are passed through unchanged, so custom
+audit formats keep working. The prompt embeds the result as compact JSON.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+
+AUDIT_COMPACTION = os.getenv("AUDIT_COMPACTION", "true").lower() == "true"
+AUDIT_MAX_ITEMS = int(os.getenv("AUDIT_MAX_ITEMS", "20"))
+AUDIT_MAX_NODES = int(os.getenv("AUDIT_MAX_NODES", "5"))
+# Lighthouse audits scoring at least this are considered passed
+AUDIT_PASS_SCORE = float(os.getenv("AUDIT_PASS_SCORE", "0.9"))
+
+_IMPACT_ORDER = {"critical": 0, "serious": 1, "moderate": 2, "minor": 3}
+# Audits that never carry a pass/fail verdict
+_UNSCORED_MODES = {"notApplicable", "informative", "manual", "error"}
+
+
+def dump_compact(value) -> str:
+    """
+    Serializes a JSON value without insignificant whitespace.
+    """
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _distinct(values, limit: int) -> list:
+    seen = list(dict.fromkeys(value for value in values if value))
+    return seen[:limit]
+
+
+def _selector(target) -> str | None:
+    # axe targets are lists of selectors (one per shadow DOM / iframe level)
+    if isinstance(target, list):
+        return " >> ".join(str(part) for part in target) or None
+    return str(target) if target else None
+
+
+def compact_axe(result, max_items: int = AUDIT_MAX_ITEMS, max_nodes: int = AUDIT_MAX_NODES):
+    """
+    Keeps only axe-core violations, most severe first.
+
+    Args:
+        result: The axe-core results object (`{"violations": [...], "passes": [...], ...}`).
+        max_items (int, optional): Maximum number of violations kept.
+        max_nodes (int, optional): Maximum number of selectors kept per violation.
+
+    Returns:
+        The compacted result, or `result` unchanged if it is not an axe-core results object.
+    """
+    if not isinstance(result, dict) or not isinstance(result.get("violations"), list):
+        return result
+    ranked = []
+    for violation in result["violations"]:
+        if not isinstance(violation, dict):
+            # Not axe-core's shape: keep it verbatim, after the known violations
+            ranked.append(((len(_IMPACT_ORDER) + 1, 0), violation))
+            continue
+        nodes = [node for node in violation.get("nodes") or [] if isinstance(node, dict)]
+        ranked.append(((_IMPACT_ORDER.get(violation.get("impact"), len(_IMPACT_ORDER)), -len(nodes)), {
+            "id": violation.get("id"),
+            "impact": violation.get("impact"),
+            "help": violation.get("help") or violation.get("description"),
+            "occurrences": len(nodes),
+            "targets": _distinct((_selector(node.get("target")) for node in nodes), max_nodes),
+            "failureSummary": next((node["failureSummary"] for node in nodes if node.get("failureSummary")), None),
+        }))
+    ranked.sort(key=lambda entry: entry[0])
+    violations = [violation for _, violation in ranked]
+    compacted = {"violations": violations[:max_items]}
+    if len(violations) > max_items:
+        compacted["omittedViolations"] = len(violations) - max_items
+    return compacted
+
+
+def _lighthouse_item_targets(details, max_nodes: int) -> list:
+    if not isinstance(details, dict):
+        return []
+    targets = []
+    for item in details.get("items") or []:
+        if not isinstance(item, dict):
+            continue
+        node = item.get("node")
+        if isinstance(node, dict) and node.get("selector"):
+            targets.append(node["selector"])
+        elif isinstance(item.get("url"), str) and not item["url"].startswith("data:"):
+            targets.append(item["url"])
+    return _distinct(targets, max_nodes)
+
+
+def compact_lighthouse(result, max_items: int = AUDIT_MAX_ITEMS, max_nodes: int = AUDIT_MAX_NODES, pass_score: float = AUDIT_PASS_SCORE):
+    """
+    Keeps category scores and failed audits of a PageSpeed Insights / Lighthouse result.
+
+    Args:
+        result: A PageSpeed Insights response (`{"lighthouseResult": {...}}`) or a Lighthouse report.
+        max_items (int, optional): Maximum number of failed audits kept.
+        max_nodes (int, optional): Maximum number of selectors/URLs kept per audit.
+        pass_score (float, optional): Audits scoring at least this are dropped.
+
+    Returns:
+        The compacted result, or `result` unchanged if it is not a Lighthouse report.
+    """
+    if not isinstance(result, dict):
+        return result
+    report = result.get("lighthouseResult") if isinstance(result.get("lighthouseResult"), dict) else result
+    audits = report.get("audits")
+    if not isinstance(audits, dict):
+        return result
+    failed = []
+    for audit_id, audit in audits.items():
+        if not isinstance(audit, dict) or audit.get("scoreDisplayMode") in _UNSCORED_MODES:
+            continue
+        score = audit.get("score")
+        if not isinstance(score, (int, float)) or score >= pass_score:
+            continue
+        failed.append({
+            "id": audit.get("id", audit_id),
+            "title": audit.get("title"),
+            "score": score,
+            "displayValue": audit.get("displayValue"),
+            "targets": _lighthouse_item_targets(audit.get("details"), max_nodes),
+        })
+    failed.sort(key=lambda audit: audit["score"])
+    categories = report.get("categories") if isinstance(report.get("categories"), dict) else {}
+    compacted = {
+        "scores": {key: category.get("score") for key, category in categories.items() if isinstance(category, dict)},
+        "failedAudits": failed[:max_items],
+    }
+    if len(failed) > max_items:
+        compacted["omittedAudits"] = len(failed) - max_items
+    return compacted
+
+
+def compact_nu(result, max_items: int = AUDIT_MAX_ITEMS, max_nodes: int = AUDIT_MAX_NODES):
+    """
+    Keeps Nu HTML Checker errors and warnings, grouped by message, errors first.
+
+    Args:
+        result: The checker's JSON output (`{"messages": [...]}`).
+        max_items (int, optional): Maximum number of distinct messages kept.
+        max_nodes (int, optional): Maximum number of source extracts kept per message.
+
+    Returns:
+        The compacted result, or `result` unchanged if it is not Nu checker output.
+    """
+    if not isinstance(result, dict) or not isinstance(result.get("messages"), list):
+        return result
+    grouped: dict[tuple, dict] = {}
+    for message in result["messages"]:
+        if not isinstance(message, dict):
+            continue
+        if message.get("type") == "error" or message.get("subType") == "fatal":
+            severity = "error"
+        elif message.get("subType") == "warning":
+            severity = "warning"
+        else:
+            continue
+        key = (severity, message.get("message"))
+        entry = grouped.setdefault(key, {"type": severity, "message": message.get("message"), "occurrences": 0, "lines": [], "extracts": []})
+        entry["occurrences"] += 1
+        entry["lines"].append(message.get("lastLine"))
+        entry["extracts"].append((message.get("extract") or "").strip())
+    messages = sorted(grouped.values(), key=lambda m: (m["type"] != "error", -m["occurrences"]))
+    for entry in messages:
+        entry["lines"] = _distinct(entry["lines"], max_nodes)
+        entry["extracts"] = _distinct(entry["extracts"], max_nodes)
+    compacted = {"messages": messages[:max_items]}
+    if len(messages) > max_items:
+        compacted["omittedMessages"] = len(messages) - max_items
+    return compacted
+
+
+_COMPACTORS = {
+    "axeCoreResult": compact_axe,
+    "pageSpeedResult": compact_lighthouse,
+    "nuValidatorResult": compact_nu,
+}
+
+
+@dataclass
+class AuditCompaction:
+    """
+    Output of `compact_audits`.
+
+    Attributes:
+        audits: The compacted audit results, keyed like `webAuditResults`.
+        original_chars: Length of the audits serialized as compact JSON before compaction.
+        compacted_chars: Length of the compacted audits serialized as compact JSON.
+    """
+    audits: dict = field(default_factory=dict)
+    original_chars: int = 0
+    compacted_chars: int = 0
+
+    @property
+    def chars_saved(self) -> int:
+        return self.original_chars - self.compacted_chars
+
+
+def compact_audits(evaluations: dict | None, enabled: bool = AUDIT_COMPACTION, max_items: int = AUDIT_MAX_ITEMS, max_nodes: int = AUDIT_MAX_NODES) -> AuditCompaction:
+    """
+    Compacts every known audit in a parsed `webAuditResults` object.
+
+    Args:
+        evaluations (dict | None): The parsed `webAuditResults`.
+        enabled (bool, optional): When False, the audits are returned unchanged (still measured).
+        max_items (int, optional): Maximum number of entries per audit category.
+        max_nodes (int, optional): Maximum number of selectors per entry.
+
+    Returns:
+        AuditCompaction: The compacted audits and their size before and after.
+    """
+    if not evaluations:
+        return AuditCompaction()
+    compacted = dict(evaluations)
+    if enabled:
+        for key, compactor in _COMPACTORS.items():
+            if compacted.get(key) is not None:
+                compacted[key] = compactor(compacted[key], max_items=max_items, max_nodes=max_nodes)
+    return AuditCompaction(
+        audits=compacted,
+        original_chars=len(dump_compact(evaluations)),
+        compacted_chars=len(dump_compact(compacted)),
+    )
+
+
+def compaction_fingerprint(enabled: bool = AUDIT_COMPACTION) -> str:
+    """
+    Identifies the compaction settings, so cached results from different settings are not reused.
+    """
+    return f"audit={AUDIT_MAX_ITEMS}:{AUDIT_MAX_NODES}:{AUDIT_PASS_SCORE}" if enabled else "audit=off"
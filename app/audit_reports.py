@@ -0,0 +1,177 @@
+"""
+Local rendering of the "Non-LLM Evaluations" section.
+
+The section restates the tool results sent in `webAuditResults`. With `NON_LLM_EVALUATIONS=local` it is
+built here from the parsed audits instead of being written by the model: summaries come from fixed
+templates and key findings are mapped from the violations / failed audits / validator messages kept
+by `app.audit_compaction`. The model then only generates the remaining sections (see
+`LLMAnalysisResponse`), which removes a large share of the output tokens.
+
+Audits in a shape these renderers do not recognize make `render_non_llm_evaluations` raise
+`UnrecognizedAudit`, and the request falls back to having the model write the section.
+"""
+
+import os
+import re
+
+from .audit_compaction import compact_axe, compact_lighthouse, compact_nu, dump_compact
+from .models import AccessibilityReport, PerformanceReport, ValidationReport, LayoutReport, KeyFinding, NonLLMEvaluations
+
+# "model": the LLM writes the section (default). "local": rendered from the audits by this module.
+NON_LLM_EVALUATIONS = os.getenv("NON_LLM_EVALUATIONS", "model").lower()
+
+_MARKDOWN_LINK_PATTERN = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_LEARN_MORE_PATTERN = re.compile(r"\s*Learn (more|how)[^.]*\.?\s*$", re.IGNORECASE)
+_IMPACTS = ("critical", "serious", "moderate", "minor")
+
+
+class UnrecognizedAudit(ValueError):
+    """
+    Raised by a renderer when an audit is not in the tool's output format.
+    """
+
+
+def _plural(count: int, word: str) -> str:
+    return f"{count} {word}{'' if count == 1 else 's'}"
+
+
+def _lighthouse_description(result: dict, audit_id: str) -> str | None:
+    report = result.get("lighthouseResult", result)
+    description = ((report.get("audits") or {}).get(audit_id) or {}).get("description")
+    if not description:
+        return None
+    return _LEARN_MORE_PATTERN.sub("", _MARKDOWN_LINK_PATTERN.sub(r"\1", description)).strip() or None
+
+
+def render_accessibility(result) -> AccessibilityReport:
+    """
+    Builds the Accessibility Report from an axe-core result.
+
+    Raises:
+        UnrecognizedAudit: If `result` is not an axe-core results object.
+    """
+    compacted = compact_axe(result)
+    if compacted is result or not all(isinstance(v, dict) for v in compacted["violations"]):
+        raise UnrecognizedAudit("axeCoreResult")
+    violations = compacted["violations"]
+    total = len(violations) + compacted.get("omittedViolations", 0)
+    if not total:
+        return AccessibilityReport.model_validate({"Summary": "axe-core found no accessibility violations.", "Key Findings": []})
+    counts = [f"{sum(v['impact'] == impact for v in violations)} {impact}" for impact in _IMPACTS if any(v["impact"] == impact for v in violations)]
+    elements = sum(v["occurrences"] for v in violations)
+    summary = f"axe-core found {_plural(total, 'accessibility violation')}"
+    summary += f" ({', '.join(counts)})" if counts else ""
+    summary += f" affecting {_plural(elements, 'element')}."
+    findings = []
+    for v in violations:
+        issue = f"{v['help'] or v['id']} [{v['id']}, {v['impact'] or 'unknown impact'}]: {_plural(v['occurrences'], 'element')}"
+        if v["targets"]:
+            issue += f", e.g. {', '.join(v['targets'])}"
+        fix = v["failureSummary"] or f"Resolve the {v['id']} violation on the affected elements."
+        findings.append(KeyFinding.model_validate({"Issue": issue, "Recommended Fix": fix}))
+    return AccessibilityReport.model_validate({"Summary": summary, "Key Findings": findings})
+
+
+def render_performance(result) -> PerformanceReport:
+    """
+    Builds the Performance Report from a PageSpeed Insights / Lighthouse result.
+
+    Raises:
+        UnrecognizedAudit: If `result` is not a Lighthouse report.
+    """
+    compacted = compact_lighthouse(result)
+    if compacted is result:
+        raise UnrecognizedAudit("pageSpeedResult")
+    failed = compacted["failedAudits"]
+    total = len(failed) + compacted.get("omittedAudits", 0)
+    scores = [f"{key} {round(score * 100)}/100" for key, score in compacted["scores"].items() if isinstance(score, (int, float))]
+    summary = f"Lighthouse scores: {', '.join(scores)}. " if scores else ""
+    summary += f"{_plural(total, 'audit')} failed." if total else "All scored audits passed."
+    findings = []
+    for audit in failed:
+        issue = audit["title"] or audit["id"]
+        if audit["displayValue"]:
+            issue += f": {audit['displayValue']}"
+        issue += f" (score {audit['score']:.2f})"
+        if audit["targets"]:
+            issue += f", e.g. {', '.join(audit['targets'])}"
+        fix = _lighthouse_description(result, audit["id"]) or f"Improve the {audit['id']} audit."
+        findings.append(KeyFinding.model_validate({"Issue": issue, "Recommended Fix": fix}))
+    return PerformanceReport.model_validate({"Summary": summary, "Key Findings": findings})
+
+
+def render_validation(result) -> ValidationReport:
+    """
+    Builds the Validation Report from Nu HTML Checker output.
+
+    Raises:
+        UnrecognizedAudit: If `result` is not Nu checker output.
+    """
+    compacted = compact_nu(result)
+    if compacted is result:
+        raise UnrecognizedAudit("nuValidatorResult")
+    messages = compacted["messages"]
+    errors = sum(m["occurrences"] for m in messages if m["type"] == "error")
+    warnings = sum(m["occurrences"] for m in messages if m["type"] == "warning")
+    if not messages:
+        return ValidationReport.model_validate({"Summary": "The Nu HTML Checker reported no errors or warnings.", "Key Findings": []})
+    summary = f"The Nu HTML Checker reported {_plural(errors, 'error')} and {_plural(warnings, 'warning')}"
+    distinct = len(messages) + compacted.get("omittedMessages", 0)
+    summary += f" ({_plural(distinct, 'distinct message')})."
+    findings = []
+    for m in messages:
+        issue = f"{m['type'].capitalize()}: {m['message']}"
+        if m["occurrences"] > 1:
+            issue += f" ({m['occurrences']} occurrences)"
+        lines = ", ".join(str(line) for line in m["lines"])
+        fix = f"Correct the markup at line {lines}" if lines else "Correct the markup"
+        fix += f": {m['extracts'][0]}" if m["extracts"] else "."
+        findings.append(KeyFinding.model_validate({"Issue": issue, "Recommended Fix": fix}))
+    return ValidationReport.model_validate({"Summary": summary, "Key Findings": findings})
+
+
+def render_layout(result) -> LayoutReport:
+    """
+    Builds the Layout Report from the responsiveness (overflow) check.
+    """
+    overflow = result.get("overflow", result.get("hasOverflow")) if isinstance(result, dict) else result
+    if overflow is False or overflow in ({}, []):
+        return LayoutReport.model_validate({"Summary": "No horizontal overflow was detected at desktop width.", "Recommended Fix": None})
+    if overflow is True:
+        return LayoutReport.model_validate({
+            "Summary": "Horizontal overflow was detected at desktop width.",
+            "Recommended Fix": "Constrain the width of the overflowing elements (max-width: 100%, flexible units) so the page fits the viewport.",
+        })
+    return LayoutReport.model_validate({
+        "Summary": f"Responsiveness check result: {dump_compact(result)[:500]}",
+        "Recommended Fix": "Review the reported elements and make them fit the viewport width.",
+    })
+
+
+def render_non_llm_evaluations(evaluations: dict | None) -> NonLLMEvaluations | None:
+    """
+    Builds the "Non-LLM Evaluations" section from the parsed `webAuditResults`.
+
+    Args:
+        evaluations (dict | None): The parsed, uncompacted `webAuditResults`.
+
+    Returns:
+        NonLLMEvaluations | None: The section (reports for missing audits are None), or None if no audits
+        were given.
+
+    Raises:
+        UnrecognizedAudit: If an audit is not in its tool's output format; the caller should let the
+            model write the section instead.
+    """
+    if not evaluations:
+        return None
+    renderers = {
+        "Accessibility Report": ("axeCoreResult", render_accessibility),
+        "Performance Report": ("pageSpeedResult", render_performance),
+        "Validation Report": ("nuValidatorResult", render_validation),
+        "Layout Report": ("responsivenessResult", render_layout),
+    }
+    return NonLLMEvaluations.model_validate({
+        alias: renderer(evaluations[key]) if evaluations.get(key) is not None else None
+        for alias, (key, renderer) in renderers.items()
+    })
@@ -0,0 +1,292 @@
+"""
+Batch analysis of many pages in one request (`/webpage-analysis/batch`).
+
+Pages share the request's specification and design file; the design is prepared (inlined or uploaded)
+once for the whole batch. Two modes:
+
+- Online: pages run through the regular analysis pipeline with at most `BATCH_CONCURRENCY` pages in
+  flight. Results are returned together, or streamed as NDJSON lines in completion order.
+- Offline: one generation request per page is submitted to the provider's batch-prediction API
+  (cheaper, completes within hours). `OfflineBatches` remembers what is needed to turn the raw outputs
+  into validated responses when the job is collected.
+
+Every page yields one result entry: `{"index", "id", "status": "ok", "result", ...}` or
+`{"index", "id", "status": "error", "status_code", "detail"}`.
+
+`LocalBatches` is an in-memory stand-in for the SDK's `client.batches` surface, for tests and offline runs.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+
+try:
+    from google.genai import types
+except ImportError:
+    types = None
+
+BATCH_MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", "500"))
+# Maximum combined characters of the pages and specification fields of one batch request
+BATCH_MAX_INPUT_CHARS = int(os.getenv("BATCH_MAX_INPUT_CHARS", str(32 * 1024 * 1024)))
+# Maximum number of pages of one online batch analyzed at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# How long the results of a collected offline batch stay available
+OFFLINE_BATCH_TTL_SECONDS = float(os.getenv("OFFLINE_BATCH_TTL_SECONDS", "86400"))
+
+# Provider job states after which no more progress is made
+TERMINAL_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+SUCCEEDED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+
+
+def parse_batch_pages(pages: str, max_pages: int = BATCH_MAX_PAGES) -> list[dict]:
+    """
+    Parses the `pages` form field.
+
+    Args:
+        pages (str): A JSON array of page objects with `htmlText` and optional `id`, `specification` and
+            `webAuditResults` (a JSON string or object).
+        max_pages (int, optional): Maximum number of pages per batch.
+
+    Returns:
+        list[dict]: The pages, with `webAuditResults` normalized to a JSON string.
+
+    Raises:
+        ValueError: If `pages` is not a non-empty JSON array of objects, has too many entries, or has a page
+            without a string `htmlText` or with a `specification` that is not a string.
+    """
+    try:
+        parsed = json.loads(pages)
+    except json.JSONDecodeError:
+        raise ValueError("pages must be a JSON array")
+    if not isinstance(parsed, list) or not parsed or not all(isinstance(page, dict) for page in parsed):
+        raise ValueError("pages must be a non-empty JSON array of objects")
+    if len(parsed) > max_pages:
+        raise ValueError(f"A batch can contain at most {max_pages} pages")
+    normalized = []
+    for index, page in enumerate(parsed):
+        if not isinstance(page.get("htmlText"), str):
+            raise ValueError(f"Page {page_id(page, index)}: htmlText must be a string")
+        if page.get("specification") is not None and not isinstance(page["specification"], str):
+            raise ValueError(f"Page {page_id(page, index)}: specification must be a string")
+        audits = page.get("webAuditResults")
+        if audits is not None and not isinstance(audits, str):
+            audits = json.dumps(audits)
+        normalized.append({**page, "webAuditResults": audits or ""})
+    return normalized
+
+
+def page_id(page: dict, index: int) -> str:
+    """
+    Returns the caller's id of a page, or its position if none was given.
+    """
+    return str(page.get("id", index))
+
+
+def error_entry(index: int, page: dict, error: Exception) -> dict:
+    """
+    Builds the result entry of a failed page. HTTP errors keep their status code.
+    """
+    return {
+        "index": index,
+        "id": page_id(page, index),
+        "status": "error",
+        "status_code": getattr(error, "status_code", 500),
+        "detail": getattr(error, "detail", None) or str(error) or "Error with server",
+    }
+
+
+async def run_batch(pages: list[dict], analyse_page: Callable[[int, dict], Awaitable[dict]], concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[dict]:
+    """
+    Analyzes pages concurrently with bounded fan-out and yields their result entries as they complete.
+
+    Args:
+        pages (list[dict]): Pages from `parse_batch_pages`.
+        analyse_page (Callable[[int, dict], Awaitable[dict]]): Analyzes one page, given its index, and
+            returns its "ok" result entry. Raised errors become "error" entries.
+        concurrency (int, optional): Maximum number of pages analyzed at the same time.
+
+    Yields:
+        dict: One result entry per page, in completion order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(index: int, page: dict) -> dict:
+        async with semaphore:
+            try:
+                return await analyse_page(index, page)
+            except Exception as e:
+                logging.error(f"Batch page {page_id(page, index)} failed: {e}")
+                return error_entry(index, page, e)
+
+    tasks = [asyncio.create_task(bounded(index, page)) for index, page in enumerate(pages)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client went away mid-stream
+        for task in tasks:
+            task.cancel()
+
+
+def ndjson_line(entry: dict) -> str:
+    """
+    Encodes one result entry as an NDJSON line.
+    """
+    return json.dumps(entry) + "\n"
+
+
+@dataclass
+class OfflinePage:
+    """
+    What is needed to finish one page of an offline batch once its raw output is available.
+
+    Attributes:
+        index: Position of the page in the batch.
+        id: The caller's page id.
+        request_key: Result cache key of the page.
+        finish: Turns the raw JSON output into the validated response dict (restores elided HTML,
+            adds locally rendered sections, stores the result in the cache).
+    """
+    index: int
+    id: str
+    request_key: str
+    finish: Callable[[str], Awaitable[dict]]
+
+
+@dataclass
+class OfflineBatch:
+    """
+    A submitted offline batch.
+
+    Attributes:
+        pages: Pages submitted to the provider, in request order.
+        results: Result entries by page index: known at submission (cache hits, invalid pages) or collected.
+        uploads: Names of the design images uploaded for this batch, deleted once the job is collected.
+        state: The provider job's final state, once collected.
+        collected: Whether the provider's results have been processed.
+        expires_at: When the registry forgets the batch, once collected.
+    """
+    pages: list[OfflinePage] = field(default_factory=list)
+    results: dict[int, dict] = field(default_factory=dict)
+    uploads: list[str] = field(default_factory=list)
+    state: str | None = None
+    collected: bool = False
+    expires_at: float | None = None
+
+    def ordered_results(self) -> list[dict]:
+        return [self.results[index] for index in sorted(self.results)]
+
+
+class OfflineBatches:
+    """
+    Registry of submitted offline batches by provider job name (in memory, per worker).
+
+    Collected batches are kept for `ttl_seconds`, so clients can fetch their results again, then forgotten.
+
+    Attributes:
+        ttl_seconds: How long a collected batch is kept.
+    """
+
+    def __init__(self, ttl_seconds: float = OFFLINE_BATCH_TTL_SECONDS, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._batches: dict[str, OfflineBatch] = {}
+
+    def add(self, name: str, batch: OfflineBatch) -> None:
+        self._evict()
+        self._batches[name] = batch
+
+    def get(self, name: str) -> OfflineBatch | None:
+        self._evict()
+        return self._batches.get(name)
+
+    def collected(self, batch: OfflineBatch) -> None:
+        """
+        Starts the retention period of a batch whose results were collected.
+        """
+        batch.expires_at = self._clock() + self.ttl_seconds
+
+    def _evict(self) -> None:
+        now = self._clock()
+        for name in [name for name, batch in self._batches.items() if batch.expires_at is not None and batch.expires_at <= now]:
+            del self._batches[name]
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+
+async def collect_offline_batch(batch: OfflineBatch, job) -> None:
+    """
+    Processes a finished provider job into the batch's result entries.
+
+    Args:
+        batch (OfflineBatch): The registered batch.
+        job: The provider's `BatchJob` in a terminal state.
+    """
+    state = getattr(job.state, "value", job.state)
+    responses = list(job.dest.inlined_responses or []) if state in SUCCEEDED_STATES and job.dest else []
+    for position, page in enumerate(batch.pages):
+        entry = {"index": page.index, "id": page.id}
+        inlined = responses[position] if position < len(responses) else None
+        try:
+            if inlined is None or inlined.error is not None or inlined.response is None:
+                detail = inlined.error.message if inlined is not None and inlined.error is not None else f"Batch job ended in {state}"
+                batch.results[page.index] = {**entry, "status": "error", "status_code": 502, "detail": detail}
+                continue
+            batch.results[page.index] = {**entry, "status": "ok", "result": await page.finish(inlined.response.text)}
+        except Exception as e:
+            logging.error(f"Offline batch page {page.id} failed: {e}")
+            batch.results[page.index] = {**entry, "status": "error", "status_code": 500, "detail": str(e) or "Error with server"}
+    batch.state = state
+    batch.collected = True
+
+
+class LocalBatches:
+    """
+    In-memory stand-in for `client.batches` (create/get/delete) with inlined requests.
+
+    Requests are run through the given `models` surface (e.g. a mocked `client.models`) the first time
+    the job is fetched, so a job is "pending" right after creation and "succeeded" afterwards.
+    """
+
+    def __init__(self, models):
+        self._models = models
+        self._ids = itertools.count(1)
+        self.jobs: dict[str, dict] = {}
+
+    def _job(self, name: str):
+        job = self.jobs[name]
+        dest = types.BatchJobDestination(inlined_responses=job["responses"]) if job["responses"] is not None else None
+        return types.BatchJob(name=name, display_name=job["display_name"], model=job["model"], state=job["state"], dest=dest)
+
+    async def create(self, *, model: str, src: list, config: dict | None = None):
+        name = f"batches/local-{next(self._ids)}"
+        self.jobs[name] = {
+            "model": model, "requests": list(src), "responses": None,
+            "display_name": (config or {}).get("display_name"), "state": "JOB_STATE_PENDING",
+        }
+        return self._job(name)
+
+    async def get(self, *, name: str):
+        if name not in self.jobs:
+            raise LookupError(f"{name} not found")
+        job = self.jobs[name]
+        if job["responses"] is None:
+            job["responses"] = []
+            for request in job["requests"]:
+                try:
+                    generated = await self._models.generate_content(model=job["model"], contents=request["contents"], config=request.get("config"))
+                    content = types.Content(role="model", parts=[types.Part(text=generated.text)])
+                    job["responses"].append(types.InlinedResponse(response=types.GenerateContentResponse(candidates=[types.Candidate(content=content)])))
+                except Exception as e:
+                    job["responses"].append(types.InlinedResponse(error=types.JobError(code=500, message=str(e))))
+            job["state"] = "JOB_STATE_SUCCEEDED"
+        return self._job(name)
+
+    async def delete(self, *, name: str):
+        self.jobs.pop(name, None)
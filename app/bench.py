@@ -0,0 +1,395 @@
+"""
+Load-test and benchmark harness: `python -m app.bench [options]`.
+
+Starts the fake Gemini server (`app.fake_gemini`) and the service (uvicorn, pointed at the fake through
+`GOOGLE_GEMINI_BASE_URL`), then drives `/webpage-analysis` with every scenario at every concurrency
+level and reports, per run:
+
+    rps             Completed requests per second.
+    latency_ms      p50 / p95 / p99 / mean / max of the client-side request latency.
+    event_loop_lag_ms  Mean and approximate p99 of the service's event-loop lag (from `/metrics`).
+    rss_bytes       Resident memory of the service before and after the run (from `/metrics`).
+    statuses        Response status counts.
+
+Scenarios (`SCENARIOS`) combine realistic payloads: a large page, full (uncompacted) audit results and a
+design image. Results are written as JSON (`--output`) so runs can be compared: `--compare <previous.json>`
+prints the change of throughput and tail latency per scenario and concurrency.
+
+The result cache is bypassed, the prompt prefix cache and job workers are disabled, so every request
+reaches the (fake) model. Use `--service-url` to benchmark an already running service instead; any
+`--env NAME=VALUE` is passed to the started service (e.g. `--env ANALYSIS_FANOUT=true`).
+
+Example:
+    python -m app.bench --scenarios small,large-html --concurrency 1,8,32 --requests 200 --latency-ms 800 \\
+        --output bench-results/baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+
+import httpx
+
+from .fake_gemini import FakeGeminiConfig
+
+
+@dataclass
+class Scenario:
+    """
+    One request shape.
+
+    Attributes:
+        name: Label in the results.
+        html_chars: Approximate size of the page.
+        audits: Whether full audit results are sent.
+        design: Size (width, height) of the design image, or None.
+        specification_chars: Approximate size of the specification.
+    """
+    name: str
+    html_chars: int = 20_000
+    audits: bool = False
+    design: tuple[int, int] | None = None
+    specification_chars: int = 500
+
+
+SCENARIOS = {
+    "small": Scenario("small"),
+    "large-html": Scenario("large-html", html_chars=1_500_000),
+    "full-audits": Scenario("full-audits", audits=True),
+    "design": Scenario("design", design=(1440, 4000)),
+    "everything": Scenario("everything", html_chars=500_000, audits=True, design=(1440, 4000), specification_chars=5_000),
+}
+
+
+def synthetic_page(chars: int, seed: int = 0) -> str:
+    """
+    Returns a page of about `chars` characters with the bulk real pages carry: sections of markup,
+    inline scripts, a data URI and inline SVG.
+    """
+    rng = random.Random(seed)
+    head = "<head><title>Bench page</title><style>" + ".c{color:#333;margin:0 auto}" * 50 + "</style></head>"
+    sections = []
+    size = len(head)
+    index = 0
+    while size < chars:
+        words = " ".join(rng.choice(["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing"]) for _ in range(120))
+        section = (f"<section id=\"s{index}\" class=\"c\"><h2>Section {index}</h2><p>{words}</p>"
+                   f"<img src=\"data:image/png;base64,{'A' * 400}\">"
+                   f"<svg viewBox=\"0 0 10 10\"><path d=\"{'M0 0 L10 10 ' * 40}\"/></svg>"
+                   f"<script>window.track && track({index}, {json.dumps(words[:200])});</script>"
+                   f"<button class=\"btn\">Action {index}</button></section>")
+        sections.append(section)
+        size += len(section)
+        index += 1
+    return f"<!DOCTYPE html><html>{head}<body>{''.join(sections)}</body></html>"
+
+
+def synthetic_audits(violations: int = 40, passes: int = 60) -> dict:
+    """
+    Returns `webAuditResults` shaped like raw axe-core, Lighthouse and Nu validator output.
+    """
+    def node(index: int) -> dict:
+        return {"html": f"<img src='{index}.png'>", "target": [f"#s{index} img"], "failureSummary": "Fix any of the following", "any": [], "all": [], "none": []}
+
+    axe = {
+        "testEngine": {"name": "axe-core", "version": "4.8.0"},
+        "passes": [{"id": f"pass-{i}", "nodes": [node(j) for j in range(20)]} for i in range(passes)],
+        "violations": [{"id": f"rule-{i}", "impact": ["critical", "serious", "moderate", "minor"][i % 4], "help": f"Rule {i} help",
+                        "nodes": [node(j) for j in range(15)]} for i in range(violations)],
+    }
+    audits = {f"audit-{i}": {"id": f"audit-{i}", "title": f"Audit {i}", "score": (i % 10) / 10, "scoreDisplayMode": "numeric",
+                             "details": {"items": [{"node": {"selector": f"#s{j} img"}, "url": f"https://example.com/{j}.png"} for j in range(10)]}}
+              for i in range(80)}
+    audits["final-screenshot"] = {"id": "final-screenshot", "score": None, "scoreDisplayMode": "informative",
+                                  "details": {"data": "data:image/jpeg;base64," + "A" * 60_000}}
+    lighthouse = {"lighthouseResult": {"categories": {"performance": {"score": 0.42}}, "audits": audits}}
+    nu = {"messages": [{"type": ["error", "info"][i % 2], "message": f"Message {i % 25}", "lastLine": i, "extract": "<div>"} for i in range(300)]}
+    return {"axeCoreResult": axe, "pageSpeedResult": lighthouse, "nuValidatorResult": nu, "responsivenessResult": {"overflow": False}}
+
+
+def synthetic_png(width: int, height: int, seed: int = 0) -> bytes:
+    """
+    Encodes a valid RGB PNG of the given size: flat bands with noisy rows, so it compresses like a
+    screenshot rather than to nothing.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for y in range(height):
+        if y % 40 < 4:
+            row = bytes(rng.getrandbits(8) for _ in range(width * 3))
+        else:
+            shade = (y // 40 * 37) % 256
+            row = bytes((shade, 255 - shade, 128)) * width
+        rows.append(b"\x00" + row)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b"")
+
+
+def build_request(scenario: Scenario) -> tuple[dict, dict | None]:
+    """
+    Returns the form fields and files of a scenario's request.
+    """
+    data = {"htmlText": synthetic_page(scenario.html_chars), "specification": ("The page must follow the design system. " * 200)[:scenario.specification_chars],
+            "bypassCache": "true"}
+    if scenario.audits:
+        data["webAuditResults"] = json.dumps(synthetic_audits())
+    files = None
+    if scenario.design:
+        files = {"designFile": ("design.png", synthetic_png(*scenario.design), "image/png")}
+    return data, files
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """
+    Returns the q-th percentile (0-100) of `values` by linear interpolation, or None if empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """
+    Parses the Prometheus text format into `{"name{labels}": value}`.
+    """
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            samples[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def lag_summary(before: dict[str, float], after: dict[str, float]) -> dict:
+    """
+    Summarizes the event-loop lag observed between two `/metrics` scrapes.
+
+    Returns:
+        dict: `{"mean_ms", "p99_ms"}`; p99 is the upper bound of the bucket holding it. None without samples.
+    """
+    def delta(key: str) -> float:
+        return after.get(key, 0.0) - before.get(key, 0.0)
+
+    count = delta("event_loop_lag_seconds_count")
+    if count <= 0:
+        return {"mean_ms": None, "p99_ms": None}
+    bounds = sorted((float(re.search(r'le="([^"]+)"', key).group(1)), key) for key in after if key.startswith("event_loop_lag_seconds_bucket"))
+    p99 = next((bound for bound, key in bounds if delta(key) >= 0.99 * count), None)
+    return {"mean_ms": delta("event_loop_lag_seconds_sum") / count * 1000, "p99_ms": p99 * 1000 if p99 is not None else None}
+
+
+async def scrape(client: httpx.AsyncClient) -> dict[str, float]:
+    try:
+        response = await client.get("/metrics")
+        return parse_metrics(response.text) if response.status_code == 200 else {}
+    except httpx.HTTPError:
+        return {}
+
+
+async def run_load(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, requests: int, path: str = "/webpage-analysis", timeout: float = 300) -> dict:
+    """
+    Sends `requests` requests of a scenario with `concurrency` closed-loop workers.
+
+    Returns:
+        dict: The run's results (see the module docstring).
+    """
+    data, files = build_request(scenario)
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    remaining = iter(range(requests))
+    before = await scrape(client)
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, data=data, files=files, timeout=timeout)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    after = await scrape(client)
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "seconds": elapsed,
+        "rps": requests / elapsed if elapsed else None,
+        "statuses": dict(statuses),
+        "latency_ms": {
+            "p50": _ms(percentile(latencies, 50)), "p95": _ms(percentile(latencies, 95)), "p99": _ms(percentile(latencies, 99)),
+            "mean": _ms(sum(latencies) / len(latencies)) if latencies else None, "max": _ms(max(latencies, default=None)),
+        },
+        "event_loop_lag_ms": lag_summary(before, after),
+        "rss_bytes": {"before": before.get("process_resident_memory_bytes"), "after": after.get("process_resident_memory_bytes")},
+    }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def compare(previous: dict, current: dict) -> list[str]:
+    """
+    Describes the change of RPS and p95/p99 latency of every run present in both results.
+    """
+    runs = {(run["scenario"], run["concurrency"]): run for run in previous["results"]}
+    lines = []
+    for run in current["results"]:
+        old = runs.get((run["scenario"], run["concurrency"]))
+        if old is None:
+            continue
+        changes = []
+        for label, get in (("rps", lambda r: r["rps"]), ("p95", lambda r: r["latency_ms"]["p95"]), ("p99", lambda r: r["latency_ms"]["p99"])):
+            before, after = get(old), get(run)
+            if before and after is not None:
+                changes.append(f"{label} {before:.1f} -> {after:.1f} ({(after - before) / before:+.1%})")
+        lines.append(f"{run['scenario']} @ {run['concurrency']}: " + ", ".join(changes))
+    return lines
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout}s")
+                await asyncio.sleep(0.2)
+
+
+def start_fake(config: FakeGeminiConfig, port: int) -> subprocess.Popen:
+    options = [f"--{name.replace('_', '-')}={value}" for name, value in asdict(config).items()]
+    return subprocess.Popen([sys.executable, "-m", "app.fake_gemini", f"--port={port}", *options])
+
+
+def start_service(port: int, fake_url: str, workdir: str, extra_env: dict[str, str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "GOOGLE_GEMINI_BASE_URL": fake_url,
+        "GEMINI_API_KEY": os.getenv("BENCH_GEMINI_API_KEY", "bench"),
+        "MODEL": os.getenv("MODEL", "bench-model"),
+        "CONTEXT_CACHE_ENABLED": "false",
+        "JOB_WORKERS": "0",
+        "JOBS_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "ANALYSIS_STORE_PATH": os.path.join(workdir, "analyses.sqlite3"),
+        **extra_env,
+    }
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], env=env)
+
+
+async def benchmark(service_url: str, scenarios: list[Scenario], concurrency: list[int], requests: int, warmup: int) -> list[dict]:
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrency), max_keepalive_connections=max(concurrency))
+    async with httpx.AsyncClient(base_url=service_url, limits=limits) as client:
+        for scenario in scenarios:
+            if warmup:
+                await run_load(client, scenario, 1, warmup)
+            for level in concurrency:
+                result = await run_load(client, scenario, level, requests)
+                print(f"{scenario.name:>12} @ {level:>3}: {result['rps']:.1f} rps, p50 {result['latency_ms']['p50']} ms, "
+                      f"p99 {result['latency_ms']['p99']} ms, lag p99 {result['event_loop_lag_ms']['p99_ms']} ms, {result['statuses']}", flush=True)
+                results.append(result)
+    return results
+
+
+async def main(args: argparse.Namespace) -> dict:
+    scenarios = [SCENARIOS[name] for name in args.scenarios.split(",")]
+    concurrency = [int(level) for level in args.concurrency.split(",")]
+    config = FakeGeminiConfig(**{name: getattr(args, name) for name in asdict(FakeGeminiConfig())})
+    processes = []
+    try:
+        service_url = args.service_url
+        if not service_url:
+            fake_port, service_port = free_port(), free_port()
+            workdir = tempfile.mkdtemp(prefix="bench-")
+            processes.append(start_fake(config, fake_port))
+            await wait_ready(f"http://127.0.0.1:{fake_port}/stats")
+            processes.append(start_service(service_port, f"http://127.0.0.1:{fake_port}", workdir, dict(entry.split("=", 1) for entry in args.env)))
+            service_url = f"http://127.0.0.1:{service_port}"
+            await wait_ready(f"{service_url}/metrics")
+        results = await benchmark(service_url, scenarios, concurrency, args.requests, args.warmup)
+    finally:
+        # The service first: it deletes its cached uploads from the fake on shutdown
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+    return {
+        "started": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "service_url": args.service_url,
+        "env": args.env,
+        "fake_gemini": asdict(config) if not args.service_url else None,
+        "results": results,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks /webpage-analysis against a fake Gemini server.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="Sequential requests per scenario before measuring")
+    parser.add_argument("--service-url", help="Benchmark a running service instead of starting one with the fake server")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Environment variable for the started service")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Previous results JSON to compare with")
+    for name, value in asdict(FakeGeminiConfig()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value, help="Fake Gemini server setting (see app.fake_gemini)")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(args.compare) as previous:
+            for line in compare(json.load(previous), report):
+                print(line)
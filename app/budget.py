@@ -0,0 +1,180 @@
+"""
+Token preflight and adaptive prompt budgeting.
+
+Before a generation call is paid for, `fit_prompt` estimates the prompt's input tokens (see
+`app.tokens`) and compares them with the model's budget (`PROMPT_TOKEN_BUDGET`, per-model overrides in
+`MODEL_TOKEN_BUDGETS`). A prompt over budget is degraded step by step, in priority order, until it fits:
+
+    audits          Re-compact the audits with tighter caps (`BUDGET_AUDIT_MAX_ITEMS` entries per
+                    category, one selector each).
+    specification   Truncate the specification, with a marker telling the model it was cut.
+    html            Keep the page's `<head>` and leading body sections that fit (section boundaries as
+                    in `app.chunking`), and elide the rest behind a marker comment.
+
+If the prompt still does not fit, `OverBudget` is raised and the request is rejected (413) instead of
+failing upstream on context length or coming back truncated.
+
+The plan that was applied ("full" when nothing had to change) and the token counts are reported in the
+`X-Prompt-Plan`, `X-Prompt-Tokens` and `X-Prompt-Token-Budget` response headers.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Callable
+
+from .audit_compaction import compact_audits
+from .chunking import split_html
+from .tokens import CHARS_PER_TOKEN
+
+# Maximum estimated input tokens of one call. 0 disables budgeting.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "900000"))
+# Per-model overrides: "model=tokens,other-model=tokens"
+MODEL_TOKEN_BUDGETS = os.getenv("MODEL_TOKEN_BUDGETS", "")
+# Entries per audit category kept when the audits have to be re-compacted
+BUDGET_AUDIT_MAX_ITEMS = int(os.getenv("BUDGET_AUDIT_MAX_ITEMS", "5"))
+
+SPECIFICATION_TRUNCATED = "\n[... specification truncated to fit the model's token budget ...]"
+_HTML_ELIDED = "<!-- {chars} characters of trailing page sections elided to fit the model's token budget -->"
+
+
+class OverBudget(ValueError):
+    """
+    Raised when a prompt cannot be degraded to fit the budget.
+    """
+
+    def __init__(self, tokens: int, budget: int):
+        super().__init__(f"The prompt needs about {tokens} tokens even after trimming, over the model's budget of {budget}")
+        self.tokens = tokens
+        self.budget = budget
+
+
+def parse_model_budgets(value: str) -> dict[str, int]:
+    """
+    Parses `MODEL_TOKEN_BUDGETS`, e.g. "gemini-2.5-flash=900000,gemini-2.0-flash-lite=120000".
+
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    budgets = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(","))):
+        name, _, tokens = entry.rpartition("=")
+        if not name or not tokens.strip().isdigit():
+            raise ValueError(f"Invalid MODEL_TOKEN_BUDGETS entry: {entry!r}")
+        budgets[name.strip()] = int(tokens)
+    return budgets
+
+
+_MODEL_BUDGETS = parse_model_budgets(MODEL_TOKEN_BUDGETS)
+
+
+def token_budget(model: str | None) -> int:
+    """
+    Returns the input token budget of a model (0 when budgeting is disabled).
+    """
+    return _MODEL_BUDGETS.get(model, PROMPT_TOKEN_BUDGET)
+
+
+def budget_fingerprint(model: str | None) -> str:
+    """
+    Identifies the budget settings, so results of differently trimmed prompts are not reused.
+    """
+    return f"budget={token_budget(model)}:{BUDGET_AUDIT_MAX_ITEMS}"
+
+
+def elide_html(html: str, max_chars: int) -> str:
+    """
+    Keeps the `<head>` and the leading body sections of a page within `max_chars`, eliding the rest.
+
+    Args:
+        html (str): The (reduced) page HTML.
+        max_chars (int): Target size of the result.
+
+    Returns:
+        str: The trimmed page, ending with a marker comment, or `html` unchanged if it already fits.
+    """
+    if len(html) <= max_chars:
+        return html
+    # Chunks also carry the page's <head>: shrink the body allowance until the whole fits
+    limit = max_chars
+    for _ in range(3):
+        kept = split_html(html, max(1, limit))[0]
+        if len(kept) <= max_chars:
+            break
+        limit -= len(kept) - max_chars
+    marker = _HTML_ELIDED.format(chars=max(0, len(html) - len(kept)))
+    closing = kept.rfind("</body>")
+    return kept[:closing] + marker + "\n" + kept[closing:] if closing != -1 else kept + "\n" + marker
+
+
+@dataclass
+class PromptPlan:
+    """
+    Output of `fit_prompt`: the prompt inputs to use and how they were obtained.
+
+    Attributes:
+        html: The page HTML to embed.
+        specification: The specification to embed.
+        audits: The audits to embed.
+        budget: The model's token budget (0 if disabled).
+        original_tokens: Estimated tokens of the prompt before any step.
+        tokens: Estimated tokens of the prompt after the applied steps.
+        steps: The applied steps, in order ("audits", "specification", "html").
+    """
+    html: str
+    specification: str | None
+    audits: dict | None
+    budget: int
+    original_tokens: int
+    tokens: int
+    steps: list[str] = field(default_factory=list)
+
+    @property
+    def plan(self) -> str:
+        return ",".join(self.steps) or "full"
+
+
+def fit_prompt(html: str, specification: str | None, audits: dict | None, evaluations: dict | None, measure: Callable[[str, str | None, dict | None], int], budget: int, elide: bool = True) -> PromptPlan:
+    """
+    Estimates a prompt's tokens and degrades its inputs until it fits the budget.
+
+    Args:
+        html (str): The (reduced) page HTML.
+        specification (str | None): The specification.
+        audits (dict | None): The compacted audits.
+        evaluations (dict | None): The original parsed `webAuditResults`, re-compacted by the "audits" step.
+        measure (Callable[[str, str | None, dict | None], int]): Estimates the prompt tokens for the given
+            HTML, specification and audits (everything else in the call included).
+        budget (int): Maximum tokens. 0 only measures.
+        elide (bool, optional): Whether the "html" step may be applied (not for pages analyzed in chunks).
+
+    Returns:
+        PromptPlan: The inputs to embed and the applied steps.
+
+    Raises:
+        OverBudget: If the prompt is still over budget after every step.
+    """
+    tokens = measure(html, specification, audits)
+    plan = PromptPlan(html=html, specification=specification, audits=audits, budget=budget, original_tokens=tokens, tokens=tokens)
+    if budget <= 0 or tokens <= budget:
+        return plan
+
+    if evaluations:
+        plan.audits = compact_audits(evaluations, enabled=True, max_items=BUDGET_AUDIT_MAX_ITEMS, max_nodes=1).audits
+        plan.steps.append("audits")
+        plan.tokens = measure(plan.html, plan.specification, plan.audits)
+
+    if plan.tokens > budget and plan.specification:
+        keep = max(0, len(plan.specification) - (plan.tokens - budget) * CHARS_PER_TOKEN - len(SPECIFICATION_TRUNCATED))
+        plan.specification = plan.specification[:keep] + SPECIFICATION_TRUNCATED
+        plan.steps.append("specification")
+        plan.tokens = measure(plan.html, plan.specification, plan.audits)
+
+    if plan.tokens > budget and elide:
+        keep = len(plan.html) - (plan.tokens - budget) * CHARS_PER_TOKEN - len(_HTML_ELIDED) - 16
+        plan.html = elide_html(plan.html, keep)
+        plan.steps.append("html")
+        plan.tokens = measure(plan.html, plan.specification, plan.audits)
+
+    if plan.tokens > budget:
+        raise OverBudget(plan.tokens, budget)
+    return plan
@@ -0,0 +1,262 @@
+"""
+Chunked analysis of very large pages.
+
+A page whose (reduced) HTML exceeds `CHUNKED_ANALYSIS_MIN_CHARS` is split into section-level chunks:
+the top-level children of `<body>` are packed greedily into chunks of at most `CHUNK_MAX_CHARS`, and a
+section that is too large on its own is split again at its children's boundaries. Every chunk is
+prefixed with the page's `<head>` so the model sees the shared CSS and metadata.
+
+The chunks are analyzed concurrently (at most `CHUNK_CONCURRENCY` calls at a time) and the partial
+`WebpageAnalysisResponse` objects are merged by `merge_responses`: findings are concatenated and
+de-duplicated, summaries are combined and the Executive Summary is synthesized from the chunk
+summaries. Wall-clock time then scales with the largest chunk rather than the whole document.
+"""
+
+import asyncio
+import os
+import re
+from html.parser import HTMLParser
+from typing import Awaitable, Callable
+
+from .models import WebpageAnalysisResponse, DetailedAnalysis
+
+# Pages above this size (after HTML reduction) are analyzed in chunks. 0 disables automatic chunking.
+CHUNKED_ANALYSIS_MIN_CHARS = int(os.getenv("CHUNKED_ANALYSIS_MIN_CHARS", str(400 * 1024)))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", str(200 * 1024)))
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+_VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+_HEAD_PATTERN = re.compile(r"<head[\s>].*?</head>", re.IGNORECASE | re.DOTALL)
+
+
+class _BoundaryParser(HTMLParser):
+    """
+    Records the character offsets at which elements start and end, together with their depth.
+    """
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=False)
+        self._html = html
+        # HTMLParser counts lines by "\n" only
+        self._line_offsets = [0]
+        for line in html.split("\n")[:-1]:
+            self._line_offsets.append(self._line_offsets[-1] + len(line) + 1)
+        self.stack: list[str] = []
+        self.body_depth: int | None = None
+        self.body_range: list[int] = [0, len(html)]
+        # (start, end, depth) of every element
+        self.elements: list[tuple[int, int, int]] = []
+        self._open: list[int] = []
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        start = self._offset()
+        if tag in _VOID_ELEMENTS:
+            self.elements.append((start, start + len(self.get_starttag_text()), len(self.stack)))
+            return
+        if tag == "body" and self.body_depth is None:
+            self.body_depth = len(self.stack) + 1
+            self.body_range[0] = start + len(self.get_starttag_text())
+        self.stack.append(tag)
+        self._open.append(start)
+
+    def handle_startendtag(self, tag, attrs):
+        start = self._offset()
+        self.elements.append((start, start + len(self.get_starttag_text()), len(self.stack)))
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        end_start = self._offset()
+        end = self._html.find(">", end_start) + 1
+        # Close implicitly closed elements (e.g. <p>, <li>) up to the matching tag
+        while self.stack:
+            open_tag = self.stack.pop()
+            start = self._open.pop()
+            if open_tag == "body":
+                self.body_range[1] = end_start
+            self.elements.append((start, end if open_tag == tag else end_start, len(self.stack)))
+            if open_tag == tag:
+                break
+
+    def run(self):
+        self.feed(self._html)
+        self.close()
+        return self
+
+
+def _pieces(elements, start: int, end: int, depth: int, max_chars: int) -> list[tuple[int, int]]:
+    children = sorted((s, e) for s, e, d in elements if d == depth and s >= start and e <= end)
+    if not children:
+        return [(start, end)]
+    pieces = []
+    cursor = start
+    for child_start, child_end in children:
+        if child_start < cursor:
+            continue
+        # Text between elements travels with the next element
+        piece = (cursor, child_end)
+        if piece[1] - piece[0] > max_chars:
+            pieces.extend(_pieces(elements, piece[0], piece[1], depth + 1, max_chars))
+        else:
+            pieces.append(piece)
+        cursor = child_end
+    if cursor < end:
+        pieces.append((cursor, end))
+    return pieces
+
+
+def split_html(html: str, max_chars: int = CHUNK_MAX_CHARS) -> list[str]:
+    """
+    Splits a page into section-level chunks that each carry the page's `<head>`.
+
+    Args:
+        html (str): The (reduced) page HTML.
+        max_chars (int, optional): Target maximum size of a chunk's body content. A single element
+            with no children to split at may exceed it.
+
+    Returns:
+        list[str]: The chunks, in document order. A page that fits in one chunk is returned as-is.
+    """
+    if len(html) <= max_chars:
+        return [html]
+    parser = _BoundaryParser(html).run()
+    body_start, body_end = parser.body_range
+    depth = parser.body_depth if parser.body_depth is not None else 0
+    head_match = _HEAD_PATTERN.search(html, 0, body_start)
+    head = head_match.group() if head_match else ""
+
+    chunks: list[str] = []
+    current_start = current_end = None
+    for piece_start, piece_end in _pieces(parser.elements, body_start, body_end, depth, max_chars):
+        if current_start is not None and piece_end - current_start > max_chars:
+            chunks.append(html[current_start:current_end])
+            current_start = None
+        if current_start is None:
+            current_start = piece_start
+        current_end = piece_end
+    if current_start is not None:
+        chunks.append(html[current_start:current_end])
+
+    chunks = [chunk for chunk in chunks if chunk.strip()]
+    return [f"{head}\n<body>\n{chunk}\n</body>" if head else chunk for chunk in chunks]
+
+
+def html_regions(html: str, max_chars: int) -> tuple[str, list[str]]:
+    """
+    Splits a page into its `<head>` and the regions of its body: the top-level children of `<body>`,
+    with children larger than `max_chars` split again at their own children's boundaries.
+
+    Args:
+        html (str): The page HTML.
+        max_chars (int): Regions larger than this are split further when they have children.
+
+    Returns:
+        tuple[str, list[str]]: The `<head>` element ("" if none) and the non-blank regions, in document order.
+    """
+    parser = _BoundaryParser(html).run()
+    body_start, body_end = parser.body_range
+    depth = parser.body_depth if parser.body_depth is not None else 0
+    head_match = _HEAD_PATTERN.search(html, 0, body_start)
+    regions = [html[start:end] for start, end in _pieces(parser.elements, body_start, body_end, depth, max_chars)]
+    return head_match.group() if head_match else "", [region for region in regions if region.strip()]
+
+
+def _finding_key(finding) -> tuple:
+    code = getattr(finding, "Code", None)
+    normalized = lambda text: " ".join((text or "").lower().split())
+    return (normalized(finding.Issue), normalized(code) if code else normalized(getattr(finding, "Details", None)))
+
+
+def dedupe_findings(findings: list) -> list:
+    """
+    Drops findings repeating an earlier one's issue and code (or details), keeping the first.
+    """
+    seen = set()
+    unique = []
+    for finding in findings:
+        key = _finding_key(finding)
+        if key not in seen:
+            seen.add(key)
+            unique.append(finding)
+    return unique
+
+
+def _join_summaries(summaries) -> str | None:
+    distinct = list(dict.fromkeys(summary.strip() for summary in summaries if summary and summary.strip()))
+    return " ".join(distinct) or None
+
+
+def merge_responses(responses: list[WebpageAnalysisResponse]) -> WebpageAnalysisResponse:
+    """
+    Merges per-chunk analyses into one response.
+
+    Findings are concatenated in chunk order and de-duplicated by issue and code, summaries are
+    combined, and the first chunk's non-LLM evaluations are kept (audits are only sent with chunk 1).
+
+    Args:
+        responses (list[WebpageAnalysisResponse]): The chunk results, in document order.
+
+    Returns:
+        WebpageAnalysisResponse: The merged analysis.
+    """
+    if len(responses) == 1:
+        return responses[0]
+
+    detailed = {}
+    for attribute, field in DetailedAnalysis.model_fields.items():
+        parts = [getattr(r.Detailed_Analysis, attribute) for r in responses if r.Detailed_Analysis is not None]
+        parts = [part for part in parts if part is not None]
+        if parts:
+            # Sub-models only accept their aliases ("Content Discrepancies", "Summary", ...)
+            detailed[field.alias] = type(parts[0]).model_validate({
+                "Summary": _join_summaries(part.Summary for part in parts),
+                "Findings": dedupe_findings([finding for part in parts for finding in part.Findings]),
+            })
+
+    section_summaries = _join_summaries(r.Executive_Summary for r in responses)
+    executive_summary = f"Analysis of {len(responses)} page sections. {section_summaries}" if section_summaries else None
+
+    return WebpageAnalysisResponse(
+        Executive_Summary=executive_summary,
+        Detailed_Analysis=DetailedAnalysis.model_validate(detailed) if detailed else None,
+        Non_LLM_Evaluations=next((r.Non_LLM_Evaluations for r in responses if r.Non_LLM_Evaluations is not None), None),
+        Other_Issues=dedupe_findings([issue for r in responses for issue in r.Other_Issues]),
+    )
+
+
+async def analyse_chunks(chunks: list[str], analyse_chunk: Callable[[int, str], Awaitable[WebpageAnalysisResponse]], concurrency: int = CHUNK_CONCURRENCY) -> WebpageAnalysisResponse:
+    """
+    Analyzes chunks concurrently with bounded fan-out and merges the results.
+
+    Args:
+        chunks (list[str]): Chunks from `split_html`.
+        analyse_chunk (Callable[[int, str], Awaitable[WebpageAnalysisResponse]]): Analyzes one chunk,
+            given its index and HTML.
+        concurrency (int, optional): Maximum number of chunks analyzed at the same time.
+
+    Returns:
+        WebpageAnalysisResponse: The merged analysis.
+
+    Raises:
+        Exception: The first error raised by a chunk; the chunks still running are cancelled, so a failed
+            request stops spending quota.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(index: int, chunk: str) -> WebpageAnalysisResponse:
+        async with semaphore:
+            return await analyse_chunk(index, chunk)
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(bounded(i, chunk)) for i, chunk in enumerate(chunks)]
+    except ExceptionGroup as e:
+        # Re-raised as is, so HTTP errors keep their status code
+        raise e.exceptions[0]
+    return merge_responses([task.result() for task in tasks])
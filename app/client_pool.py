@@ -0,0 +1,180 @@
+"""
+Pool of Gemini clients (one per API key / project) with health-based routing.
+
+A single key's quota caps the service's throughput. `ClientPool` spreads requests over several clients:
+each request takes a `ClientLease` on the least-loaded healthy client (fewest requests in flight, then
+lowest latency) and uses that client for all of its calls.
+
+A client whose call fails with a transient error (429, 5xx, timeouts, see `app.resilience.is_transient`)
+is put in cooldown: new leases avoid it for `CLIENT_COOLDOWN_SECONDS`, doubling with every consecutive
+failure up to `CLIENT_COOLDOWN_MAX_SECONDS`. A success ends the cooldown streak. When every client is
+cooling down, the one that recovers first is used rather than failing the request.
+
+Files uploaded through the Files API only exist for the key/project that uploaded them, so a request
+that uploads its design file must keep its lease's client for every call that references the upload.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from .resilience import is_transient
+
+CLIENT_COOLDOWN_SECONDS = float(os.getenv("CLIENT_COOLDOWN_SECONDS", "30"))
+CLIENT_COOLDOWN_MAX_SECONDS = float(os.getenv("CLIENT_COOLDOWN_MAX_SECONDS", "300"))
+# Weight of the latest call in the per-client latency average
+CLIENT_LATENCY_SMOOTHING = 0.2
+
+
+class PooledClient:
+    """
+    One client of the pool and its health.
+
+    Attributes:
+        name: Label used in logs and stats (never the key itself).
+        client: The async Gemini client.
+        in_flight: Number of leases currently held.
+        calls: Number of tracked calls.
+        errors: Number of tracked calls that failed.
+        failures: Consecutive transient failures (drives the cooldown length).
+        latency: Exponentially weighted average call latency in seconds, None before the first call.
+        cooldown_until: Clock time before which new leases avoid this client.
+    """
+
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0
+        self.latency: float | None = None
+        self.cooldown_until = 0.0
+
+
+class ClientLease:
+    """
+    A request's hold on one pooled client. Attribute access is forwarded to the client, so a lease can be
+    used wherever a client is expected (`lease.models.generate_content(...)`, `lease.files.upload(...)`).
+
+    Release the lease when the request is done (`release()` or `with lease:`).
+    """
+
+    def __init__(self, pool: "ClientPool", member: PooledClient):
+        self._pool = pool
+        self._member = member
+        self._released = False
+
+    @property
+    def name(self) -> str:
+        return self._member.name
+
+    @property
+    def client(self):
+        return self._member.client
+
+    def __getattr__(self, attribute):
+        return getattr(self._member.client, attribute)
+
+    @contextmanager
+    def track(self):
+        """
+        Records the latency and outcome of one call made with this lease.
+        """
+        start = self._pool._clock()
+        try:
+            yield
+        except Exception as e:
+            self._pool.record(self._member, self._pool._clock() - start, e)
+            raise
+        else:
+            self._pool.record(self._member, self._pool._clock() - start)
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._member.in_flight -= 1
+
+    def __enter__(self) -> "ClientLease":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class ClientPool:
+    """
+    Routes requests over several Gemini clients (see the module docstring).
+    """
+
+    def __init__(self, clients: list, names: list[str] | None = None, cooldown: float = CLIENT_COOLDOWN_SECONDS, cooldown_max: float = CLIENT_COOLDOWN_MAX_SECONDS, clock=time.monotonic):
+        names = names or [f"client-{index + 1}" for index in range(len(clients))]
+        self.members = [PooledClient(name, client) for name, client in zip(names, clients)]
+        self.cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self._clock = clock
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    @property
+    def primary(self):
+        """
+        The first client. Owns state that is not spread over the pool (cached prompt prefix, offline batches).
+        """
+        return self.members[0].client if self.members else None
+
+    def lease(self) -> ClientLease:
+        """
+        Leases the least-loaded healthy client.
+
+        Returns:
+            ClientLease: The lease; release it when the request is done.
+
+        Raises:
+            RuntimeError: If the pool is empty (no API key configured or SDK missing).
+        """
+        if not self.members:
+            raise RuntimeError("No Gemini client configured")
+        now = self._clock()
+        healthy = [member for member in self.members if member.cooldown_until <= now]
+        if healthy:
+            member = min(healthy, key=lambda m: (m.in_flight, m.latency if m.latency is not None else 0.0))
+        else:
+            member = min(self.members, key=lambda m: m.cooldown_until)
+        member.in_flight += 1
+        return ClientLease(self, member)
+
+    def record(self, member: PooledClient, seconds: float, error: Exception | None = None) -> None:
+        """
+        Updates a client's latency and health after a call.
+        """
+        member.calls += 1
+        member.latency = seconds if member.latency is None else (1 - CLIENT_LATENCY_SMOOTHING) * member.latency + CLIENT_LATENCY_SMOOTHING * seconds
+        if error is None:
+            member.failures = 0
+            return
+        member.errors += 1
+        if is_transient(error):
+            member.failures += 1
+            cooldown = min(self.cooldown_max, self.cooldown * 2 ** (member.failures - 1))
+            member.cooldown_until = self._clock() + cooldown
+            logging.warning(f"Gemini client {member.name} cooling down for {cooldown:.0f}s after: {error}")
+
+    def snapshot(self) -> list[dict]:
+        """
+        Returns each client's in-flight count, call/error counts, latency and remaining cooldown.
+        """
+        now = self._clock()
+        return [
+            {
+                "name": member.name,
+                "in_flight": member.in_flight,
+                "calls": member.calls,
+                "errors": member.errors,
+                "latency_seconds": member.latency,
+                "cooldown_seconds": max(0.0, member.cooldown_until - now),
+            }
+            for member in self.members
+        ]
@@ -0,0 +1,220 @@
+"""
+Upstream (Gemini) context caching of the static prompt prefix.
+
+Everything `get_prompt` emits before "**Inputs for Analysis:**" is identical for every request. Instead
+of re-sending it as billable input on each call, `PromptPrefixCache` stores it once as a Gemini
+cached-content entry (as the system instruction), keyed by model and prompt template version, and
+requests then only send the variable inputs with `cached_content=<name>`.
+
+The entry is created by a background task started with the app and refreshed before its TTL expires.
+Prefixes estimated below `CONTEXT_CACHE_MIN_TOKENS` (the model's minimum cacheable size) are never
+sent to the API: caching them can only fail. If caching is otherwise unavailable (e.g. the API rejects
+it), requests fall back to sending the full prompt and creation is retried later.
+
+`LocalCaches` is an in-memory stand-in for the SDK's `client.caches` surface, for tests and offline runs.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from .tokens import estimate_tokens
+
+try:
+    from google.genai import types
+except ImportError:
+    types = None
+
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Refresh the entry this long before it expires
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = int(os.getenv("CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", "300"))
+# Wait this long before retrying after caching failed
+CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("CONTEXT_CACHE_RETRY_SECONDS", "600"))
+# Gemini rejects cached content below a model-specific minimum (1024 tokens for Flash, 4096 for Pro)
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+
+def is_cache_rejection(error: Exception) -> bool:
+    """
+    Checks whether a generation error means the referenced cached content is gone or unusable.
+
+    Rate limiting (429) is excluded: retrying without the cache would only burn more quota.
+
+    Args:
+        error (Exception): The error raised by `generate_content`.
+
+    Returns:
+        bool: True for 400/403/404 API errors.
+    """
+    return getattr(error, "code", None) in (400, 403, 404)
+
+
+class PromptPrefixCache:
+    """
+    Tracks the cached-content entry holding the static prompt prefix for each (model, template version).
+
+    Attributes:
+        enabled: Whether upstream context caching is used at all.
+        ttl_seconds: TTL requested for the upstream entry.
+        refresh_margin_seconds: How long before expiry the entry is refreshed.
+        retry_seconds: Back-off after a failed create/refresh.
+        min_tokens: Estimated size below which a prefix is not cached.
+    """
+
+    def __init__(self, enabled: bool = CONTEXT_CACHE_ENABLED, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS, refresh_margin_seconds: int = CONTEXT_CACHE_REFRESH_MARGIN_SECONDS, retry_seconds: int = CONTEXT_CACHE_RETRY_SECONDS, min_tokens: int = CONTEXT_CACHE_MIN_TOKENS, clock=time.time):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.min_tokens = min_tokens
+        self._clock = clock
+        # (model, version) -> (cached content name, expires_at)
+        self._entries: dict[tuple[str, str], tuple[str, float]] = {}
+        self._failed_at: dict[tuple[str, str], float] = {}
+
+    def cacheable(self, instructions: str) -> bool:
+        """
+        Checks whether a prefix is large enough to be cached upstream.
+        """
+        return self.enabled and estimate_tokens(instructions) >= self.min_tokens
+
+    def get(self, model: str, version: str) -> str | None:
+        """
+        Returns the name of a usable cached-content entry, or None to send the full prompt.
+
+        Args:
+            model (str): The Gemini model name.
+            version (str): The prompt template version.
+
+        Returns:
+            str | None: The cached content name.
+        """
+        if not self.enabled:
+            return None
+        entry = self._entries.get((model, version))
+        # Entries about to expire could vanish mid-request
+        if entry is None or entry[1] - self._clock() < 30:
+            return None
+        return entry[0]
+
+    def invalidate(self, model: str, version: str) -> None:
+        """
+        Forgets an entry the API rejected, so requests send the full prompt until it is recreated.
+        """
+        self._entries.pop((model, version), None)
+        self._failed_at[(model, version)] = self._clock()
+
+    async def ensure(self, client, model: str, version: str, instructions: str) -> str | None:
+        """
+        Creates the entry if missing, or extends its TTL if it is close to expiry.
+
+        Args:
+            client: The async Gemini client.
+            model (str): The Gemini model name.
+            version (str): The prompt template version.
+            instructions (str): The static prompt prefix.
+
+        Returns:
+            str | None: The cached content name, or None if caching is unavailable.
+        """
+        if not self.cacheable(instructions) or client is None:
+            return None
+        key = (model, version)
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] - now > self.refresh_margin_seconds:
+            return entry[0]
+        failed_at = self._failed_at.get(key)
+        if entry is None and failed_at is not None and now - failed_at < self.retry_seconds:
+            return None
+        ttl = f"{self.ttl_seconds}s"
+        try:
+            if entry is not None:
+                try:
+                    await client.caches.update(name=entry[0], config={"ttl": ttl})
+                    self._entries[key] = (entry[0], now + self.ttl_seconds)
+                    return entry[0]
+                except Exception as e:
+                    logging.warning(f"Refreshing cached prompt prefix failed, recreating it: {e}")
+            cached = await client.caches.create(model=model, config={
+                "system_instruction": instructions,
+                "display_name": f"webpage-analysis-{version}",
+                "ttl": ttl,
+            })
+        except Exception as e:
+            logging.warning(f"Context caching unavailable, sending the full prompt: {e}")
+            self._entries.pop(key, None)
+            self._failed_at[key] = now
+            return None
+        self._failed_at.pop(key, None)
+        self._entries[key] = (cached.name, now + self.ttl_seconds)
+        return cached.name
+
+    async def run_refresher(self, client, model: str, version: str, instructions: str) -> None:
+        """
+        Keeps the entry alive for the app's lifetime. Meant to run as a background task.
+        """
+        while True:
+            await self.ensure(client, model, version, instructions)
+            await asyncio.sleep(max(1, min(self.retry_seconds, self.ttl_seconds - self.refresh_margin_seconds)))
+
+    async def close(self, client) -> None:
+        """
+        Deletes every upstream entry. Called on shutdown.
+        """
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for name, _ in entries:
+            try:
+                await client.caches.delete(name=name)
+            except Exception as e:
+                logging.warning(f"Failed to delete cached prompt prefix {name}: {e}")
+
+
+class LocalCaches:
+    """
+    In-memory stand-in for `client.caches` (create/get/update/delete), for tests and offline runs.
+
+    Attributes:
+        entries: Stored entries by name, as dicts with "model", "config" and "expire_time".
+    """
+
+    def __init__(self, clock=time.time):
+        self.entries: dict[str, dict] = {}
+        self._clock = clock
+        self._ids = itertools.count(1)
+
+    def _expire_time(self, config: dict) -> datetime:
+        seconds = int(str(config.get("ttl", "3600s")).rstrip("s"))
+        return datetime.fromtimestamp(self._clock(), timezone.utc) + timedelta(seconds=seconds)
+
+    def _cached_content(self, name: str):
+        entry = self.entries[name]
+        return types.CachedContent(name=name, model=entry["model"], display_name=entry["config"].get("display_name"), expire_time=entry["expire_time"])
+
+    def _live(self, name: str) -> bool:
+        entry = self.entries.get(name)
+        return entry is not None and entry["expire_time"].timestamp() > self._clock()
+
+    async def create(self, *, model: str, config: dict):
+        name = f"cachedContents/local-{next(self._ids)}"
+        self.entries[name] = {"model": model, "config": dict(config), "expire_time": self._expire_time(config)}
+        return self._cached_content(name)
+
+    async def get(self, *, name: str):
+        if not self._live(name):
+            raise LookupError(f"{name} not found")
+        return self._cached_content(name)
+
+    async def update(self, *, name: str, config: dict):
+        if not self._live(name):
+            raise LookupError(f"{name} not found")
+        self.entries[name]["expire_time"] = self._expire_time(config)
+        return self._cached_content(name)
+
+    async def delete(self, *, name: str):
+        self.entries.pop(name, None)
@@ -0,0 +1,305 @@
+"""
+Helpers for handing a design file (image) to Gemini without touching the local disk.
+
+The bytes received from the multipart upload are either:
+1. Sent inline with the prompt as an image `Part` when they fit under `DESIGN_FILE_INLINE_MAX_BYTES`, or
+2. Uploaded to the Gemini Files API straight from memory.
+
+Uploaded files are deleted after the response has been sent (see `delete_design_file`), so the
+delete round-trip is never on the request's critical path.
+
+Because clients tend to re-run analyses against the same design export, uploaded handles can also be
+kept in a `DesignFileCache`, keyed by the SHA-256 of the image bytes. Repeat requests reuse the handle
+instead of uploading again; entries expire well before the Files API's own 48 hour expiry and are
+deleted by a periodic sweeper or when they fall out of the LRU.
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from collections import OrderedDict
+
+try:
+    from google.genai import types
+except ImportError:
+    types = None
+
+# Images up to this many bytes are sent inline with the prompt instead of via the Files API.
+# 0 disables inlining.
+DESIGN_FILE_INLINE_MAX_BYTES = int(os.getenv("DESIGN_FILE_INLINE_MAX_BYTES", "0"))
+
+# Number of uploaded design files to keep for reuse. 0 disables the cache (upload + delete per request).
+DESIGN_FILE_CACHE_MAX_ENTRIES = int(os.getenv("DESIGN_FILE_CACHE_MAX_ENTRIES", "64"))
+# Must stay below the Files API expiry (48 hours).
+DESIGN_FILE_CACHE_TTL_SECONDS = float(os.getenv("DESIGN_FILE_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+DESIGN_FILE_CACHE_SWEEP_SECONDS = float(os.getenv("DESIGN_FILE_CACHE_SWEEP_SECONDS", "300"))
+
+
+# Bytes needed to recognize every supported image format
+IMAGE_SNIFF_BYTES = 12
+# ISO base media brands of HEIC (HEVC-coded) and generic HEIF images
+_HEIC_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis"}
+_HEIF_BRANDS = {b"mif1", b"msf1"}
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """
+    Identifies a design image from its leading bytes instead of the client-declared content type.
+
+    Args:
+        head (bytes): The first bytes of the file (at least `IMAGE_SNIFF_BYTES` unless the file is shorter).
+
+    Returns:
+        str | None: The MIME type of an image format the model accepts (PNG, JPEG, WebP, HEIC, HEIF),
+        or None for anything else.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        if head[8:12] in _HEIC_BRANDS:
+            return "image/heic"
+        if head[8:12] in _HEIF_BRANDS:
+            return "image/heif"
+    return None
+
+
+def design_file_hash(content: bytes) -> str:
+    """
+    Returns the content address (hex SHA-256) of a design file.
+
+    Args:
+        content (bytes): The raw design file bytes.
+
+    Returns:
+        str: The hex digest used as the cache key.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def can_inline(content: bytes) -> bool:
+    """
+    Checks whether a design file is small enough to be sent as an inline image part.
+
+    Args:
+        content (bytes): The raw design file bytes.
+
+    Returns:
+        bool: True if inlining is enabled and the file is within the inline limit.
+    """
+    return types is not None and 0 < len(content) <= DESIGN_FILE_INLINE_MAX_BYTES
+
+
+def inline_design_part(content: bytes, mime_type: str):
+    """
+    Wraps the design file bytes as an inline image part for `generate_content`.
+
+    Args:
+        content (bytes): The raw design file bytes.
+        mime_type (str): The image MIME type, e.g. "image/png".
+
+    Returns:
+        types.Part: An inline data part carrying the image.
+    """
+    return types.Part.from_bytes(data=content, mime_type=mime_type)
+
+
+async def upload_design_file(client, content: bytes, mime_type: str, display_name: str | None = None):
+    """
+    Uploads the design file bytes to the Gemini Files API directly from memory.
+
+    Args:
+        client: The async Gemini client (`genai.Client.aio`).
+        content (bytes): The raw design file bytes.
+        mime_type (str): The image MIME type. Required because no filename is available to infer it from.
+        display_name (str | None, optional): Name shown for the file in the Files API. Defaults to None.
+
+    Returns:
+        types.File: The uploaded file handle, usable directly as a `contents` entry.
+    """
+    config = {"mime_type": mime_type}
+    if display_name:
+        config["display_name"] = display_name
+    return await client.files.upload(file=io.BytesIO(content), config=config)
+
+
+async def delete_design_file(client, name: str) -> None:
+    """
+    Deletes an uploaded design file. Intended to run as a background task after the response.
+
+    Failures are logged and swallowed: the Files API expires uploads on its own, so a failed
+    delete must never surface as a request error.
+
+    Args:
+        client: The async Gemini client (`genai.Client.aio`).
+        name (str): The Files API name of the uploaded file.
+    """
+    try:
+        await client.files.delete(name=name)
+    except Exception as e:
+        logging.warning(f"Failed to delete design file {name}: {e}")
+
+
+class DesignFileCache:
+    """
+    LRU + TTL cache of uploaded Gemini file handles, keyed by the uploading client and the SHA-256 of
+    the image bytes.
+
+    Concurrent requests for the same image share a single upload. Every handle returned by
+    `get_or_upload` is a lease that the request gives back with `release` once its model call is done.
+    Entries that expire or are evicted are deleted from the Files API (in the background, using the
+    client that uploaded them) once their last lease is released, so a request never loses its file
+    while it is still being generated against.
+
+    Attributes:
+        max_entries: Maximum number of cached handles. 0 disables caching.
+        ttl_seconds: Lifetime of a cached handle.
+    """
+
+    def __init__(self, max_entries: int = DESIGN_FILE_CACHE_MAX_ENTRIES, ttl_seconds: float = DESIGN_FILE_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._delete_tasks: set[asyncio.Task] = set()
+        # Leases by file name, and the files removed from the cache while leased
+        self._leases: dict[str, int] = {}
+        self._retired: dict[str, tuple] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_upload(self, client, content: bytes, mime_type: str, display_name: str | None = None):
+        """
+        Returns a cached handle for the image, uploading it on a miss. The handle is leased until it is
+        given back with `release`.
+
+        Args:
+            client: The async Gemini client used for the upload (and later the delete).
+            content (bytes): The raw design file bytes.
+            mime_type (str): The image MIME type.
+            display_name (str | None, optional): Name shown for the file in the Files API.
+
+        Returns:
+            types.File: The uploaded file handle.
+        """
+        # Uploads only exist for the client (API key / project) that made them
+        key = f"{id(client)}:{design_file_hash(content)}"
+        entry = self._entries.get(key)
+        if entry is not None:
+            handle, owner, expires_at = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                return self._lease(handle)
+            del self._entries[key]
+            self._retire(owner, handle)
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            return self._lease(await asyncio.shield(pending))
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            handle = await upload_design_file(client, content, mime_type, display_name)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(key, None)
+
+        self._entries[key] = (handle, client, self._clock() + self.ttl_seconds)
+        self._lease(handle)
+        while len(self._entries) > self.max_entries:
+            _, (old_handle, old_owner, _) = self._entries.popitem(last=False)
+            self._retire(old_owner, old_handle)
+        future.set_result(handle)
+        return handle
+
+    def release(self, handle) -> bool:
+        """
+        Gives back a lease taken by `get_or_upload`. A file removed from the cache meanwhile is deleted
+        once its last lease is released.
+
+        Returns:
+            bool: Whether the handle was leased from this cache (False for uploads the caller owns).
+        """
+        name = getattr(handle, "name", None)
+        if name not in self._leases:
+            return False
+        self._leases[name] -= 1
+        if self._leases[name] <= 0:
+            del self._leases[name]
+            retired = self._retired.pop(name, None)
+            if retired is not None:
+                self._schedule_delete(retired[1], retired[0])
+        return True
+
+    def _lease(self, handle):
+        self._leases[handle.name] = self._leases.get(handle.name, 0) + 1
+        return handle
+
+    def _retire(self, client, handle) -> None:
+        if self._leases.get(handle.name):
+            self._retired[handle.name] = (handle, client)
+        else:
+            self._schedule_delete(client, handle)
+
+    async def sweep(self) -> int:
+        """
+        Removes expired entries and deletes their files (leased ones once released).
+
+        Returns:
+            int: The number of entries removed.
+        """
+        now = self._clock()
+        expired = [key for key, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            handle, owner, _ = self._entries.pop(key)
+            if self._leases.get(handle.name):
+                self._retired[handle.name] = (handle, owner)
+            else:
+                await delete_design_file(owner, handle.name)
+        return len(expired)
+
+    async def run_sweeper(self, interval: float = DESIGN_FILE_CACHE_SWEEP_SECONDS) -> None:
+        """
+        Periodically sweeps expired entries. Meant to run as a long-lived task for the app's lifetime.
+
+        Args:
+            interval (float, optional): Seconds between sweeps.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.sweep()
+
+    async def clear(self) -> None:
+        """
+        Deletes every cached file and empties the cache. Called on shutdown.
+        """
+        entries = [*self._entries.values(), *((handle, owner, None) for handle, owner in self._retired.values())]
+        self._entries.clear()
+        self._retired.clear()
+        self._leases.clear()
+        for handle, owner, _ in entries:
+            await delete_design_file(owner, handle.name)
+        if self._delete_tasks:
+            await asyncio.gather(*self._delete_tasks, return_exceptions=True)
+
+    def _schedule_delete(self, client, handle) -> None:
+        task = asyncio.get_running_loop().create_task(delete_design_file(client, handle.name))
+        self._delete_tasks.add(task)
+        task.add_done_callback(self._delete_tasks.discard)
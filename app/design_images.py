@@ -0,0 +1,274 @@
+"""
+Normalization of design images before they are sent to the model.
+
+Designers export full-resolution (often 4K) PNGs, which Gemini downsamples internally anyway: the
+extra pixels only cost upload time and image tokens. Before a design file is inlined or uploaded (see
+`app.design_files`), `DesignImageProcessor` turns it into the images actually sent:
+
+1. Images wider than `DESIGN_IMAGE_MAX_WIDTH` are downscaled to that width (aspect ratio kept).
+2. Full-page screenshots taller than `DESIGN_IMAGE_TILE_HEIGHT` are split into tiles of equal height,
+   top to bottom, so each keeps a legible resolution instead of being squashed into one image. Pages
+   needing more than `DESIGN_IMAGE_MAX_TILES` tiles are downscaled further to fit.
+3. The images are re-encoded in `DESIGN_IMAGE_FORMAT` ("keep" keeps the source format; "webp" or
+   "jpeg" are far smaller than PNG screenshots at `DESIGN_IMAGE_QUALITY`).
+
+Images that need none of this (or that would only grow) are sent unchanged. Decoding and resizing is
+CPU-bound, so it runs in a process pool (`DESIGN_IMAGE_WORKERS`) and never blocks the event loop; only
+the image header is read in the request's process, to skip the pool for images that are already small.
+Results are kept in an LRU keyed by the SHA-256 of the source bytes, so repeat uploads cost nothing,
+and concurrent requests for the same image share one processing run.
+
+Processing requires Pillow. Without it (or for formats Pillow cannot decode, e.g. HEIC without a
+plugin) design files are sent as received.
+"""
+
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from .design_files import design_file_hash
+from .singleflight import SingleFlight
+from .tokens import image_tokens
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DESIGN_IMAGE_PROCESSING = os.getenv("DESIGN_IMAGE_PROCESSING", "true").lower() == "true"
+# Width suited to desktop analysis; wider designs are downscaled. 0 disables downscaling.
+DESIGN_IMAGE_MAX_WIDTH = int(os.getenv("DESIGN_IMAGE_MAX_WIDTH", "1440"))
+# Taller images are split into tiles of at most this height. 0 disables tiling.
+DESIGN_IMAGE_TILE_HEIGHT = int(os.getenv("DESIGN_IMAGE_TILE_HEIGHT", "4096"))
+DESIGN_IMAGE_MAX_TILES = int(os.getenv("DESIGN_IMAGE_MAX_TILES", "8"))
+# keep, png, jpeg or webp
+DESIGN_IMAGE_FORMAT = os.getenv("DESIGN_IMAGE_FORMAT", "keep").lower()
+DESIGN_IMAGE_QUALITY = int(os.getenv("DESIGN_IMAGE_QUALITY", "85"))
+# Processes decoding and resizing images. 0 processes them in a thread of the service process instead.
+DESIGN_IMAGE_WORKERS = int(os.getenv("DESIGN_IMAGE_WORKERS", "2"))
+# Number of processed images kept for repeat uploads. 0 disables the cache.
+DESIGN_IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("DESIGN_IMAGE_CACHE_MAX_ENTRIES", "64"))
+
+_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+@dataclass(frozen=True)
+class DesignImageSettings:
+    """
+    How design images are normalized (see the module docstring).
+    """
+    max_width: int = DESIGN_IMAGE_MAX_WIDTH
+    tile_height: int = DESIGN_IMAGE_TILE_HEIGHT
+    max_tiles: int = DESIGN_IMAGE_MAX_TILES
+    format: str = DESIGN_IMAGE_FORMAT
+    quality: int = DESIGN_IMAGE_QUALITY
+
+    @property
+    def fingerprint(self) -> str:
+        return f"design={self.max_width}:{self.tile_height}:{self.max_tiles}:{self.format}:{self.quality}"
+
+
+@dataclass
+class DesignImage:
+    """
+    The images sent to the model for one design file.
+
+    Attributes:
+        images: (content, MIME type) of each image, top to bottom. A single entry unless the design was tiled.
+        source_bytes: Size of the design file as received.
+        source_tokens: Estimated image tokens of the design file as received.
+        tokens: Estimated image tokens of `images`.
+    """
+    images: list[tuple[bytes, str]]
+    source_bytes: int
+    source_tokens: int
+    tokens: int
+
+    @property
+    def bytes(self) -> int:
+        return sum(len(content) for content, _ in self.images)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.source_bytes - self.bytes
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.source_tokens - self.tokens
+
+
+def _unchanged(content: bytes, mime_type: str, size: tuple[int, int] | None) -> DesignImage:
+    tokens = image_tokens(*size) if size else image_tokens()
+    return DesignImage(images=[(content, mime_type)], source_bytes=len(content), source_tokens=tokens, tokens=tokens)
+
+
+def _target_size(width: int, height: int, settings: DesignImageSettings) -> tuple[int, int, int]:
+    """
+    Returns the scaled width and height of an image and its number of tiles.
+    """
+    scale = min(1.0, settings.max_width / width) if settings.max_width > 0 else 1.0
+    tiles = 1
+    if settings.tile_height > 0:
+        tiles = math.ceil(height * scale / settings.tile_height)
+        if tiles > settings.max_tiles > 0:
+            scale = min(scale, settings.max_tiles * settings.tile_height / height)
+            tiles = settings.max_tiles
+    return max(1, round(width * scale)), max(1, round(height * scale)), max(1, tiles)
+
+
+def image_size(content: bytes) -> tuple[int, int] | None:
+    """
+    Reads the width and height of an image from its header, without decoding it.
+
+    Returns:
+        tuple[int, int] | None: The size, or None without Pillow or for an image it cannot read.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def needs_processing(size: tuple[int, int], mime_type: str, settings: DesignImageSettings) -> bool:
+    """
+    Checks whether an image of this size and type would be resized, tiled or converted.
+    """
+    if settings.format in _FORMATS and _FORMATS[settings.format][1] != mime_type:
+        return True
+    return _target_size(*size, settings) != (*size, 1)
+
+
+def normalize_design_image(content: bytes, mime_type: str, settings: DesignImageSettings) -> DesignImage:
+    """
+    Downscales, tiles and re-encodes a design image. CPU-bound: runs in the processor's worker processes.
+
+    Args:
+        content (bytes): The design file bytes.
+        mime_type (str): Its (sniffed) MIME type.
+        settings (DesignImageSettings): The normalization settings.
+
+    Returns:
+        DesignImage: The images to send. The design file itself when it cannot be decoded, needs no
+        change, or its re-encoding would be larger.
+    """
+    if Image is None:
+        return _unchanged(content, mime_type, None)
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            source_size = image.size
+            width, height, tiles = _target_size(*source_size, settings)
+            image_format, output_type = _FORMATS.get(settings.format) or _FORMATS.get((image.format or "").lower(), (None, None))
+            if image_format is None or ((width, height, tiles) == (*source_size, 1) and output_type == mime_type):
+                return _unchanged(content, mime_type, source_size)
+            if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+                image = image.convert("RGBA")
+            if (width, height) != source_size:
+                image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+            images = []
+            tile_height = math.ceil(height / tiles)
+            for top in range(0, height, tile_height):
+                tile = image.crop((0, top, width, min(height, top + tile_height)))
+                buffer = io.BytesIO()
+                tile.save(buffer, format=image_format, **({"optimize": True} if image_format == "PNG" else {"quality": settings.quality}))
+                images.append((buffer.getvalue(), output_type))
+    except Exception as e:
+        logging.warning(f"Design image left unchanged: {e}")
+        return _unchanged(content, mime_type, None)
+
+    result = DesignImage(images=images, source_bytes=len(content), source_tokens=image_tokens(*source_size),
+                         tokens=sum(image_tokens(width, min(tile_height, height - top)) for top in range(0, height, tile_height)))
+    if len(images) == 1 and result.bytes >= len(content) and (width, height) == source_size:
+        return _unchanged(content, mime_type, source_size)
+    return result
+
+
+class DesignImageProcessor:
+    """
+    Normalizes design images in a process pool, with an LRU of results keyed by the source's SHA-256.
+
+    Attributes:
+        enabled: Whether images are processed at all.
+        settings: The normalization settings.
+        workers: Size of the process pool (0 = a thread of this process).
+        max_entries: Maximum number of cached results. 0 disables caching.
+    """
+
+    def __init__(self, enabled: bool = DESIGN_IMAGE_PROCESSING, settings: DesignImageSettings | None = None, workers: int = DESIGN_IMAGE_WORKERS,
+                 max_entries: int = DESIGN_IMAGE_CACHE_MAX_ENTRIES):
+        self.enabled = enabled and Image is not None
+        self.settings = settings or DesignImageSettings()
+        self.workers = workers
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, DesignImage] = OrderedDict()
+        self._inflight = SingleFlight()
+        self._executor: ProcessPoolExecutor | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the processing for result cache keys.
+        """
+        return self.settings.fingerprint if self.enabled else "design=raw"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def process(self, content: bytes, mime_type: str) -> DesignImage:
+        """
+        Returns the images to send for a design file.
+
+        Args:
+            content (bytes): The design file bytes.
+            mime_type (str): Its (sniffed) MIME type.
+
+        Returns:
+            DesignImage: The processed (or unchanged) images, with the bytes and tokens saved.
+        """
+        if not self.enabled:
+            return _unchanged(content, mime_type, None)
+        key = design_file_hash(content)
+        cached = self._entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return cached
+        self.misses += 1
+        result = await self._inflight.do(key, lambda: self._normalize(content, mime_type))
+        if self.max_entries > 0:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    async def _normalize(self, content: bytes, mime_type: str) -> DesignImage:
+        size = image_size(content)
+        if size is None or not needs_processing(size, mime_type, self.settings):
+            return _unchanged(content, mime_type, size)
+        if self.workers <= 0:
+            return await asyncio.to_thread(normalize_design_image, content, mime_type, self.settings)
+        if self._executor is None:
+            # Spawned workers do not inherit the service's threads and sockets
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return await asyncio.get_running_loop().run_in_executor(self._executor, normalize_design_image, content, mime_type, self.settings)
+
+    def close(self) -> None:
+        """
+        Shuts the process pool down. It is started again on the next image.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,184 @@
+"""
+Local fake of the Gemini REST API for benchmarks: `python -m app.fake_gemini [--port 8089] [options]`.
+
+Serves the endpoints the service uses, in the shapes the `google-genai` SDK expects:
+
+    POST   /{version}/models/{model}:generateContent        JSON response
+    POST   /{version}/models/{model}:streamGenerateContent  Server-Sent Events (`alt=sse`)
+    POST   /upload/{version}/files                          resumable upload start
+    POST   /fake-upload/{id}                                upload chunks / finalize
+    DELETE /{version}/files/{id}                            delete an uploaded file
+    GET    /stats                                           calls served, by endpoint and outcome
+
+Point the service at it with `GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:8089` (any `GEMINI_API_KEY`).
+
+Latency is drawn from a log-normal distribution around `latency_ms` (`latency_sigma` controls the tail),
+a fraction `error_rate` of generation calls fail with `error_status`, and the response carries
+`findings` findings per category, which sets its size. Responses always validate against
+`WebpageAnalysisResponse`.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+from collections import defaultdict
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeGeminiConfig:
+    """
+    Behaviour of the fake server.
+
+    Attributes:
+        latency_ms: Median latency of a generation call.
+        latency_sigma: Log-normal sigma of the latency (0 = constant, 0.5 = moderate tail, 1 = heavy tail).
+        stream_chunks: Number of chunks a streamed response is split into (sent over the same latency).
+        upload_ms: Latency of each upload request (start and finalize).
+        delete_ms: Latency of a file deletion.
+        error_rate: Fraction of generation calls answered with `error_status`.
+        error_status: HTTP status of failed calls (429 or 5xx exercise the service's retries).
+        findings: Findings per category in the response, which sets its size.
+        seed: Random seed, so runs are repeatable.
+    """
+    latency_ms: float = 800.0
+    latency_sigma: float = 0.3
+    stream_chunks: int = 20
+    upload_ms: float = 150.0
+    delete_ms: float = 50.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    findings: int = 5
+    seed: int = 0
+
+
+def analysis_text(findings: int) -> str:
+    """
+    Returns a `WebpageAnalysisResponse` JSON document with `findings` findings per category.
+    """
+    def finding(category: str, index: int) -> dict:
+        return {"Section": f"Section {index}", "Issue": f"{category} issue {index}", "Details": "Details of the issue. " * 4,
+                "Code": f"<div class=\"item-{index}\">Example</div>", "Recommended Fix": "Apply the recommended change."}
+
+    categories = ["Content Discrepancies", "Styling Discrepancies", "Intentional Flaws And Known Issues", "Functional Discrepancies"]
+    report = {"Summary": "Fake summary.", "Key Findings": [{"Issue": "Fake issue", "Recommended Fix": "Fake fix"}]}
+    return json.dumps({
+        "Executive Summary": "Fake analysis generated by the benchmark server.",
+        "Detailed Analysis": {category: {"Summary": f"{category} summary.", "Findings": [finding(category, index) for index in range(findings)]} for category in categories},
+        "Non-LLM Evaluations": {"Accessibility Report": report, "Performance Report": report, "Validation Report": report,
+                                "Layout Report": {"Summary": "Fake layout summary.", "Recommended Fix": "Fake fix"}},
+        "Other Issues": [],
+    })
+
+
+def create_app(config: FakeGeminiConfig | None = None) -> FastAPI:
+    """
+    Builds the fake server's app.
+
+    Args:
+        config (FakeGeminiConfig | None, optional): Its behaviour. Defaults to `FakeGeminiConfig()`.
+
+    Returns:
+        FastAPI: The app; `app.state.stats` counts the calls served.
+    """
+    config = config or FakeGeminiConfig()
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    file_ids = itertools.count(1)
+    stats: dict[str, int] = defaultdict(int)
+    app.state.stats = stats
+    app.state.config = config
+
+    def latency() -> float:
+        if config.latency_sigma <= 0:
+            return config.latency_ms / 1000
+        return config.latency_ms / 1000 * math.exp(rng.gauss(0, config.latency_sigma))
+
+    def usage(body: bytes, text: str) -> dict:
+        return {"promptTokenCount": len(body) // 4, "candidatesTokenCount": len(text) // 4, "totalTokenCount": (len(body) + len(text)) // 4}
+
+    def error() -> JSONResponse:
+        return JSONResponse(status_code=config.error_status, content={"error": {"code": config.error_status, "message": "Injected fake error", "status": "UNAVAILABLE"}})
+
+    @app.post("/{version}/models/{model_action}")
+    async def models(version: str, model_action: str, request: Request):
+        model, _, action = model_action.partition(":")
+        body = await request.body()
+        if rng.random() < config.error_rate:
+            stats[f"{action}:error"] += 1
+            await asyncio.sleep(latency() / 4)
+            return error()
+        text = analysis_text(config.findings)
+        if action == "generateContent":
+            await asyncio.sleep(latency())
+            stats[f"{action}:ok"] += 1
+            return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+                    "usageMetadata": usage(body, text), "modelVersion": model}
+        if action == "streamGenerateContent":
+            stats[f"{action}:ok"] += 1
+            total = latency()
+
+            async def events():
+                size = math.ceil(len(text) / max(1, config.stream_chunks))
+                for start in range(0, len(text), size):
+                    await asyncio.sleep(total / max(1, config.stream_chunks))
+                    chunk = {"candidates": [{"content": {"parts": [{"text": text[start:start + size]}], "role": "model"}}], "modelVersion": model}
+                    if start + size >= len(text):
+                        chunk["candidates"][0]["finishReason"] = "STOP"
+                        chunk["usageMetadata"] = usage(body, text)
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return JSONResponse(status_code=404, content={"error": {"code": 404, "message": f"Unsupported action {action}", "status": "NOT_FOUND"}})
+
+    @app.post("/upload/{version}/files")
+    async def start_upload(version: str, request: Request):
+        await asyncio.sleep(config.upload_ms / 1000)
+        stats["upload:start"] += 1
+        file_id = next(file_ids)
+        return Response(content="{}", media_type="application/json",
+                        headers={"x-goog-upload-url": f"{request.base_url}fake-upload/{file_id}", "x-goog-upload-status": "active"})
+
+    @app.post("/fake-upload/{file_id}")
+    async def upload_chunk(file_id: int, request: Request):
+        body = await request.body()
+        if "finalize" not in request.headers.get("x-goog-upload-command", ""):
+            return Response(content="{}", media_type="application/json", headers={"x-goog-upload-status": "active"})
+        await asyncio.sleep(config.upload_ms / 1000)
+        stats["upload:finalize"] += 1
+        name = f"files/fake-{file_id}"
+        file = {"name": name, "uri": f"{request.base_url}v1beta/{name}", "mimeType": request.headers.get("content-type", "image/png"),
+                "sizeBytes": str(len(body)), "state": "ACTIVE"}
+        return JSONResponse(content={"file": file}, headers={"x-goog-upload-status": "final"})
+
+    @app.delete("/{version}/files/{file_id}")
+    async def delete_file(version: str, file_id: str):
+        await asyncio.sleep(config.delete_ms / 1000)
+        stats["files:delete"] += 1
+        return {}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Runs a fake Gemini API server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    defaults = FakeGeminiConfig()
+    for name, value in vars(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    config = FakeGeminiConfig(**{name: getattr(args, name) for name in vars(defaults)})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,134 @@
+"""
+Per-category fan-out of one analysis.
+
+A single generation call writes every section of `WebpageAnalysisResponse` one after another, so its
+latency grows with the total output length. In fan-out mode the sections are requested by concurrent,
+smaller calls instead, one per `FANOUT_JOBS` entry, each constrained to a sub-schema built from the
+fields of `app/models.py`. `run_fanout` assembles the partial outputs into one response; the Executive
+Summary is synthesized from the category summaries.
+
+Every call still carries the full inputs, so fan-out trades extra input tokens for wall-clock time.
+A failed call only loses its own sections: they are returned as null and reported to the caller.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel, Field, create_model
+
+from .models import WebpageAnalysisResponse, DetailedAnalysis
+
+ANALYSIS_FANOUT = os.getenv("ANALYSIS_FANOUT", "false").lower() == "true"
+# Maximum number of category calls of one analysis running at the same time
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+
+DETAILED_ANALYSIS = "Detailed Analysis"
+NON_LLM_EVALUATIONS = "Non-LLM Evaluations"
+
+# Job name -> the sections it generates, by alias
+FANOUT_JOBS: dict[str, tuple[str, ...]] = {
+    "content": ("Content Discrepancies",),
+    "styling": ("Styling Discrepancies",),
+    "intentional": ("Intentional Flaws And Known Issues",),
+    "functional": ("Functional Discrepancies", "Other Issues"),
+}
+# Only requested when the model writes the "Non-LLM Evaluations" section
+EVALUATIONS_JOB = "evaluations"
+
+_DETAILED_ALIASES = {field.alias for field in DetailedAnalysis.model_fields.values()}
+
+
+def _section_schema(name: str, aliases: tuple[str, ...]) -> type[BaseModel]:
+    fields = {}
+    for alias in aliases:
+        source = DetailedAnalysis if alias in _DETAILED_ALIASES else WebpageAnalysisResponse
+        attribute, field = next((attribute, field) for attribute, field in source.model_fields.items() if field.alias == alias)
+        default = {"default_factory": field.default_factory} if field.default_factory else {"default": None}
+        fields[attribute] = (field.annotation, Field(alias=alias, **default))
+    return create_model(f"{name.capitalize()}Sections", **fields)
+
+
+FANOUT_SCHEMAS: dict[str, type[BaseModel]] = {name: _section_schema(name, aliases) for name, aliases in FANOUT_JOBS.items()}
+FANOUT_SCHEMAS[EVALUATIONS_JOB] = _section_schema(EVALUATIONS_JOB, (NON_LLM_EVALUATIONS,))
+
+
+def fanout_focus(job: str) -> str:
+    """
+    Names the sections a job generates, for the prompt.
+
+    Args:
+        job (str): A `FANOUT_SCHEMAS` key.
+
+    Returns:
+        str: e.g. '"Functional Discrepancies" and "Other Issues"'.
+    """
+    aliases = FANOUT_JOBS.get(job, (NON_LLM_EVALUATIONS,))
+    return " and ".join(f'"{alias}"' for alias in aliases)
+
+
+def _executive_summary(detailed: dict) -> str | None:
+    summaries = [f"{alias}: {section['Summary'].strip()}" for alias, section in detailed.items() if section and section.get("Summary")]
+    return " ".join(summaries) or None
+
+
+def assemble(parts: dict[str, BaseModel]) -> WebpageAnalysisResponse:
+    """
+    Assembles the partial outputs of the fan-out jobs into one response.
+
+    Args:
+        parts (dict[str, BaseModel]): Validated job outputs by job name. Failed jobs are left out.
+
+    Returns:
+        WebpageAnalysisResponse: The combined analysis. Sections of failed jobs are null (or empty).
+    """
+    detailed = {}
+    response = {}
+    for part in parts.values():
+        for alias, value in part.model_dump(mode="json", by_alias=True).items():
+            if alias in _DETAILED_ALIASES:
+                detailed[alias] = value
+            else:
+                response[alias] = value
+    response[DETAILED_ANALYSIS] = detailed or None
+    response["Executive Summary"] = _executive_summary(detailed)
+    return WebpageAnalysisResponse.model_validate(response)
+
+
+async def run_fanout(jobs: list[str], generate: Callable[[str, type[BaseModel]], Awaitable[BaseModel]], concurrency: int = FANOUT_CONCURRENCY) -> tuple[WebpageAnalysisResponse, list[str]]:
+    """
+    Runs the category jobs concurrently with bounded fan-out and assembles the results.
+
+    Args:
+        jobs (list[str]): The `FANOUT_SCHEMAS` keys to run.
+        generate (Callable[[str, type[BaseModel]], Awaitable[BaseModel]]): Runs one generation call for a job,
+            given its name and response schema, and returns its output validated as that schema.
+        concurrency (int, optional): Maximum number of jobs running at the same time.
+
+    Returns:
+        tuple[WebpageAnalysisResponse, list[str]]: The assembled response and the names of failed jobs.
+
+    Raises:
+        Exception: The first job's error if every job failed.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(job: str) -> BaseModel:
+        async with semaphore:
+            return await generate(job, FANOUT_SCHEMAS[job])
+
+    results = await asyncio.gather(*(bounded(job) for job in jobs), return_exceptions=True)
+    parts = {}
+    failed = []
+    for job, result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            logging.error(f"Fan-out job {job} failed: {result}")
+            failed.append(job)
+        else:
+            parts[job] = result
+    if not parts:
+        raise next(result for result in results if isinstance(result, Exception))
+    return assemble(parts), failed
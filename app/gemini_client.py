@@ -1,19 +1,27 @@
 """
-Module to initialize and provide access to a Gemini (Google GenAI) client.
+Module to initialize and provide access to the Gemini (Google GenAI) clients.
 
 This module attempts to:
 1. Load environment variables from a `.env` file located one directory above the current file.
-2. Import the `google.genai` package and initialize a `genai.Client` using the `GEMINI_API_KEY` from the environment.
+2. Import the `google.genai` package and initialize one `genai.Client` per configured credential:
+   every key of `GEMINI_API_KEYS` (comma-separated, falling back to `GEMINI_API_KEY`) and every Vertex AI
+   project of `GOOGLE_CLOUD_PROJECTS` (in `GOOGLE_CLOUD_LOCATION`).
+3. Put their async surfaces (`client.aio`) in a `ClientPool` (see `app.client_pool`), so requests are
+   spread over several quotas.
 
-If the required package is not installed, `client` is set to `None`, allowing the rest of the application to handle it gracefully.
+If the required package is not installed, the pool is empty, allowing the rest of the application to
+handle it gracefully.
 
 Usage:
     from your_module import get_client
-    model = get_client()
+    with get_client() as lease:
+        response = await lease.models.generate_content(model=..., contents=...)
 """
 
 import os
 
+from .client_pool import ClientPool, ClientLease
+
 try:
     from dotenv import load_dotenv
     import google.genai as genai
@@ -21,17 +29,36 @@ try:
     # Load environment variables from the parent directory's .env file
     load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-    # Initialize the Gemini client using the API key from .env
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    api_keys = [key.strip() for key in os.getenv("GEMINI_API_KEYS", os.getenv("GEMINI_API_KEY") or "").split(",") if key.strip()]
+    projects = [project.strip() for project in os.getenv("GOOGLE_CLOUD_PROJECTS", "").split(",") if project.strip()]
+    location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
+
+    # Initialize one Gemini client per API key / project. Names never include the key itself.
+    clients = [genai.Client(api_key=key) for key in api_keys]
+    clients += [genai.Client(vertexai=True, project=project, location=location) for project in projects]
+    names = [f"key-{index + 1}" for index in range(len(api_keys))] + [f"project-{project}" for project in projects]
+    if not clients:
+        # Keep the previous behaviour: the SDK reads its own environment variables
+        clients, names = [genai.Client(api_key=os.getenv("GEMINI_API_KEY"))], ["key-1"]
+    client_pool = ClientPool([client.aio for client in clients], names)
 except ImportError:
-    # If dependencies are missing, client is set to None
-    client = None  # Or raise an error if strict dependency enforcement is needed
+    # If dependencies are missing, the pool is empty
+    client_pool = ClientPool([])
+
+
+def get_client_pool() -> ClientPool:
+    """
+    Returns the pool of initialized Gemini clients (empty if dependencies were not met).
+    """
+    return client_pool
+
 
-def get_client():
+def get_client() -> ClientLease | None:
     """
-    Returns the initialized Gemini (Google GenAI) client.
+    Leases the least-loaded healthy Gemini client of the pool.
 
     Returns:
-        genai.Client | None: The initialized Gemini client if available, or None if dependencies were not met.
+        ClientLease | None: A lease forwarding to the async Gemini client (`client.aio`), to be released
+        when done, or None if dependencies were not met.
     """
-    return client
+    return client_pool.lease() if len(client_pool) else None
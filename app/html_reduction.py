@@ -0,0 +1,271 @@
+"""
+HTML reduction applied to `htmlText` before it is embedded in the prompt.
+
+Real pages carry large payloads that add nothing to a UI analysis but are billed as input tokens:
+inline `<script>` bundles, base64 data URIs, SVG path data, comments and indentation. `HtmlReducer`
+removes or elides them in a single streaming pass over the document (`html.parser.HTMLParser` fed in
+chunks). Markup that is kept is copied through verbatim.
+
+Elided payloads are replaced by placeholders such as `__ELIDED_1c9a03fe_3__`, namespaced with a
+nonce derived from the page's content so text the page itself contains is never mistaken for one.
+The originals are kept in `ReductionResult.elided`, so `Code` snippets returned by the model can be
+mapped back to the original HTML with `ReductionResult.restore`.
+
+The enabled steps are configured with `HTML_REDUCTION` (comma separated, default all):
+    scripts     Elide inline `<script>` bodies.
+    data_uris   Elide `data:` URIs in attributes and inline CSS.
+    svg_paths   Elide the `d` attribute of SVG `<path>` elements.
+    comments    Drop HTML comments.
+    whitespace  Collapse whitespace runs outside `<pre>` and `<textarea>`.
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+
+from .models import WebpageAnalysisResponse
+from .tokens import estimate_tokens
+
+REDUCTION_STEPS = ("scripts", "data_uris", "svg_paths", "comments", "whitespace")
+HTML_REDUCTION = os.getenv("HTML_REDUCTION", ",".join(REDUCTION_STEPS))
+# Payloads shorter than this are left in place; a placeholder would not save anything
+HTML_REDUCTION_MIN_ELIDE_CHARS = int(os.getenv("HTML_REDUCTION_MIN_ELIDE_CHARS", "64"))
+
+PLACEHOLDER_PATTERN = re.compile(r"__ELIDED_([0-9a-f]+)_(\d+)__")
+_DATA_URI_PATTERN = re.compile(r"data:[^\"'()\s>]+")
+_SVG_PATH_D_PATTERN = re.compile(r"(\sd\s*=\s*)([\"'])(.*?)\2", re.DOTALL)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+_FEED_CHUNK_CHARS = 64 * 1024
+
+
+def _collapse_whitespace(text: str) -> str:
+    return _WHITESPACE_PATTERN.sub(lambda m: "\n" if "\n" in m.group() else " ", text)
+
+
+@dataclass
+class ReductionResult:
+    """
+    Output of `HtmlReducer.reduce`.
+
+    Attributes:
+        html: The reduced HTML to embed in the prompt.
+        original_chars: Length of the input HTML.
+        original_tokens: Estimated token count of the input HTML.
+        elided: Original payloads keyed by placeholder id.
+        nonce: Namespace of this document's placeholders.
+    """
+    html: str
+    original_chars: int
+    original_tokens: int
+    elided: dict[int, str] = field(default_factory=dict)
+    nonce: str = ""
+
+    @property
+    def chars_saved(self) -> int:
+        return self.original_chars - len(self.html)
+
+    @property
+    def bytes_saved(self) -> int:
+        # HTML is overwhelmingly ASCII; chars are a close proxy for UTF-8 bytes
+        return self.chars_saved
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - estimate_tokens(self.html))
+
+    def restore(self, snippet: str | None) -> str | None:
+        """
+        Replaces placeholders in a snippet with the payloads they stand for.
+
+        Args:
+            snippet (str | None): Text that may contain placeholders, e.g. a finding's `Code`.
+
+        Returns:
+            str | None: The snippet with original payloads restored.
+        """
+        if not snippet or not self.elided:
+            return snippet
+        return PLACEHOLDER_PATTERN.sub(lambda m: self.elided.get(int(m.group(2)), m.group()) if m.group(1) == self.nonce else m.group(), snippet)
+
+    def restore_json(self, value):
+        """
+        Restores placeholders in every "Code" member of a JSON-like value (e.g. a streamed section).
+
+        Args:
+            value: Decoded JSON (dicts, lists and scalars).
+
+        Returns:
+            The value with `Code` snippets restored.
+        """
+        if not self.elided:
+            return value
+        if isinstance(value, list):
+            return [self.restore_json(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.restore(item) if key == "Code" and isinstance(item, str) else self.restore_json(item) for key, item in value.items()}
+        return value
+
+    def restore_response(self, response: WebpageAnalysisResponse) -> WebpageAnalysisResponse:
+        """
+        Restores placeholders in every `Code` field of an analysis response, in place.
+
+        Args:
+            response (WebpageAnalysisResponse): The validated model output.
+
+        Returns:
+            WebpageAnalysisResponse: The same response, for chaining.
+        """
+        if not self.elided:
+            return response
+        findings = list(response.Other_Issues)
+        if response.Detailed_Analysis is not None:
+            for category in (
+                response.Detailed_Analysis.Content_Discrepancies,
+                response.Detailed_Analysis.Styling_Discrepancies,
+                response.Detailed_Analysis.Functional_Discrepancies,
+            ):
+                if category is not None:
+                    findings.extend(category.Findings)
+        for finding in findings:
+            finding.Code = self.restore(finding.Code)
+        return response
+
+
+class _ReducingParser(HTMLParser):
+    def __init__(self, steps: frozenset, min_elide_chars: int, nonce: str):
+        super().__init__(convert_charrefs=False)
+        self.steps = steps
+        self.min_elide_chars = min_elide_chars
+        self.nonce = nonce
+        self.out: list[str] = []
+        self.elided: dict[int, str] = {}
+        self._preserve_depth = 0
+        self._endtag_index: int | None = None
+
+    def _elide(self, payload: str) -> str:
+        if len(payload) < self.min_elide_chars:
+            return payload
+        placeholder_id = len(self.elided) + 1
+        self.elided[placeholder_id] = payload
+        return f"__ELIDED_{self.nonce}_{placeholder_id}__"
+
+    def _reduce_tag(self, tag: str, raw: str) -> str:
+        if "data_uris" in self.steps and "data:" in raw:
+            raw = _DATA_URI_PATTERN.sub(lambda m: self._elide(m.group()), raw)
+        if "svg_paths" in self.steps and tag == "path":
+            raw = _SVG_PATH_D_PATTERN.sub(lambda m: m.group(1) + m.group(2) + self._elide(m.group(3)) + m.group(2), raw)
+        return raw
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        self.out.append(self._reduce_tag(tag, self.get_starttag_text()))
+
+    def handle_startendtag(self, tag, attrs):
+        self.out.append(self._reduce_tag(tag, self.get_starttag_text()))
+
+    def parse_endtag(self, i):
+        # `handle_endtag` only gets the lowercased name; swap in the end tag as written, like
+        # `get_starttag_text` does for start tags
+        self._endtag_index = None
+        end = super().parse_endtag(i)
+        if end > i and self._endtag_index is not None:
+            self.out[self._endtag_index] = self.rawdata[i:end]
+        return end
+
+    def handle_endtag(self, tag):
+        if tag in _PRESERVE_WHITESPACE_TAGS and self._preserve_depth:
+            self._preserve_depth -= 1
+        self._endtag_index = len(self.out)
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.cdata_elem == "script":
+            if "scripts" in self.steps and data.strip():
+                data = self._elide(data)
+        elif self.cdata_elem == "style":
+            if "data_uris" in self.steps and "data:" in data:
+                data = _DATA_URI_PATTERN.sub(lambda m: self._elide(m.group()), data)
+            if "whitespace" in self.steps:
+                data = _collapse_whitespace(data)
+        elif "whitespace" in self.steps and not self._preserve_depth:
+            data = _collapse_whitespace(data)
+        self.out.append(data)
+
+    def handle_entityref(self, name):
+        self.out.append(f"&{name};")
+
+    def handle_charref(self, name):
+        self.out.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        if "comments" not in self.steps:
+            self.out.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.out.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.out.append(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self.out.append(f"<![{data}]>")
+
+
+class HtmlReducer:
+    """
+    Configurable single-pass HTML reducer.
+
+    Attributes:
+        steps: The enabled reduction steps (see module docstring).
+        min_elide_chars: Minimum payload length worth replacing with a placeholder.
+    """
+
+    def __init__(self, steps: str | tuple = HTML_REDUCTION, min_elide_chars: int = HTML_REDUCTION_MIN_ELIDE_CHARS):
+        if isinstance(steps, str):
+            steps = [step.strip() for step in steps.split(",") if step.strip()]
+        unknown = set(steps) - set(REDUCTION_STEPS)
+        if unknown:
+            raise ValueError(f"Unknown HTML reduction steps: {', '.join(sorted(unknown))}")
+        self.steps = frozenset(steps)
+        self.min_elide_chars = min_elide_chars
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.steps)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the configuration, so cached results from a different configuration are not reused.
+        """
+        return ",".join(step for step in REDUCTION_STEPS if step in self.steps) + f":{self.min_elide_chars}"
+
+    def reduce(self, htmlText: str) -> ReductionResult:
+        """
+        Reduces an HTML document in one streaming pass.
+
+        Args:
+            htmlText (str): The original HTML.
+
+        Returns:
+            ReductionResult: The reduced HTML with the elided payloads and size statistics.
+        """
+        if not self.enabled:
+            return ReductionResult(html=htmlText, original_chars=len(htmlText), original_tokens=estimate_tokens(htmlText))
+        # A hash of the page cannot occur in the page, and keeps the reduced prompt deterministic
+        nonce = hashlib.sha256(htmlText.encode()).hexdigest()[:8]
+        parser = _ReducingParser(self.steps, self.min_elide_chars, nonce)
+        for start in range(0, len(htmlText), _FEED_CHUNK_CHARS):
+            parser.feed(htmlText[start:start + _FEED_CHUNK_CHARS])
+        parser.close()
+        return ReductionResult(
+            html="".join(parser.out),
+            original_chars=len(htmlText),
+            original_tokens=estimate_tokens(htmlText),
+            elided=parser.elided,
+            nonce=nonce,
+        )
@@ -0,0 +1,302 @@
+"""
+Incremental re-analysis of a resubmitted page against a previous analysis.
+
+Teams typically fix a few findings and resubmit the page. Instead of analyzing the whole page again, a
+request can reference a previous analysis (`previousAnalysis`: its id from `X-Analysis-Id`, or the
+SHA-256 of its `htmlText` from `X-Content-Hash`):
+
+1. Both pages are split into regions (the top-level children of `<body>`, larger ones split at their
+   children; see `app.chunking.html_regions`) and the region sequences are diffed (`diff_pages`).
+2. The previous findings are located in the previous page by their `Code` (`split_findings`). Findings
+   in unchanged regions, and page-level findings that cannot be located, are carried over; findings in
+   changed or removed regions are dropped.
+3. Only the changed regions (with the page's `<head>`) are sent to the model, together with the dropped
+   findings that touched them, so still-present issues are reported again and fixed ones disappear.
+4. The update is merged into the carried-over findings (`merge_incremental`).
+
+A re-analysis falls back to a full analysis when anything besides `htmlText` changed (specification,
+audits, design file, model or pipeline settings), when the page's `<head>` changed, or when more than
+`INCREMENTAL_MAX_CHANGED_RATIO` of the page changed. Recent inputs and results are kept in an `AnalysisHistory`, older ones are loaded
+from the persistent `app.analysis_store`.
+"""
+
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+
+from .chunking import html_regions, dedupe_findings
+from .models import WebpageAnalysisResponse, DetailedAnalysis
+
+# Target size of the regions pages are diffed in; smaller regions send less unchanged HTML along
+INCREMENTAL_REGION_CHARS = int(os.getenv("INCREMENTAL_REGION_CHARS", "2048"))
+# Pages that changed more than this (share of the new page's regions, by size) are analyzed in full
+INCREMENTAL_MAX_CHANGED_RATIO = float(os.getenv("INCREMENTAL_MAX_CHANGED_RATIO", "0.5"))
+# Number of past analyses kept as references. 0 disables incremental re-analysis.
+ANALYSIS_HISTORY_MAX_ENTRIES = int(os.getenv("ANALYSIS_HISTORY_MAX_ENTRIES", "64"))
+
+# Code lines shorter than this are too generic to locate a finding by
+_MIN_LOCATE_CHARS = 20
+
+
+def content_hash(htmlText: str) -> str:
+    """
+    Returns the hex SHA-256 of a page's HTML, by which an analysis can be referenced.
+    """
+    return hashlib.sha256(htmlText.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PreviousAnalysis:
+    """
+    A past analysis that later requests can be re-analyzed against.
+
+    Attributes:
+        id: Identifier returned in `X-Analysis-Id`.
+        content_hash: SHA-256 of `htmlText`.
+        context: Hash of every other input and setting that shaped the result (see `main.analysis_context`).
+        htmlText: The analyzed HTML.
+        result: The validated analysis.
+        specification: The request's specification.
+        url: Page URL sent with the request, if any.
+        label: Free-form label sent with the request, if any.
+        model: The model that produced the analysis.
+        request_key: The request's result cache key (see `analysis_cache_key`).
+        created_at: Unix timestamp of the analysis.
+    """
+    id: str
+    content_hash: str
+    context: str
+    htmlText: str
+    result: WebpageAnalysisResponse
+    specification: str | None = None
+    url: str | None = None
+    label: str | None = None
+    model: str | None = None
+    request_key: str | None = None
+    created_at: float = field(default_factory=time.time)
+
+
+class AnalysisHistory:
+    """
+    LRU of past analyses, referenced by id or by content hash (the latest analysis of that HTML).
+
+    Attributes:
+        max_entries: Maximum number of analyses kept. 0 disables the history.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_HISTORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, PreviousAnalysis] = OrderedDict()
+        self._by_hash: dict[str, str] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, htmlText: str, context: str, result: WebpageAnalysisResponse, **metadata) -> PreviousAnalysis:
+        """
+        Records an analysis.
+
+        Args:
+            htmlText (str): The analyzed HTML.
+            context (str): See `PreviousAnalysis.context`.
+            result (WebpageAnalysisResponse): The validated analysis.
+            **metadata: Other `PreviousAnalysis` fields (specification, url, label, model, request_key).
+
+        Returns:
+            PreviousAnalysis: The stored record, with its new id.
+        """
+        record = PreviousAnalysis(id=uuid.uuid4().hex, content_hash=content_hash(htmlText), context=context, htmlText=htmlText, result=result, **metadata)
+        self.put(record)
+        return record
+
+    def put(self, record: PreviousAnalysis) -> None:
+        """
+        Keeps a record, e.g. one loaded from `app.analysis_store`.
+        """
+        self._entries[record.id] = record
+        self._entries.move_to_end(record.id)
+        latest = self._entries.get(self._by_hash.get(record.content_hash, ""))
+        if latest is None or latest.created_at <= record.created_at:
+            self._by_hash[record.content_hash] = record.id
+        while len(self._entries) > self.max_entries:
+            _, old = self._entries.popitem(last=False)
+            if self._by_hash.get(old.content_hash) == old.id:
+                del self._by_hash[old.content_hash]
+
+    def records(self) -> list[PreviousAnalysis]:
+        """
+        Returns the kept analyses, least recently used first.
+        """
+        return list(self._entries.values())
+
+    def get(self, reference: str) -> PreviousAnalysis | None:
+        """
+        Returns the analysis with this id, or the latest analysis of the HTML with this content hash.
+        """
+        record = self._entries.get(reference) or self._entries.get(self._by_hash.get(reference, ""))
+        if record is not None:
+            self._entries.move_to_end(record.id)
+        return record
+
+
+def _normalize(text: str | None) -> str:
+    return " ".join((text or "").split())
+
+
+@dataclass
+class PageDiff:
+    """
+    Region-level difference between a previous page and its resubmission.
+
+    Attributes:
+        head: The new page's `<head>`, sent with the changed regions.
+        changed: Regions of the new page that are not in the previous one, in document order.
+        removed: Regions of the previous page that are not in the new one.
+        unchanged: Regions present in both.
+        total_chars: Size of the new page's regions.
+        head_changed: Whether the `<head>` (styles, scripts, metadata) changed, which may affect every region.
+    """
+    head: str
+    changed: list[str]
+    removed: list[str]
+    unchanged: list[str]
+    total_chars: int
+    head_changed: bool = False
+
+    @property
+    def changed_ratio(self) -> float:
+        return sum(len(region) for region in self.changed) / self.total_chars if self.total_chars else 1.0
+
+    @property
+    def regions(self) -> int:
+        return len(self.changed) + len(self.unchanged)
+
+    def html(self) -> str:
+        """
+        Returns the changed regions as one document, preceded by the page's `<head>`.
+        """
+        body = "\n<!-- ... unchanged regions omitted ... -->\n".join(self.changed)
+        return f"{self.head}\n<body>\n{body}\n</body>" if self.head else body
+
+
+def diff_pages(previous_html: str, html: str, max_chars: int = INCREMENTAL_REGION_CHARS) -> PageDiff:
+    """
+    Diffs two versions of a page region by region. Regions are compared with whitespace collapsed.
+
+    Args:
+        previous_html (str): The previously analyzed HTML.
+        html (str): The resubmitted HTML.
+        max_chars (int, optional): Target region size, see `app.chunking.html_regions`.
+
+    Returns:
+        PageDiff: The changed, removed and unchanged regions.
+    """
+    previous_head, previous_regions = html_regions(previous_html, max_chars)
+    head, regions = html_regions(html, max_chars)
+    matcher = SequenceMatcher(None, [_normalize(region) for region in previous_regions], [_normalize(region) for region in regions], autojunk=False)
+    changed, removed, unchanged = [], [], []
+    for tag, previous_start, previous_end, start, end in matcher.get_opcodes():
+        if tag == "equal":
+            unchanged.extend(regions[start:end])
+        else:
+            removed.extend(previous_regions[previous_start:previous_end])
+            changed.extend(regions[start:end])
+    return PageDiff(head=head, changed=changed, removed=removed, unchanged=unchanged, total_chars=sum(len(region) for region in regions),
+                    head_changed=_normalize(previous_head) != _normalize(head))
+
+
+def _touches_changes(finding, unchanged: str, removed: str) -> bool:
+    """
+    Whether a finding's code is found in the removed regions only. Findings without locatable code are
+    page-level and never touch the changes.
+    """
+    code = getattr(finding, "Code", None)
+    if not code or not code.strip():
+        return False
+    # Quoted code is often abbreviated; its longest line still locates it
+    candidates = [_normalize(code)]
+    longest_line = max((_normalize(line) for line in code.splitlines()), key=len)
+    if len(longest_line) >= _MIN_LOCATE_CHARS and longest_line != candidates[0]:
+        candidates.append(longest_line)
+    for candidate in candidates:
+        if candidate in unchanged:
+            return False
+        if candidate in removed:
+            return True
+    return False
+
+
+def split_findings(result: WebpageAnalysisResponse, diff: PageDiff) -> tuple[WebpageAnalysisResponse, dict]:
+    """
+    Separates the findings of a previous analysis into those carried over and those touching changes.
+
+    Args:
+        result (WebpageAnalysisResponse): The previous analysis.
+        diff (PageDiff): The difference between the previous and the resubmitted page.
+
+    Returns:
+        tuple[WebpageAnalysisResponse, dict]: The previous analysis without the findings in changed or
+        removed regions, and those findings by section ({"Content Discrepancies": [...], ...}, JSON-ready)
+        for the prompt.
+    """
+    unchanged = "\n".join(_normalize(region) for region in diff.unchanged)
+    removed = "\n".join(_normalize(region) for region in diff.removed)
+    carried = result.model_copy(deep=True)
+    touched: dict[str, list] = {}
+
+    def keep(section: str, findings: list) -> list:
+        kept = []
+        for finding in findings:
+            if _touches_changes(finding, unchanged, removed):
+                touched.setdefault(section, []).append(finding.model_dump(mode="json", by_alias=True, exclude_none=True))
+            else:
+                kept.append(finding)
+        return kept
+
+    if carried.Detailed_Analysis is not None:
+        for attribute, model_field in DetailedAnalysis.model_fields.items():
+            category = getattr(carried.Detailed_Analysis, attribute)
+            if category is not None:
+                category.Findings = keep(model_field.alias, category.Findings)
+    carried.Other_Issues = keep("Other Issues", carried.Other_Issues)
+    return carried, touched
+
+
+def merge_incremental(carried: WebpageAnalysisResponse, update: WebpageAnalysisResponse) -> WebpageAnalysisResponse:
+    """
+    Merges the analysis of the changed regions into the findings carried over from the previous analysis.
+
+    Findings are concatenated (carried first) and de-duplicated; summaries of the update replace the
+    previous ones where given. The "Non-LLM Evaluations" section is carried over, since the audits did not change.
+
+    Args:
+        carried (WebpageAnalysisResponse): The previous analysis without the findings touching changes.
+        update (WebpageAnalysisResponse): The analysis of the changed regions.
+
+    Returns:
+        WebpageAnalysisResponse: The merged analysis.
+    """
+    detailed = {}
+    for attribute, model_field in DetailedAnalysis.model_fields.items():
+        parts = [getattr(response.Detailed_Analysis, attribute) for response in (carried, update) if response.Detailed_Analysis is not None]
+        parts = [part for part in parts if part is not None]
+        if parts:
+            # Sub-models only accept their aliases ("Content Discrepancies", "Summary", ...)
+            detailed[model_field.alias] = type(parts[0]).model_validate({
+                "Summary": next((part.Summary for part in reversed(parts) if part.Summary), None),
+                "Findings": dedupe_findings([finding for part in parts for finding in part.Findings]),
+            })
+    return WebpageAnalysisResponse(
+        Executive_Summary=update.Executive_Summary or carried.Executive_Summary,
+        Detailed_Analysis=DetailedAnalysis.model_validate(detailed) if detailed else None,
+        Non_LLM_Evaluations=carried.Non_LLM_Evaluations,
+        Other_Issues=dedupe_findings([*carried.Other_Issues, *update.Other_Issues]),
+    )
@@ -0,0 +1,247 @@
+"""
+Streaming intake of the analysis forms, with limits enforced while the body is received.
+
+Starlette buffers every form field and spools every upload before the endpoint runs, so oversized or
+mistaken uploads used to be received in full, and only then rejected. `IntakeRoute` parses the form of
+routes with `IntakeLimits` itself and rejects a request (400) at the first offending chunk:
+
+- a `Content-Length` over `max_request_bytes` before anything is read, and a streamed body once it
+  passes that size,
+- text fields once their combined (decoded) characters exceed `text_chars` (`text_fields`, e.g.
+  htmlText + specification + webAuditResults) or `field_chars` (any other field),
+- a file in a field other than `file_fields`, or a file over `file_bytes`,
+- a file part whose declared content type is not `image/*` (as soon as its headers arrive), or whose
+  first bytes are not a supported image format (see `app.design_files.sniff_image_type`). The sniffed
+  type replaces the declared one, so the model is told the real format.
+
+Both `multipart/form-data` and `application/x-www-form-urlencoded` bodies are parsed incrementally.
+Routes without limits keep Starlette's parsing.
+"""
+
+from dataclasses import dataclass
+from urllib.parse import unquote_plus, unquote_to_bytes
+
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
+from starlette.datastructures import FormData, Headers
+from starlette.formparsers import MultiPartParser, FormParser, MultiPartException
+from python_multipart.multipart import parse_options_header
+
+from .design_files import sniff_image_type, IMAGE_SNIFF_BYTES
+from .metrics import record_error
+
+TOO_LARGE = "Files are too large"
+NOT_AN_IMAGE = "designFile must be an image"
+# UTF-8 continuation bytes, which do not start a character
+_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+
+@dataclass
+class IntakeLimits:
+    """
+    Limits of one route's form.
+
+    Attributes:
+        text_chars: Maximum combined characters of `text_fields`.
+        file_bytes: Maximum size of one file.
+        max_request_bytes: Maximum size of the whole body.
+        text_fields: Fields counted against `text_chars`.
+        file_fields: Fields that may carry a file; each must be a supported image.
+        field_chars: Maximum characters of any other field.
+    """
+    text_chars: int
+    file_bytes: int
+    max_request_bytes: int
+    text_fields: tuple[str, ...] = ("htmlText", "specification", "webAuditResults")
+    file_fields: tuple[str, ...] = ("designFile",)
+    field_chars: int = 1024
+
+
+class IntakeRejected(HTTPException):
+    """
+    A request rejected during intake (400, before the endpoint runs).
+    """
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
+
+def utf8_chars(data: bytes) -> int:
+    """
+    Counts the characters of a chunk of UTF-8 text. Exact across chunk boundaries, since only the bytes
+    that start a character are counted.
+    """
+    return len(data.translate(None, delete=_CONTINUATION_BYTES))
+
+
+class _TextBudget:
+    """
+    Counts the characters of text fields against the limits.
+    """
+
+    def __init__(self, limits: IntakeLimits):
+        self.limits = limits
+        self.combined = 0
+        self.fields: dict[str, int] = {}
+
+    def add(self, name: str, chars: int) -> None:
+        if name in self.limits.text_fields:
+            self.combined += chars
+            if self.combined > self.limits.text_chars:
+                raise IntakeRejected(TOO_LARGE)
+        else:
+            self.fields[name] = self.fields.get(name, 0) + chars
+            if self.fields[name] > self.limits.field_chars:
+                raise IntakeRejected(f"Field {name} is too large")
+
+
+class LimitedMultiPartParser(MultiPartParser):
+    """
+    `multipart/form-data` parser enforcing `IntakeLimits` and sniffing uploaded images.
+    """
+
+    def __init__(self, headers: Headers, stream, limits: IntakeLimits):
+        # Our own limits replace Starlette's per-part limit
+        super().__init__(headers, stream, max_part_size=max(limits.text_chars, limits.field_chars) * 4)
+        self.limits = limits
+        self.text = _TextBudget(limits)
+        self._file_size = 0
+        self._head = bytearray()
+        self._sniffed = False
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        part = self._current_part
+        if part.file is None:
+            return
+        if part.field_name not in self.limits.file_fields:
+            raise IntakeRejected(f"Unexpected file field {part.field_name}")
+        if not (part.file.content_type or "").startswith("image/"):
+            raise IntakeRejected(NOT_AN_IMAGE)
+        self._file_size = 0
+        self._head = bytearray()
+        self._sniffed = False
+
+    def _sniff(self) -> None:
+        mime_type = sniff_image_type(bytes(self._head))
+        if mime_type is None:
+            raise IntakeRejected(NOT_AN_IMAGE)
+        part = self._current_part
+        part.file.headers = Headers(raw=[(name, value) for name, value in part.item_headers if name != b"content-type"] + [(b"content-type", mime_type.encode())])
+        self._sniffed = True
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self._current_part
+        if part.file is None:
+            self.text.add(part.field_name, utf8_chars(data[start:end]))
+        else:
+            self._file_size += end - start
+            if self._file_size > self.limits.file_bytes:
+                raise IntakeRejected(TOO_LARGE)
+            if not self._sniffed:
+                self._head += data[start:min(end, start + IMAGE_SNIFF_BYTES)]
+                if len(self._head) >= IMAGE_SNIFF_BYTES:
+                    self._sniff()
+        super().on_part_data(data, start, end)
+
+    def on_part_end(self) -> None:
+        # Files shorter than the sniffing window
+        if self._current_part.file is not None and not self._sniffed:
+            self._sniff()
+        super().on_part_end()
+
+
+class LimitedFormParser(FormParser):
+    """
+    `application/x-www-form-urlencoded` parser enforcing the text limits of `IntakeLimits` on the
+    decoded characters of each field.
+    """
+
+    def __init__(self, headers: Headers, stream, limits: IntakeLimits):
+        super().__init__(headers, stream, max_part_size=max(limits.text_chars, limits.field_chars) * 12)
+        self.text = _TextBudget(limits)
+        self._name = bytearray()
+        self._pending = b""
+
+    def on_field_start(self) -> None:
+        super().on_field_start()
+        self._name = bytearray()
+        self._pending = b""
+
+    def on_field_name(self, data: bytes, start: int, end: int) -> None:
+        super().on_field_name(data, start, end)
+        self._name += data[start:end]
+
+    def on_field_data(self, data: bytes, start: int, end: int) -> None:
+        super().on_field_data(data, start, end)
+        encoded = self._pending + data[start:end]
+        # Keep an escape sequence split across chunks for the next one
+        cut = encoded.rfind(b"%", max(0, len(encoded) - 2))
+        if cut != -1:
+            encoded, self._pending = encoded[:cut], encoded[cut:]
+        else:
+            self._pending = b""
+        self.text.add(unquote_plus(bytes(self._name).decode("latin-1")), utf8_chars(unquote_to_bytes(encoded.replace(b"+", b" "))))
+
+
+class IntakeRequest(Request):
+    """
+    Request whose form is parsed with `IntakeLimits` (see the module docstring).
+    """
+
+    def __init__(self, scope, receive, limits: IntakeLimits):
+        super().__init__(scope, receive)
+        self.limits = limits
+
+    async def _limited_stream(self):
+        received = 0
+        async for chunk in self.stream():
+            received += len(chunk)
+            if received > self.limits.max_request_bytes:
+                raise IntakeRejected(TOO_LARGE)
+            yield chunk
+
+    async def _get_form(self, **kwargs) -> FormData:
+        if self._form is None:
+            content_length = self.headers.get("content-length")
+            if content_length is not None and content_length.isdigit() and int(content_length) > self.limits.max_request_bytes:
+                raise IntakeRejected(TOO_LARGE)
+            content_type, _ = parse_options_header(self.headers.get("content-type"))
+            parser_class = {b"multipart/form-data": LimitedMultiPartParser, b"application/x-www-form-urlencoded": LimitedFormParser}.get(content_type)
+            if parser_class is not None:
+                try:
+                    self._form = await parser_class(self.headers, self._limited_stream(), self.limits).parse()
+                except MultiPartException as e:
+                    raise IntakeRejected(e.message)
+        return await super()._get_form(**kwargs)
+
+
+def intake_route(limits_by_path: dict[str, IntakeLimits]) -> type[APIRoute]:
+    """
+    Builds the route class of an app whose routes in `limits_by_path` (by path template) parse their
+    form with `IntakeRequest`.
+
+    Args:
+        limits_by_path (dict[str, IntakeLimits]): The limits of each route. Read at request time, so
+            it may be filled after the routes are declared.
+
+    Returns:
+        type[APIRoute]: The route class, for `app.router.route_class`.
+    """
+    class IntakeRoute(APIRoute):
+        def get_route_handler(self):
+            handler = super().get_route_handler()
+
+            async def limited_handler(request: Request):
+                limits = limits_by_path.get(self.path)
+                if limits is None:
+                    return await handler(request)
+                try:
+                    return await handler(IntakeRequest(request.scope, request.receive, limits))
+                except IntakeRejected as e:
+                    record_error("intake", e)
+                    raise
+
+            return limited_handler
+
+    return IntakeRoute
@@ -0,0 +1,30 @@
+"""
+Standalone job worker process: `python -m app.job_worker [--concurrency N]`.
+
+Consumes the job queue shared with the service through `JOBS_PATH` (see `app.jobs`). Run the service with
+`JOB_WORKERS=0` to leave all LLM calls to worker processes.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from . import main
+from .jobs import JOB_WORKERS, JOBS_PATH
+
+
+async def run(concurrency: int) -> None:
+    main.job_workers.concurrency = concurrency
+    # The app's lifespan runs the workers next to the design file sweeper and prompt cache refresher
+    async with main.lifespan(main.app):
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs analysis job workers.")
+    parser.add_argument("--concurrency", type=int, default=max(JOB_WORKERS, 1), help="Number of jobs processed at the same time")
+    args = parser.parse_args()
+    if not JOBS_PATH:
+        parser.error("JOBS_PATH must point to the service's job queue")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.concurrency))
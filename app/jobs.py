@@ -0,0 +1,372 @@
+"""
+Asynchronous analysis jobs (`POST /jobs`, `GET /jobs/{id}`).
+
+A job stores the validated inputs of one analysis in a SQLite file (`JOBS_PATH`, WAL mode) and is
+returned to the client immediately. Workers claim queued jobs, run the regular analysis pipeline and
+store the validated response or the error. Workers run inside the service (`JOB_WORKERS` per process)
+or in a separate process (`python -m app.job_worker` with `JOB_WORKERS=0` in the service), all sharing
+the same file, so HTTP handling stays fast and LLM throughput is set by the number of workers.
+
+Claiming a job takes a lease (`JOB_LEASE_SECONDS`), which the worker extends while the job runs. A job
+whose worker died is claimed again once its lease expires, up to `JOB_MAX_ATTEMPTS` times. Jobs survive
+restarts and are purged (hourly, by the workers) `JOB_TTL_SECONDS` after they finish. The file is only
+created by the first submitted job.
+
+The queue is opt-in: without `JOBS_PATH` the job endpoints answer 503 and no workers are started.
+
+Clients may send an `Idempotency-Key` header: a retried submission with the same key returns the
+existing job instead of enqueueing a duplicate.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+# Unset disables the job queue
+JOBS_PATH = os.getenv("JOBS_PATH", "")
+# Workers started inside each service process (with `JOBS_PATH` set). 0 leaves the queue to `python -m app.job_worker`.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+# How often the workers purge finished jobs
+_PURGE_INTERVAL_SECONDS = 3600
+
+
+class IdempotencyConflict(Exception):
+    """
+    Raised when an idempotency key is reused for a different request.
+    """
+
+
+@dataclass
+class Job:
+    """
+    One analysis job.
+
+    Attributes:
+        id: The job id returned to the client.
+        status: "queued", "running", "succeeded" or "failed".
+        request_key: Fingerprint of the inputs (see `analysis_cache_key`), checked against idempotency keys.
+        payload: The form fields of the request.
+        design: The design file content, if any.
+        design_type: The design file's content type.
+        design_name: The design file's name.
+        result: The validated response as JSON, once succeeded.
+        error: The error detail, once failed.
+        attempts: Number of times a worker claimed the job.
+        created_at: Submission time (epoch seconds).
+        updated_at: Time of the last status change (epoch seconds).
+    """
+    id: str
+    status: str
+    request_key: str
+    payload: dict
+    design: bytes | None = None
+    design_type: str | None = None
+    design_name: str | None = None
+    result: str | None = None
+    error: str | None = None
+    attempts: int = 0
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    def public(self) -> dict:
+        """
+        Returns the job as served by `GET /jobs/{id}`.
+        """
+        body = {"id": self.id, "status": self.status, "created_at": self.created_at, "updated_at": self.updated_at}
+        if self.status == SUCCEEDED:
+            body["result"] = json.loads(self.result)
+        elif self.status == FAILED:
+            body["error"] = self.error
+        return body
+
+
+_COLUMNS = "id, status, request_key, payload, design, design_type, design_name, result, error, attempts, created_at, updated_at"
+
+
+def _job(row) -> Job:
+    return Job(*row[:3], json.loads(row[3]), *row[4:])
+
+
+class JobStore:
+    """
+    SQLite-backed job queue shared by every worker and service process on the host.
+
+    Methods are blocking; call them through `asyncio.to_thread`.
+    """
+
+    def __init__(self, path: str = JOBS_PATH, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS, ttl_seconds: float = JOB_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._initialized = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _exists(self) -> bool:
+        # Reads and maintenance on a queue nobody submitted to must not create the file
+        return self._initialized or os.path.exists(self.path)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call: cheap for SQLite and safe across worker threads
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            if not self._initialized:
+                # Created on first use, so importing the app does not create the file
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "id TEXT PRIMARY KEY, status TEXT NOT NULL, request_key TEXT NOT NULL, payload TEXT NOT NULL, "
+                    "design BLOB, design_type TEXT, design_name TEXT, result TEXT, error TEXT, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                    "lease_until REAL, idempotency_key TEXT UNIQUE)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+                self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, request_key: str, payload: dict, design: bytes | None = None, design_type: str | None = None, design_name: str | None = None, idempotency_key: str | None = None) -> tuple[Job, bool]:
+        """
+        Enqueues a job, or returns the existing job submitted with the same idempotency key.
+
+        Returns:
+            tuple[Job, bool]: The job and whether it was created by this call.
+
+        Raises:
+            IdempotencyConflict: If the key was used for a request with different inputs.
+        """
+        now = self._clock()
+        job = Job(id=uuid.uuid4().hex, status=QUEUED, request_key=request_key, payload=payload, design=design,
+                  design_type=design_type, design_name=design_name, created_at=now, updated_at=now)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, status, request_key, payload, design, design_type, design_name, created_at, updated_at, idempotency_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.id, job.status, request_key, json.dumps(payload), design, design_type, design_name, now, now, idempotency_key or None),
+                )
+            return job, True
+        except sqlite3.IntegrityError:
+            # The idempotency key is taken (possibly by a concurrent submission in another process)
+            if not idempotency_key:
+                raise
+        with self._connect() as conn:
+            existing = _job(conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone())
+        if existing.request_key != request_key:
+            raise IdempotencyConflict(idempotency_key)
+        return existing, False
+
+    def get(self, job_id: str) -> Job | None:
+        if not self._exists():
+            return None
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row is not None else None
+
+    def claim(self) -> Job | None:
+        """
+        Takes the oldest queued job (or a running job whose lease expired) and marks it running.
+
+        Jobs that already used up `max_attempts` are failed instead of being claimed again.
+
+        Returns:
+            Job | None: The claimed job, or None if the queue is empty.
+        """
+        if not self._exists():
+            return None
+        now = self._clock()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status = ? AND lease_until <= ? AND attempts >= ?",
+                (FAILED, "Worker did not finish the job", now, RUNNING, now, self.max_attempts),
+            )
+            row = conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                f"WHERE id = (SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_until <= ?) ORDER BY created_at LIMIT 1) "
+                f"RETURNING {_COLUMNS}",
+                (RUNNING, now + self.lease_seconds, now, QUEUED, RUNNING, now),
+            ).fetchone()
+        return _job(row) if row is not None else None
+
+    def finish(self, job_id: str, attempt: int, result: str | None = None, error: str | None = None) -> bool:
+        """
+        Stores the outcome of a claimed job: the response JSON, or the error detail.
+
+        Args:
+            job_id (str): The job's id.
+            attempt (int): `Job.attempts` of the claim; only the worker holding the current claim may finish the job.
+            result (str | None): The validated response as JSON.
+            error (str | None): The error detail, if the job failed.
+
+        Returns:
+            bool: False if the outcome was discarded because the claim is stale (the lease expired and the job
+            was claimed again, failed or requeued).
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, design = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (FAILED if error is not None else SUCCEEDED, result, error, self._clock(), job_id, RUNNING, attempt),
+            ).rowcount > 0
+
+    def extend_lease(self, job_id: str, attempt: int) -> bool:
+        """
+        Renews the lease of a running job, so it is not claimed again while its worker is still busy.
+
+        Returns:
+            bool: False if the claim is stale (e.g. the job was failed or claimed again after its lease expired).
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ? AND attempts = ?",
+                (self._clock() + self.lease_seconds, job_id, RUNNING, attempt),
+            ).rowcount > 0
+
+    def release(self, job_id: str, attempt: int) -> bool:
+        """
+        Puts a claimed job back in the queue without counting the attempt (e.g. the model's quota was exhausted).
+
+        Returns:
+            bool: False if the claim is stale.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (QUEUED, self._clock(), job_id, RUNNING, attempt),
+            ).rowcount > 0
+
+    def purge(self) -> int:
+        """
+        Deletes finished jobs older than `ttl_seconds`.
+
+        Returns:
+            int: The number of deleted jobs.
+        """
+        if not self._exists():
+            return 0
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at <= ?",
+                (SUCCEEDED, FAILED, self._clock() - self.ttl_seconds),
+            ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        if not self._exists():
+            return {}
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobWorkers:
+    """
+    Pool of async workers consuming a `JobStore`.
+
+    Workers poll the store every `poll_seconds` (other processes may enqueue) and are woken up
+    immediately by `notify` when this process enqueues a job. The lease of a running job is extended
+    every `heartbeat_seconds` (a third of the lease by default).
+    """
+
+    def __init__(self, store: JobStore, handler: Callable[[Job], Awaitable[str]], concurrency: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS,
+                 heartbeat_seconds: float | None = None):
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds if heartbeat_seconds is not None else store.lease_seconds / 3
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def run_once(self) -> bool:
+        """
+        Claims and processes one job.
+
+        Returns:
+            bool: False if the queue was empty.
+        """
+        try:
+            job = await asyncio.to_thread(self.store.claim)
+        except sqlite3.Error as e:
+            logging.warning(f"Job store unavailable: {e}")
+            return False
+        if job is None:
+            return False
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handler(job)
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                # Rate limited: the job is not at fault, retry it once quota is available again
+                logging.warning(f"Job {job.id} rate limited, requeued")
+                await asyncio.to_thread(self.store.release, job.id, job.attempts)
+                await asyncio.sleep(float((getattr(e, "headers", None) or {}).get("Retry-After", self.poll_seconds)))
+                return True
+            logging.error(f"Job {job.id} failed: {e}")
+            finished = await asyncio.to_thread(self.store.finish, job.id, job.attempts, None, getattr(e, "detail", None) or str(e) or "Error with server")
+        else:
+            finished = await asyncio.to_thread(self.store.finish, job.id, job.attempts, result)
+        finally:
+            heartbeat.cancel()
+        if not finished:
+            logging.warning(f"Job {job.id} outcome discarded: its lease expired and it was taken over")
+        return True
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                if not await asyncio.to_thread(self.store.extend_lease, job.id, job.attempts):
+                    return
+            except sqlite3.Error as e:
+                logging.warning(f"Extending the lease of job {job.id} failed: {e}")
+
+    async def _purger(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.store.purge)
+            except sqlite3.Error as e:
+                logging.warning(f"Job store purge failed: {e}")
+            await asyncio.sleep(_PURGE_INTERVAL_SECONDS)
+
+    async def _worker(self) -> None:
+        while True:
+            if not await self.run_once():
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run(self) -> None:
+        """
+        Runs the workers, and the hourly purge of finished jobs, until cancelled. Meant to run as a background task.
+        """
+        workers = [asyncio.create_task(self._worker()) for _ in range(max(1, self.concurrency))]
+        workers.append(asyncio.create_task(self._purger()))
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
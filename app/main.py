@@ -5,31 +5,686 @@ This FastAPI application provides an endpoint for webpage UI analysis using a Ge
 - Constructs a detailed LLM prompt and optionally uploads an image for multimodal input.
 - Returns structured feedback in a strict JSON schema defined by `WebpageAnalysisResponse`.
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import PlainTextResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks, Response, Header, Query
+from starlette.datastructures import Headers
+from starlette.background import BackgroundTask
+from fastapi.responses import PlainTextResponse, HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Annotated
+from typing import Annotated, Awaitable, Callable, MutableMapping
 import os
-from app.gemini_client import get_client
+from app.gemini_client import get_client_pool
 from dotenv import load_dotenv
-import random
-import string
+import io
 import json
 import logging
-from .models import WebpageAnalysisResponse
+from .models import WebpageAnalysisResponse, LLMAnalysisResponse, NonLLMEvaluations
+from .design_files import can_inline, inline_design_part, upload_design_file, delete_design_file, DesignFileCache, design_file_hash, sniff_image_type, IMAGE_SNIFF_BYTES
+from .result_cache import ResultCache, analysis_cache_key
+from .singleflight import SingleFlight
+from .html_reduction import HtmlReducer
+from .audit_compaction import compact_audits, compaction_fingerprint, dump_compact
+from .audit_reports import render_non_llm_evaluations, UnrecognizedAudit, NON_LLM_EVALUATIONS
+from .streaming import SectionParser, validate_section, iter_sections, sse_event
+from .context_cache import PromptPrefixCache, is_cache_rejection
+from .fanout import run_fanout, fanout_focus, FANOUT_JOBS, EVALUATIONS_JOB, ANALYSIS_FANOUT, FANOUT_CONCURRENCY
+from .batch import parse_batch_pages, page_id, error_entry, run_batch, ndjson_line, OfflinePage, OfflineBatch, OfflineBatches, collect_offline_batch, TERMINAL_STATES, BATCH_CONCURRENCY, BATCH_MAX_INPUT_CHARS
+from .intake import IntakeLimits, intake_route
+from .incremental import PreviousAnalysis, diff_pages, split_findings, merge_incremental, INCREMENTAL_MAX_CHANGED_RATIO
+from .rate_limit import RateLimiters, RateLimited
+from .tokens import estimate_tokens, estimate_contents_tokens, IMAGE_TOKENS
+from .budget import fit_prompt, token_budget, budget_fingerprint, PromptPlan, OverBudget
+from .resilience import ResilientGenerator
+from .client_pool import ClientLease
+from .jobs import Job, JobStore, JobWorkers, IdempotencyConflict
+from .chunking import split_html, analyse_chunks, CHUNKED_ANALYSIS_MIN_CHARS, CHUNK_MAX_CHARS
+from .design_images import DesignImageProcessor
+from .analysis_store import AnalysisStore, MAX_PAGE_SIZE
+from .metrics import MetricsMiddleware, registry, design_image_saved, stage, record_stage, record_size, record_usage, current_timings, monitor_event_loop, resident_memory, resident_memory_bytes, METRICS_ENABLED, EVENT_LOOP_LAG_INTERVAL_SECONDS
+from contextlib import asynccontextmanager
+from functools import partial
+import asyncio
+import sqlite3
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 model = os.getenv("MODEL")
-app = FastAPI()
+# Bump whenever get_prompt changes in a way that affects the output, so cached results are not reused
+PROMPT_VERSION = "5"
+# Combined size limit of htmlText, specification and webAuditResults (characters)
+MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", str(2 * 1024 * 1024)))
+MAX_DESIGN_FILE_BYTES = int(os.getenv("MAX_DESIGN_FILE_BYTES", str(5 * 1024 * 1024)))
+# Size limit of a whole request body. The default leaves room for the text limit in the most verbose
+# encoding (percent-encoded multi-byte characters), the design file and the other fields.
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(9 * MAX_INPUT_CHARS + MAX_DESIGN_FILE_BYTES + 1024 * 1024)))
 
-# Load Gemini client
-client = get_client()
+# Gemini clients, one per API key / project (async interface, so LLM round-trips never block the event loop).
+# Each analysis leases the least-loaded healthy one.
+client_pool = get_client_pool()
+# The primary client owns the cached prompt prefix and the offline batches
+client = client_pool.primary
 
-def get_prompt(htmlText: str, specification: str | None = "", designFile: bool = False, webAuditResults: str = "") -> str:
+# Uploaded design files, reused across requests for identical images
+design_file_cache = DesignFileCache()
+
+# Downscales, tiles and re-encodes design images in a process pool before they are sent
+design_images = DesignImageProcessor()
+
+# Past analyses, recent ones in memory and all of them on disk, for history queries and incremental re-analysis
+analysis_store = AnalysisStore()
+
+# Validated responses for identical requests
+result_cache = ResultCache()
+
+# Identical analyses currently running, awaited by concurrent duplicates
+inflight = SingleFlight()
+
+# Strips scripts, data URIs, SVG paths, comments and whitespace from htmlText before prompting
+html_reducer = HtmlReducer()
+
+# Gemini cached-content entry holding the static prompt prefix
+prompt_cache = PromptPrefixCache()
+
+# Offline batches submitted to the provider's batch-prediction API, awaiting collection
+offline_batches = OfflineBatches()
+
+# Polls of offline batches in flight, so concurrent polls collect a finished batch once
+offline_batch_polls = SingleFlight()
+
+# Persistent queue of asynchronous analysis jobs (POST /jobs)
+job_store = JobStore()
+
+# Per-model RPM/TPM admission control in front of generate_content
+rate_limiters = RateLimiters()
+
+# Retries, hedging and fallback model around each generation call
+generator = ResilientGenerator()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Runs the background maintenance tasks for the app's lifetime:
+    - the design file cache sweeper (cached uploads are deleted on shutdown),
+    - the refresher of the cached prompt prefix (deleted on shutdown),
+    - the analysis job workers (`JOB_WORKERS`, with `JOBS_PATH` set),
+    - the batched writer of the analysis store (queued analyses are written on shutdown),
+    - the event-loop lag monitor (see `app.metrics`).
+    """
+    tasks = []
+    if design_file_cache.enabled:
+        tasks.append(asyncio.create_task(design_file_cache.run_sweeper()))
+    if prompt_cache.enabled and not prompt_cache.cacheable(get_instructions()):
+        logging.info(f"Prompt prefix below CONTEXT_CACHE_MIN_TOKENS ({prompt_cache.min_tokens}), it is sent with every request")
+    elif prompt_cache.enabled and client is not None:
+        tasks.append(asyncio.create_task(prompt_cache.run_refresher(client, model, PROMPT_VERSION, get_instructions())))
+    if job_store.enabled and job_workers.concurrency > 0:
+        tasks.append(asyncio.create_task(job_workers.run()))
+    if analysis_store.disk is not None:
+        tasks.append(asyncio.create_task(analysis_store.run_writer()))
+    if METRICS_ENABLED and EVENT_LOOP_LAG_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(monitor_event_loop()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await analysis_store.flush()
+    await design_file_cache.clear()
+    design_images.close()
+    if client is not None:
+        await prompt_cache.close(client)
+
+
+app = FastAPI(lifespan=lifespan)
+# Forms of these routes are size-checked and their design images sniffed while the body is received
+# (see `app.intake`)
+analysis_limits = IntakeLimits(text_chars=MAX_INPUT_CHARS, file_bytes=MAX_DESIGN_FILE_BYTES, max_request_bytes=MAX_REQUEST_BYTES)
+intake_limits = {
+    "/webpage-analysis": analysis_limits,
+    "/webpage-analysis/stream": analysis_limits,
+    "/jobs": analysis_limits,
+    "/webpage-analysis/batch": IntakeLimits(text_chars=BATCH_MAX_INPUT_CHARS, file_bytes=MAX_DESIGN_FILE_BYTES, text_fields=("pages", "specification"),
+                                            max_request_bytes=9 * BATCH_MAX_INPUT_CHARS + MAX_DESIGN_FILE_BYTES + 1024 * 1024),
+}
+app.router.route_class = intake_route(intake_limits)
+# Request counts/latency by route and the Server-Timing header (see `app.metrics`)
+app.add_middleware(MetricsMiddleware)
+
+# Current values of the components' own statistics, set when /metrics is rendered
+cache_events = registry.gauge("result_cache_events", "Result cache lookups by outcome since start.", ("outcome",))
+client_in_flight = registry.gauge("gemini_client_in_flight", "Requests holding a lease on each pooled client.", ("client",))
+client_cooldown = registry.gauge("gemini_client_cooldown_seconds", "Remaining cooldown of each pooled client.", ("client",))
+rate_limit_queued = registry.gauge("rate_limit_queued", "Calls waiting for quota.", ("limiter",))
+
+
+def pipeline_fingerprint(chunked: bool | None = None, fanout: bool = False) -> str:
+    """
+    Identifies everything besides the inputs that shapes a result: prompt template, HTML reduction,
+    audit compaction, Non-LLM Evaluations mode, chunking, fan-out, token budget and design image settings. Part of
+    the result cache / in-flight key.
+
+    Args:
+        chunked (bool | None, optional): The request's `chunked` flag.
+        fanout (bool, optional): Whether the analysis is generated per category.
+
+    Returns:
+        str: The fingerprint string.
+    """
+    return (f"{PROMPT_VERSION}+{html_reducer.fingerprint}+{compaction_fingerprint()}+evaluations={NON_LLM_EVALUATIONS}"
+            f"+chunked={chunked}:{CHUNKED_ANALYSIS_MIN_CHARS}:{CHUNK_MAX_CHARS}+fanout={fanout}+{budget_fingerprint(model)}+{design_images.fingerprint}")
+
+
+def validate_text_inputs(htmlText: str, specification: str | None, webAuditResults: str | None) -> dict:
+    """
+    Validates the text inputs of one page and parses `webAuditResults`.
+
+    Args:
+        htmlText (str): The HTML content to be analyzed.
+        specification (str | None): Optional design or functional specifications.
+        webAuditResults (str | None): Optional audit JSON string.
+
+    Returns:
+        dict: The parsed audit results ({} if none were sent). The audits are only parsed here.
+
+    Raises:
+        HTTPException: 400 for missing, oversized or malformed inputs.
+    """
+    parsed_audit = {}
+    if not htmlText:
+        raise HTTPException(status_code=400, detail="htmlText is required")
+    if len(htmlText) + len(specification or "") + len(webAuditResults or "") > MAX_INPUT_CHARS:
+        raise HTTPException(status_code=400, detail="Files are too large")
+    if webAuditResults:
+        try:
+            parsed_audit = json.loads(webAuditResults)
+            # Check required keys inside parsed_audit
+            required_keys = {"axeCoreResult", "pageSpeedResult", "nuValidatorResult", "responsivenessResult"}
+            if not all(key in parsed_audit for key in required_keys):
+                raise HTTPException(status_code=400, detail="Invalid webAuditResults structure")
+        except (json.JSONDecodeError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid webAuditResults JSON")
+    return parsed_audit
+
+
+async def read_design_file(designFile: UploadFile | None) -> bytes | None:
+    """
+    Reads and validates the design file.
+
+    Requests are already checked during intake (see `app.intake`); this covers files from other sources,
+    such as stored jobs.
+
+    Args:
+        designFile (UploadFile | None): Optional design image.
+
+    Returns:
+        bytes | None: The design file content, if a design file was sent.
+
+    Raises:
+        HTTPException: 400 for an oversized file or a file that is not a supported image.
+    """
+    if not designFile:
+        return None
+    if designFile.size is not None and designFile.size > MAX_DESIGN_FILE_BYTES:
+        raise HTTPException(status_code=400, detail="Files are too large")
+    designFile_content = await designFile.read()
+    if len(designFile_content)>MAX_DESIGN_FILE_BYTES:
+        raise HTTPException(status_code=400, detail="Files are too large")
+    if not designFile.content_type.startswith("image/") or sniff_image_type(designFile_content[:IMAGE_SNIFF_BYTES]) is None:
+        raise HTTPException(status_code=400, detail="designFile must be an image")
+    return designFile_content
+
+
+async def read_and_validate_inputs(htmlText: str, specification: str | None, webAuditResults: str | None, designFile: UploadFile | None) -> tuple[bytes | None, dict]:
+    """
+    Reads the design file, parses `webAuditResults` and validates all analysis inputs and their sizes/types.
+
+    Args:
+        htmlText (str): The HTML content to be analyzed.
+        specification (str | None): Optional design or functional specifications.
+        webAuditResults (str | None): Optional audit JSON string.
+        designFile (UploadFile | None): Optional design image.
+
+    Returns:
+        tuple[bytes | None, dict]: The design file content (if a design file was sent) and the parsed
+        audit results ({} if none were sent). The audits are only parsed here.
+
+    Raises:
+        HTTPException: 400 for missing, oversized or malformed inputs.
+    """
+    # Runs first in the endpoints: everything before it was receiving and parsing the form
+    timings = current_timings()
+    if timings is not None:
+        record_stage("intake", timings.elapsed())
+    with stage("validate"):
+        if not htmlText:
+            raise HTTPException(status_code=400, detail="htmlText is required")
+        designFile_content = await read_design_file(designFile)
+        evaluations = validate_text_inputs(htmlText, specification, webAuditResults)
+    record_size("html", len(htmlText))
+    record_size("specification", len(specification or ""))
+    record_size("audits", len(webAuditResults or ""))
+    if designFile_content is not None:
+        record_size("design", len(designFile_content))
+    return designFile_content, evaluations
+
+
+async def normalize_design(designFile: UploadFile, designFile_content: bytes) -> list[tuple[bytes, str]]:
+    """
+    Downscales, tiles and re-encodes the design image (see `app.design_images`) and records the bytes
+    and estimated tokens saved.
+
+    Args:
+        designFile (UploadFile): The design file form field.
+        designFile_content (bytes): Its content.
+
+    Returns:
+        list[tuple[bytes, str]]: (content, MIME type) of the images to send, top to bottom.
+    """
+    with stage("design"):
+        design = await design_images.process(designFile_content, designFile.content_type)
+    record_size("design_sent", design.bytes)
+    if design.bytes_saved or design.tokens_saved:
+        if METRICS_ENABLED:
+            design_image_saved.inc("bytes", amount=design.bytes_saved)
+            design_image_saved.inc("tokens", amount=design.tokens_saved)
+        logging.info(f"Design image normalized into {len(design.images)} image(s): {design.bytes_saved} bytes and ~{design.tokens_saved} tokens saved")
+    return design.images
+
+
+def design_display_name(designFile: UploadFile, index: int, count: int) -> str | None:
+    """
+    Names the uploaded image `index` of `count` tiles of a design file.
+    """
+    if count == 1:
+        return designFile.filename
+    return f"{designFile.filename or 'design'} ({index + 1} of {count})"
+
+
+def design_preamble(count: int) -> list[str]:
+    """
+    Returns the `contents` entry introducing a tiled design, placed before its images.
+    """
+    if count == 1:
+        return []
+    return [f"The design file is attached as {count} consecutive parts, from the top of the page to the bottom."]
+
+
+async def prepare_design_contents(designFile: UploadFile | None, designFile_content: bytes | None, lease: ClientLease) -> tuple[list, list]:
+    """
+    Turns the design file into `contents` entries: normalized (see `normalize_design`), then inline parts,
+    cached uploads or fresh uploads. The images of a tiled design are uploaded concurrently.
+
+    Args:
+        designFile (UploadFile | None): The design file form field.
+        designFile_content (bytes | None): Its content.
+        lease (ClientLease): The request's client. Uploads are only usable through that client.
+
+    Returns:
+        tuple[list, list]: The entries to append to `contents`, and the uploads (fresh or leased from
+        `design_file_cache`) that the caller must give back with `dispose_design_file` when done.
+    """
+    if not designFile:
+        return [], []
+    images = await normalize_design(designFile, designFile_content)
+    uploads = []
+
+    async def prepare(index: int, content: bytes, mime_type: str):
+        display_name = design_display_name(designFile, index, len(images))
+        if can_inline(content):
+            return inline_design_part(content, mime_type)
+        if design_file_cache.enabled:
+            uploaded = await design_file_cache.get_or_upload(lease.client, content, mime_type, display_name)
+        else:
+            uploaded = await upload_design_file(lease.client, content, mime_type, display_name)
+        uploads.append(uploaded)
+        return uploaded
+
+    results = await asyncio.gather(*(prepare(index, content, mime_type) for index, (content, mime_type) in enumerate(images)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        for uploaded in uploads:
+            await dispose_design_file(lease.client, uploaded)
+        raise errors[0]
+    return [*design_preamble(len(images)), *results], uploads
+
+
+async def dispose_design_file(client, uploaded) -> None:
+    """
+    Gives back a design file from `prepare_design_contents` once the model calls using it are done: a
+    cached upload's lease is released (see `DesignFileCache.release`), a fresh upload is deleted.
+    """
+    if not design_file_cache.release(uploaded):
+        await delete_design_file(client, uploaded.name)
+
+
+def generation_config(schema: type[BaseModel] = WebpageAnalysisResponse) -> dict:
+    """
+    Builds the generation config that makes the model emit JSON matching a Pydantic model.
+
+    The SDK derives the response schema (with the models' aliases as keys) from the model class.
+
+    Args:
+        schema (type[BaseModel], optional): The model describing the output. Defaults to `WebpageAnalysisResponse`.
+
+    Returns:
+        dict: A `GenerateContentConfig`-compatible dict.
+    """
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def render_evaluations(evaluations: dict) -> tuple[type[BaseModel], NonLLMEvaluations | None]:
+    """
+    Decides who writes the "Non-LLM Evaluations" section and renders it when done locally.
+
+    With `NON_LLM_EVALUATIONS=local` the section is built from the audits (see `app.audit_reports`) and
+    the model only generates the remaining sections. Audits in an unrecognized format fall back to the model.
+
+    Args:
+        evaluations (dict): The parsed `webAuditResults`.
+
+    Returns:
+        tuple[type[BaseModel], NonLLMEvaluations | None]: The response schema for the model, and the
+        locally rendered section (None when the model writes it or no audits were given).
+    """
+    if NON_LLM_EVALUATIONS != "local":
+        return WebpageAnalysisResponse, None
+    try:
+        return LLMAnalysisResponse, render_non_llm_evaluations(evaluations)
+    except UnrecognizedAudit as e:
+        logging.info(f"Unrecognized {e} format, the model writes the Non-LLM Evaluations section")
+        return WebpageAnalysisResponse, None
+
+
+def build_contents(design_contents: list, schema: type[BaseModel] = WebpageAnalysisResponse, model_name: str | None = None, prefix_cache: bool = True, **prompt_kwargs) -> tuple[list, dict]:
+    """
+    Builds `contents` and config for one generation call.
+
+    When the static prompt prefix is available as a cached-content entry, only the variable inputs are
+    sent and the entry is referenced through `cached_content`.
+
+    Args:
+        design_contents (list): Design file parts/handles from `prepare_design_contents`.
+        schema (type[BaseModel], optional): The response schema. Defaults to `WebpageAnalysisResponse`.
+        model_name (str | None, optional): The model the call goes to. Defaults to `MODEL`.
+        prefix_cache (bool, optional): Whether the call may reference the cached prompt prefix, which only
+            exists for the primary client.
+        **prompt_kwargs: Arguments for `get_prompt`.
+
+    Returns:
+        tuple[list, dict]: The contents and the generation config.
+    """
+    config = generation_config(schema)
+    cached_content = prompt_cache.get(model_name or model, PROMPT_VERSION) if prefix_cache else None
+    if cached_content:
+        config["cached_content"] = cached_content
+    prompt = get_prompt(**prompt_kwargs, instructions=cached_content is None)
+    return [prompt, *design_contents], config
+
+
+async def call_model(lease: ClientLease, model_name: str, design_contents: list, schema: type[BaseModel] = WebpageAnalysisResponse, **prompt_kwargs) -> str:
+    """
+    Runs one generation call on the given model and returns its raw JSON output.
+
+    Args:
+        lease (ClientLease): The client to call through; the call's latency and outcome are recorded on it.
+        model_name (str): The model to call.
+        design_contents (list): Design file parts/handles from `prepare_design_contents`.
+        schema (type[BaseModel], optional): The response schema.
+        **prompt_kwargs: Arguments for `get_prompt`.
+
+    Returns:
+        str: The model's JSON text.
+
+    Raises:
+        RateLimited: If the call is not admitted by the model's rate limiter.
+    """
+    prefix_cache = lease.client is client
+    with stage("prompt"):
+        contents, config = build_contents(design_contents, schema, model_name, prefix_cache, **prompt_kwargs)
+    record_stage("queue", await rate_limiters.for_model(model_name, lease.name).acquire(estimate_contents_tokens(contents)))
+    try:
+        with stage("generate", model=model_name), lease.track():
+            llm_response = await lease.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config
+            )
+    except Exception as e:
+        if "cached_content" not in config or not is_cache_rejection(e):
+            raise
+        # The cached prefix expired or was rejected: drop it and send the full prompt
+        logging.warning(f"Cached prompt prefix rejected, retrying without it: {e}")
+        prompt_cache.invalidate(model_name, PROMPT_VERSION)
+        with stage("prompt"):
+            contents, config = build_contents(design_contents, schema, model_name, prefix_cache, **prompt_kwargs)
+        record_stage("queue", await rate_limiters.for_model(model_name, lease.name).acquire(estimate_contents_tokens(contents)))
+        with stage("generate", model=model_name), lease.track():
+            llm_response = await lease.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config
+            )
+    record_usage(model_name, getattr(llm_response, "usage_metadata", None))
+    if isinstance(llm_response.text, str):
+        record_size("output", len(llm_response.text))
+    return llm_response.text
+
+
+def parse_output(schema: type[BaseModel], text: str) -> BaseModel:
+    """
+    Validates the model's JSON text against `schema`, timed as the "parse" stage.
+
+    Raises:
+        pydantic.ValidationError: If the output does not match the schema.
+    """
+    with stage("parse"):
+        return schema.model_validate_json(text)
+
+
+async def generate_validated(lease: ClientLease, design_contents: list, schema: type[BaseModel] = WebpageAnalysisResponse, **prompt_kwargs) -> BaseModel:
+    """
+    Generates output that validates against `schema`, with retries, hedging and model fallback
+    (see `app.resilience`). The output is validated once, by the generator.
+
+    Args:
+        lease (ClientLease): The request's client.
+        design_contents (list): Design file parts/handles from `prepare_design_contents`.
+        schema (type[BaseModel], optional): The response schema.
+        **prompt_kwargs: Arguments for `get_prompt`.
+
+    Returns:
+        BaseModel: The model's output, validated as `schema`.
+
+    Raises:
+        RateLimited: If a call is not admitted by the model's rate limiter.
+    """
+    return await generator.run(model, partial(call_model, lease, design_contents=design_contents, schema=schema, **prompt_kwargs), partial(parse_output, schema))
+
+
+async def generate_analysis(lease: ClientLease, design_contents: list, schema: type[BaseModel] = WebpageAnalysisResponse, **prompt_kwargs) -> WebpageAnalysisResponse:
+    """
+    Runs one generation call and validates its JSON output.
+
+    Args:
+        lease (ClientLease): The request's client.
+        design_contents (list): Design file parts/handles from `prepare_design_contents`.
+        schema (type[BaseModel], optional): The response schema, see `render_evaluations`.
+        **prompt_kwargs: Arguments for `get_prompt`.
+
+    Returns:
+        WebpageAnalysisResponse: The validated model output.
+    """
+    output = await generate_validated(lease, design_contents, schema, **prompt_kwargs)
+    if isinstance(output, WebpageAnalysisResponse):
+        return output
+    # An `LLMAnalysisResponse`: its (already validated) sections are carried over as they are
+    return WebpageAnalysisResponse.model_construct(**dict(output))
+
+
+async def generate_fanout(lease: ClientLease, design_contents: list, schema: type[BaseModel] = WebpageAnalysisResponse, failed: list[str] | None = None, **prompt_kwargs) -> WebpageAnalysisResponse:
+    """
+    Generates the analysis with one concurrent call per category (see `app.fanout`).
+
+    Args:
+        lease (ClientLease): The request's client.
+        design_contents (list): Design file parts/handles from `prepare_design_contents`.
+        schema (type[BaseModel], optional): The single-call response schema, see `render_evaluations`.
+            The "Non-LLM Evaluations" section is only requested when it is part of it and audits are given.
+        failed (list[str] | None, optional): Receives the names of jobs that failed.
+        **prompt_kwargs: Arguments for `get_prompt`.
+
+    Returns:
+        WebpageAnalysisResponse: The assembled analysis; sections of failed jobs are null.
+    """
+    jobs = list(FANOUT_JOBS)
+    if schema is WebpageAnalysisResponse and prompt_kwargs.get("evaluations"):
+        jobs.append(EVALUATIONS_JOB)
+
+    async def generate(job: str, job_schema: type[BaseModel]) -> BaseModel:
+        return await generate_validated(lease, design_contents, job_schema, focus=fanout_focus(job), **prompt_kwargs)
+
+    response, failed_jobs = await run_fanout(jobs, generate, FANOUT_CONCURRENCY)
+    if failed is not None:
+        failed.extend(failed_jobs)
+    return response
+
+
+@app.get("/rate-limit-stats")
+async def rate_limit_stats():
+    """
+    Returns each model's quota, current wait queue depth, admitted/rejected calls and wait times.
+    """
+    return rate_limiters.snapshot()
+
+
+@app.get("/generation-stats")
+async def generation_stats():
+    """
+    Returns the generation attempts by model, kind (first, retry, revalidate, hedge) and outcome.
+    """
+    return {"attempts": generator.stats.snapshot()}
+
+
+@app.get("/client-stats")
+async def client_stats():
+    """
+    Returns each pooled Gemini client's in-flight requests, call/error counts, latency and remaining cooldown.
+    """
+    return {"clients": client_pool.snapshot()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Exports request, stage, token, payload, error and event-loop lag metrics plus the current memory, cache,
+    client pool, rate limiter and generation statistics in the Prometheus text format (see `app.metrics`).
+    """
+    for outcome, count in result_cache.stats.items():
+        cache_events.set(outcome, value=count)
+    for member in client_pool.snapshot():
+        client_in_flight.set(member["name"], value=member["in_flight"])
+        client_cooldown.set(member["name"], value=member["cooldown_seconds"])
+    for name, limiter in rate_limiters.snapshot().items():
+        rate_limit_queued.set(name, value=limiter["queued"])
+    rss = resident_memory_bytes()
+    if rss is not None:
+        resident_memory.set(value=rss)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """
+    Returns hit/miss counters of the result and design image caches, the number of cached design file uploads and
+    the analysis store's write counters.
+    """
+    return {
+        "result_cache": {**result_cache.stats, "memory_entries": len(result_cache.memory)},
+        "design_file_cache": {"entries": len(design_file_cache)},
+        "design_image_cache": {"hits": design_images.hits, "misses": design_images.misses, "entries": len(design_images)},
+        "analysis_store": {**analysis_store.stats, "queued": analysis_store.queued, "memory_entries": len(analysis_store.memory)},
+    }
+
+
+@app.get("/analyses")
+async def list_analyses(
+    content_hash: str | None = None,
+    url: str | None = None,
+    label: str | None = None,
+    model: str | None = None,
+    request_key: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = 50
+):
+    """
+    Lists past analyses, newest first, as summaries (id, timestamp, content hash, URL, label, model and
+    executive summary).
+
+    Accepts:
+        - `content_hash`, `url`, `label`, `model`, `request_key`: Exact matches.
+        - `since` / `until`: Unix timestamps bounding the analyses' creation.
+        - `cursor`: `next_cursor` of the previous page; `limit`: page size.
+
+    Returns:
+        `{"items": [...], "next_cursor": ...}`; `next_cursor` is null on the last page.
+
+    Raises:
+        HTTPException:
+            - 400: Malformed cursor.
+    """
+    filters = {"content_hash": content_hash, "url": url, "label": label, "model": model, "request_key": request_key}
+    try:
+        return await analysis_store.list(filters, since=since, until=until, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/analyses/{reference}")
+async def get_analysis(reference: str, inputs: bool = False):
+    """
+    Returns a past analysis by id (`X-Analysis-Id`) or content hash (`X-Content-Hash`, the latest analysis
+    of that HTML): its metadata and validated `WebpageAnalysisResponse`. With `inputs=true`, also the
+    analyzed `htmlText` and `specification`.
+
+    Raises:
+        HTTPException:
+            - 404: Unknown or purged analysis.
+    """
+    record = await analysis_store.get(reference)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown analysis")
+    analysis = {"id": record.id, "created_at": record.created_at, "content_hash": record.content_hash, "url": record.url,
+                "label": record.label, "model": record.model, "request_key": record.request_key,
+                "result": record.result.model_dump(mode="json", by_alias=True)}
+    if inputs:
+        analysis["htmlText"] = record.htmlText
+        analysis["specification"] = record.specification
+    return analysis
+
+def get_instructions() -> str:
+    """
+    Returns the static part of the prompt: everything before "**Inputs for Analysis:**".
+
+    It is identical for every request, which lets it be stored once as a Gemini cached-content entry
+    (see `app.context_cache`). Bump `PROMPT_VERSION` when changing it.
+
+    Returns:
+        str: The analysis instructions.
+    """
+    return (
+        "Please perform a comprehensive UI analysis of the html mentioned and generate a JSON report "
+        "that follows the provided response schema. Fill in the data based on my inputs. Fill key \"code\" with the affected html code only. Fill the key \"Non-LLM Evaluations\" as null if input non-LLM Evaluations are not given (\"Non-LLM Evaluations\": null). If any key is inapplicable, fill it as null if the corresponding value is an object, fill it as [] (empty array) if corresponding value is an array.\n\n"
+        "We are only concerned with a desktop screen analysis.\n\n"
+        "Large payloads (inline scripts, data URIs, SVG path data) in the HTML have been replaced by placeholders like __ELIDED_1c9a03fe_1__. "
+        "Keep such placeholders verbatim when quoting code.\n\n"
+    )
+
+
+def get_prompt(htmlText: str, specification: str | None = "", designFile: bool = False, evaluations: dict | None = None, section: str | None = None, focus: str | None = None, instructions: bool = True,
+               previous_findings: dict | None = None) -> str:
     """
     Generates a formatted prompt string for a language model to perform a structured UI analysis.
 
     This function constructs a detailed instruction string that includes:
-    - An example JSON response format for the model to strictly follow.
+    - Instructions for filling the JSON response schema (see `generation_config`).
     - Provided HTML content to be analyzed.
     - Optional design specifications and flags for attached design files.
     - Optional non-LLM evaluation data (e.g., accessibility, performance, validation results).
@@ -38,126 +693,36 @@ def get_prompt(htmlText: str, specification: str | None = "", designFile: bool =
         htmlText (str): The raw HTML content to be analyzed.
         specification (str | None, optional): Optional design or functional specifications. Defaults to "".
         designFile (bool, optional): Indicates whether a design file is attached. Defaults to False.
-        webAuditResults (str, optional): A JSON string containing non-LLM evaluation results. Expected keys:
+        evaluations (dict | None, optional): Parsed (and usually compacted, see `app.audit_compaction`)
+            non-LLM evaluation results. Expected keys:
             - "axeCoreResult"
             - "pageSpeedResult"
             - "nuValidatorResult"
             - "responsivenessResult"
+        section (str | None, optional): Set when `htmlText` is one chunk of a larger page, e.g. "section 2 of 5".
+            Instructs the model to only report findings for that part. Defaults to None.
+        focus (str | None, optional): The sections to fill in when the others are generated by separate calls
+            (see `app.fanout`), e.g. '"Styling Discrepancies"'. Defaults to None.
+        instructions (bool, optional): Include the static instructions from `get_instructions`. Set to False
+            when they are supplied through a cached-content entry. Defaults to True.
+        previous_findings (dict | None, optional): Findings of a previous analysis in the regions of `htmlText`,
+            by section, to be re-checked (see `app.incremental`). Defaults to None.
 
     Returns:
         str: A formatted prompt string that includes all inputs and instructions for LLM-based analysis.
 
     Notes:
-        - Ensures the output instructs the LLM to produce only raw JSON (no markdown, no surrounding text).
-        - Embeds optional evaluation summaries in the prompt if present.
+        - The output structure is enforced by the response schema, not described in the prompt.
+        - Embeds optional evaluation summaries in the prompt as compact JSON if present.
         - If evaluations are missing or invalid, the "Non-LLM Evaluations" field is marked as null.
     """
-    try:
-        evaluations = json.loads(webAuditResults) if webAuditResults else {}
-    except json.JSONDecodeError:
-        evaluations = {}
+    evaluations = evaluations or {}
 
     prompt = (
-        "Please perform a comprehensive UI analysis of the html mentioned and generate STRICTLY a JSON report "
-        "(No additional text except the JSON response: Start with \"{\", end with \"}\". No markdown. Raw JSON as text.). The output must strictly follow the JSON structure provided "
-        "in the 'Example Output Format' section below. Fill in the data based on my inputs, ensuring no deviation "
-        "from the provided keys, nesting, or data types. Fill key \"code\" with the affected html code only. Fill the key \"Non-LLM Evaluations\" as null if input non-LLM Evaluations are not given (\"Non-LLM Evaluations\": null). If any key is inapplicable, fill it as null if the corresponding value is an object, fill it as [] (empty array) if corresponding value is an array.\n\n"
-        "We are only concerned with a desktop screen analysis.\n\n"
-        "**Example Output Format:**\n\n"
-        '''{
-  "Executive Summary": "...",
-  "Detailed Analysis": {
-    "Content Discrepancies": {
-      "Summary": "...",
-      "Findings": [
-        {
-          "Section": "...",
-          "Issue": "...",
-          "Details": "...",
-          "Code": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    },
-    "Styling Discrepancies": {
-      "Summary": "...",
-      "Findings": [
-        {
-          "Section": "...",
-          "Issue": "...",
-          "Details": "...",
-          "Code": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    },
-    "Intentional Flaws And Known Issues": {
-      "Summary": "...",
-      "Findings": [
-        {
-          "Category": "...",
-          "Issue": "...",
-          "Details": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    },
-    "Functional Discrepancies": {
-      "Summary": "...",
-      "Findings": [
-        {
-          "Issue": "...",
-          "Details": "...",
-          "Code": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    }
-  },
-  "Non-LLM Evaluations": {
-    "Accessibility Report": {
-      "Summary": "...",
-      "Key Findings": [
-        {
-          "Issue": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    },
-    "Performance Report": {
-      "Summary": "...",
-      "Key Findings": [
-        {
-          "Issue": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    },
-    "Validation Report": {
-      "Summary": "...",
-      "Key Findings": [
-        {
-          "Issue": "...",
-          "Recommended Fix": "..."
-        }
-      ]
-    },
-    "Layout Report": {
-      "Summary": "...",
-      "Recommended Fix": "..."
-    }
-  },
-  "Other Issues": [
-      {
-          "Issue": "...",
-          "Details": "...",
-          "Code": "...",
-          "Recommended Fix": "..."
-      }
-    ]
-}
-'''
-        "\n**Inputs for Analysis:**\n\n"
+        f"{get_instructions() if instructions else ''}"
+        f"{f'The HTML below is {section} of a larger page, preceded by the page\'s shared <head>. Only report findings that occur in this part of the page.\n\n' if section else ''}"
+        f"{f'Only fill in the {focus} section(s) of the report; the other sections are generated separately.\n\n' if focus else ''}"
+        "**Inputs for Analysis:**\n\n"
         f"1. **HTML (Text):**\n{htmlText}\n\n"
         f"2. **Specifications:**\n{specification or 'None'}\n\n"
         f"{'3. Find the Design File attached.\n\n' if designFile else ''}"
@@ -165,23 +730,263 @@ def get_prompt(htmlText: str, specification: str | None = "", designFile: bool =
     )
     # print(evaluations, nonLLMEvaluations)
     if evaluations.get("axeCoreResult"):
-        prompt += f"* **Accessibility Summary:**\n{json.dumps(evaluations['axeCoreResult'], indent=2)}\n\n"
+        prompt += f"* **Accessibility Summary:**\n{dump_compact(evaluations['axeCoreResult'])}\n\n"
     if evaluations.get("pageSpeedResult") is not None:
-        prompt += f"* **Performance Summary:**\n{json.dumps(evaluations['pageSpeedResult'], indent=2)}\n\n"
+        prompt += f"* **Performance Summary:**\n{dump_compact(evaluations['pageSpeedResult'])}\n\n"
     if evaluations.get("nuValidatorResult"):
-        prompt += f"* **Validation Summary:**\n{json.dumps(evaluations['nuValidatorResult'], indent=2)}\n\n"
+        prompt += f"* **Validation Summary:**\n{dump_compact(evaluations['nuValidatorResult'])}\n\n"
     if evaluations.get("responsivenessResult") is not None:
-        prompt += f"* **Overflow Status:**\n{json.dumps(evaluations['responsivenessResult'], indent=2)}\n\n"
+        prompt += f"* **Overflow Status:**\n{dump_compact(evaluations['responsivenessResult'])}\n\n"
+    if previous_findings:
+        prompt += ("**Previous Findings:** A previous analysis of this part of the page reported the findings below. "
+                   "Report those that still apply and omit the ones that have been fixed.\n"
+                   f"{dump_compact(previous_findings)}\n\n")
 
     return prompt
 
     
+async def plan_prompt(headers: MutableMapping[str, str], html: str, specification: str | None, audits: dict | None, evaluations: dict | None, designFile: bool, elide: bool = True) -> PromptPlan:
+    """
+    Token preflight: fits the prompt inputs to the model's budget (see `app.budget`) and reports the plan
+    in the `X-Prompt-Plan`, `X-Prompt-Tokens` and `X-Prompt-Token-Budget` headers.
+
+    Args:
+        headers (MutableMapping[str, str]): Receives the headers.
+        html (str): The (reduced) page HTML, or the largest chunk of a chunked analysis.
+        specification (str | None): The specification.
+        audits (dict | None): The compacted audits.
+        evaluations (dict | None): The parsed `webAuditResults`.
+        designFile (bool): Whether a design image is sent with the prompt.
+        elide (bool, optional): Whether HTML sections may be elided.
+
+    Returns:
+        PromptPlan: The inputs to embed.
+
+    Raises:
+        HTTPException: 413 if the prompt cannot be trimmed to fit.
+    """
+    image_tokens = IMAGE_TOKENS if designFile else 0
+
+    def measure(html: str, specification: str | None, audits: dict | None) -> int:
+        return estimate_tokens(get_prompt(htmlText=html, specification=specification, designFile=designFile, evaluations=audits)) + image_tokens
+
+    budget = token_budget(model)
+    try:
+        with stage("budget"):
+            plan = await asyncio.to_thread(fit_prompt, html, specification, audits, evaluations, measure, budget, elide)
+    except OverBudget as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    headers["X-Prompt-Tokens"] = str(plan.tokens)
+    headers["X-Prompt-Token-Budget"] = str(budget)
+    headers["X-Prompt-Plan"] = plan.plan
+    if plan.steps:
+        logging.info(f"Prompt of ~{plan.original_tokens} tokens trimmed to ~{plan.tokens} ({plan.plan}) to fit the budget of {budget}")
+    return plan
+
+
+async def run_analysis(
+    headers: MutableMapping[str, str],
+    htmlText: str,
+    specification: str | None,
+    evaluations: dict,
+    design_hash: str | None,
+    prepare_design: Callable[[ClientLease], Awaitable[tuple[list, list]]],
+    bypassCache: bool = False,
+    chunked: bool | None = None,
+    fanout: bool | None = None,
+    lease: ClientLease | None = None
+) -> WebpageAnalysisResponse:
+    """
+    Runs the analysis pipeline for one validated page (see `webpage_analysis` for the steps).
+
+    Args:
+        headers (MutableMapping[str, str]): Receives the X-* response headers describing the run.
+        htmlText (str): The HTML content to be analyzed.
+        specification (str | None): Optional design or functional specifications.
+        evaluations (dict): The parsed `webAuditResults`.
+        design_hash (str | None): SHA-256 of the design image, if any.
+        prepare_design (Callable[[ClientLease], Awaitable[tuple[list, list]]]): Returns the design `contents`
+            entries and the uploads to give back when done, given the client (see `prepare_design_contents`).
+            Only called on a cache miss; the uploads are given back as soon as the model calls are done.
+        bypassCache (bool, optional): Skip the result cache lookup.
+        chunked (bool | None, optional): Force or disable chunked analysis.
+        fanout (bool | None, optional): Force or disable per-category generation. Defaults to `ANALYSIS_FANOUT`.
+        lease (ClientLease | None, optional): The client to use, when the caller's design upload is bound to
+            one. By default a client is leased from the pool for the analysis.
+
+    Returns:
+        WebpageAnalysisResponse: The validated analysis.
+
+    Raises:
+        HTTPException: 413 if the prompt cannot be trimmed to the model's token budget, 429 (with
+            `Retry-After`) if the model's quota is exhausted, 500 if the analysis fails.
+    """
+    fanout = ANALYSIS_FANOUT if fanout is None else fanout
+    request_key = analysis_cache_key(htmlText, specification, evaluations, design_hash, model, pipeline_fingerprint(chunked, fanout))
+    if result_cache.enabled:
+        cached = None if bypassCache else await result_cache.get(request_key)
+        if cached is not None:
+            headers["X-Cache"] = "HIT"
+            return cached
+        headers["X-Cache"] = "BYPASS" if bypassCache else "MISS"
+
+    async def analyse() -> tuple[WebpageAnalysisResponse, dict[str, str]]:
+        # Everything below is shared by concurrent duplicates: they receive the result with these headers
+        shared_headers: dict[str, str] = {}
+        # Parsing a large page takes a while, keep it off the event loop
+        with stage("reduce"):
+            reduction = await asyncio.to_thread(html_reducer.reduce, htmlText)
+        shared_headers["X-Html-Bytes-Saved"] = str(reduction.bytes_saved)
+        shared_headers["X-Html-Tokens-Saved"] = str(reduction.tokens_saved)
+        logging.info(f"HTML reduction saved {reduction.bytes_saved} bytes (~{reduction.tokens_saved} tokens)")
+        with stage("compact"):
+            audits = await asyncio.to_thread(compact_audits, evaluations)
+        shared_headers["X-Audit-Bytes-Saved"] = str(audits.chars_saved)
+        logging.info(f"Audit compaction saved {audits.chars_saved} of {audits.original_chars} bytes")
+        schema, local_evaluations = render_evaluations(evaluations)
+        shared_headers["X-Non-LLM-Evaluations"] = "local" if schema is LLMAnalysisResponse else "model"
+
+        chunks = [reduction.html]
+        if chunked or (chunked is None and 0 < CHUNKED_ANALYSIS_MIN_CHARS < len(reduction.html)):
+            chunks = await asyncio.to_thread(split_html, reduction.html, CHUNK_MAX_CHARS)
+        shared_headers["X-Analysis-Chunks"] = str(len(chunks))
+        # Chunks are already bounded in size, so only the specification and audits are trimmed for them
+        plan = await plan_prompt(shared_headers, max(chunks, key=len), specification, audits.audits, evaluations, design_hash is not None, elide=len(chunks) == 1)
+        if len(chunks) == 1:
+            chunks = [plan.html]
+
+        uploads = []
+        failed_jobs = []
+        generate = partial(generate_fanout, failed=failed_jobs) if fanout else generate_analysis
+        active = client_pool.lease() if lease is None else lease
+        try:
+          with stage("upload"):
+              design_contents, uploads = await prepare_design(active)
+
+          if len(chunks) == 1:
+              validated_response = await generate(active, design_contents, schema, htmlText=chunks[0], specification=plan.specification, designFile=design_hash is not None, evaluations=plan.audits)
+          else:
+              async def analyse_chunk(index: int, chunk: str) -> WebpageAnalysisResponse:
+                  # Audits describe the whole page, so only the first chunk reports on them
+                  return await generate(active, design_contents, schema, htmlText=chunk, specification=plan.specification, designFile=design_hash is not None,
+                                                 evaluations=plan.audits if index == 0 else None, section=f"section {index + 1} of {len(chunks)}")
+              validated_response = await analyse_chunks(chunks, analyse_chunk)
+          if schema is LLMAnalysisResponse:
+              validated_response.Non_LLM_Evaluations = local_evaluations
+          reduction.restore_response(validated_response)
+
+          if failed_jobs:
+              # A partial analysis is returned, but not reused
+              shared_headers["X-Fanout-Failed"] = ",".join(dict.fromkeys(failed_jobs))
+          elif result_cache.enabled:
+              await result_cache.set(request_key, validated_response)
+          return validated_response, shared_headers
+        except Exception as e:
+            logging.error(e)
+            if isinstance(e, RateLimited):
+                raise HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+            raise HTTPException(status_code=500, detail=str(e) or "Error with server")
+        finally:
+            # Given back here rather than by a request, which may disconnect before its background tasks run
+            for uploaded in uploads:
+                await dispose_design_file(active.client, uploaded)
+            if lease is None:
+                active.release()
+
+    # Concurrent identical requests share one upstream call
+    validated_response, shared_headers = await inflight.do(request_key, analyse)
+    headers.update(shared_headers)
+    return validated_response
+
+
+def analysis_context(specification: str | None, evaluations: dict, design_hash: str | None) -> str:
+    """
+    Identifies every input and setting besides `htmlText` that shapes a result. Incremental re-analysis
+    is only possible against an analysis with the same context.
+    """
+    return analysis_cache_key("", specification, evaluations, design_hash, model, pipeline_fingerprint())
+
+
+async def run_incremental(
+    headers: MutableMapping[str, str],
+    previous: PreviousAnalysis,
+    htmlText: str,
+    specification: str | None,
+    context: str,
+    design_hash: str | None,
+    prepare_design: Callable[[ClientLease], Awaitable[tuple[list, list]]]
+) -> WebpageAnalysisResponse | None:
+    """
+    Re-analyzes only the regions of a page that changed since a previous analysis (see `app.incremental`).
+    The outcome is reported in `X-Incremental`: "unchanged", "<changed> of <total> regions" or "full".
+
+    Args:
+        headers (MutableMapping[str, str]): Receives the X-* response headers describing the run.
+        previous (PreviousAnalysis): The referenced analysis.
+        htmlText (str): The resubmitted HTML.
+        specification (str | None): Optional design or functional specifications.
+        context (str): The request's `analysis_context`.
+        design_hash (str | None): SHA-256 of the design image, if any.
+        prepare_design (Callable[[ClientLease], Awaitable[tuple[list, list]]]): See `run_analysis`.
+
+    Returns:
+        WebpageAnalysisResponse | None: The merged analysis, or None when the page needs a full analysis.
+
+    Raises:
+        HTTPException: 413, 429 or 500 as `run_analysis`.
+    """
+    if previous.context != context:
+        headers["X-Incremental"] = "full"
+        return None
+    with stage("diff"):
+        diff = await asyncio.to_thread(diff_pages, previous.htmlText, htmlText)
+    if diff.head_changed or diff.changed_ratio > INCREMENTAL_MAX_CHANGED_RATIO:
+        headers["X-Incremental"] = "full"
+        return None
+    carried, touched = split_findings(previous.result, diff)
+    if not diff.changed:
+        headers["X-Incremental"] = "unchanged"
+        return carried
+    headers["X-Incremental"] = f"{len(diff.changed)} of {diff.regions} regions"
+
+    with stage("reduce"):
+        reduction = await asyncio.to_thread(html_reducer.reduce, diff.html())
+    plan = await plan_prompt(headers, reduction.html, specification, None, {}, design_hash is not None)
+    uploads = []
+    active = client_pool.lease()
+    try:
+        with stage("upload"):
+            design_contents, uploads = await prepare_design(active)
+        # The audits did not change, so their section is carried over rather than generated
+        update = await generate_analysis(active, design_contents, LLMAnalysisResponse, htmlText=plan.html, specification=plan.specification,
+                                         designFile=design_hash is not None, section="the part that changed since a previous analysis",
+                                         previous_findings=touched)
+        reduction.restore_response(update)
+        return merge_incremental(carried, update)
+    except Exception as e:
+        logging.error(e)
+        if isinstance(e, RateLimited):
+            raise HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+        raise HTTPException(status_code=500, detail=str(e) or "Error with server")
+    finally:
+        for uploaded in uploads:
+            await dispose_design_file(active.client, uploaded)
+        active.release()
+
+
 @app.post("/webpage-analysis", response_model=WebpageAnalysisResponse)
 async def webpage_analysis(
+    response: Response,
     htmlText: Annotated[str, Form()],
     specification: Annotated[str | None, Form()] = "",
     webAuditResults: Annotated[str | None, Form()] = "",
-    designFile: Annotated[UploadFile | None, File()] = None
+    designFile: Annotated[UploadFile | None, File()] = None,
+    bypassCache: Annotated[bool, Form()] = False,
+    chunked: Annotated[bool | None, Form()] = None,
+    fanout: Annotated[bool | None, Form()] = None,
+    previousAnalysis: Annotated[str | None, Form()] = None,
+    url: Annotated[str | None, Form()] = None,
+    label: Annotated[str | None, Form()] = None
 ):
     """
     Analyzes a webpage using LLM-based evaluation and optional design/audit data.
@@ -191,12 +996,44 @@ async def webpage_analysis(
         - `specification`: Optional textual design/functionality guidelines.
         - `webAuditResults`: Optional JSON string containing performance/accessibility/audit data.
         - `designFile`: Optional image file representing the design.
+        - `bypassCache`: Skip the result cache lookup (the fresh result is still stored).
+        - `chunked`: Force (true) or disable (false) chunked analysis. By default pages larger than
+          `CHUNKED_ANALYSIS_MIN_CHARS` after reduction are analyzed in chunks.
+        - `fanout`: Generate each category with its own concurrent call (true) or all in one call (false).
+          Defaults to `ANALYSIS_FANOUT`.
+        - `previousAnalysis`: Id (`X-Analysis-Id`) or content hash (`X-Content-Hash`) of a previous analysis
+          of this page. Only the regions that changed since are analyzed (see `app.incremental`).
+        - `url`: Optional URL of the page, stored with the analysis for `GET /analyses?url=...`.
+        - `label`: Optional free-form label (e.g. a release or branch), stored for `GET /analyses?label=...`.
 
     The endpoint:
         - Validates all inputs and their sizes/types.
         - Parses and verifies the structure of `webAuditResults` if provided.
-        - Uploads the `designFile` to Gemini (if given), then deletes it.
+        - Returns a cached response for identical inputs when available (`X-Cache: HIT`).
+        - Joins an identical analysis that is already in flight instead of starting another one.
+        - Reduces `htmlText` (see `app.html_reduction`) and reports the savings in the
+          `X-Html-Bytes-Saved` / `X-Html-Tokens-Saved` headers.
+        - Keeps only violations and failed audits of `webAuditResults` (see `app.audit_compaction`) and
+          reports the savings in the `X-Audit-Bytes-Saved` header.
+        - With `NON_LLM_EVALUATIONS=local`, renders the "Non-LLM Evaluations" section from the audits
+          instead of generating it (see `app.audit_reports`); `X-Non-LLM-Evaluations` reports who wrote it.
+        - Splits large pages into sections analyzed concurrently and merges the results
+          (see `app.chunking`); the number of chunks is reported in `X-Analysis-Chunks`.
+        - Estimates the prompt's tokens and, over the model's budget, trims audits, specification and then
+          HTML sections, or rejects the request (see `app.budget`); reported in `X-Prompt-Plan`,
+          `X-Prompt-Tokens` and `X-Prompt-Token-Budget`.
+        - In fan-out mode, generates the categories concurrently (see `app.fanout`). Categories whose call
+          failed are returned as null, listed in `X-Fanout-Failed`, and the result is not cached.
+        - Downscales, tiles and re-encodes the `designFile` (if given; see `app.design_images`), then
+          sends it inline or uploads it to Gemini from memory. Uploads are
+          reused from `design_file_cache` when enabled, otherwise deleted as soon as the model calls
+          are done (by the shared analysis, so a disconnecting client does not leak them).
         - Constructs a strict prompt for the LLM to respond with JSON only.
+        - Times every stage (see `app.metrics`) and reports the durations in the `Server-Timing` header.
+        - Records the analysis in the analysis store (see `app.analysis_store`) and returns its id in
+          `X-Analysis-Id` and the hash of `htmlText` in `X-Content-Hash`, by which it can be fetched
+          (`GET /analyses/{id}`) or re-analyzed incrementally. With `previousAnalysis`, reports how much was
+          re-analyzed in `X-Incremental`.
 
     Returns:
         A validated `WebpageAnalysisResponse` Pydantic model based on the LLM output.
@@ -204,55 +1041,437 @@ async def webpage_analysis(
     Raises:
         HTTPException:
             - 400: Invalid or missing input data.
+            - 404: Unknown `previousAnalysis`.
+            - 413: The prompt exceeds the model's token budget even after trimming (see `app.budget`).
+            - 429: The model's quota is exhausted (see `app.rate_limit`); retry after `Retry-After` seconds.
             - 500: Unexpected server error during analysis.
     """
 
-    if designFile:
-        designFile_content = await designFile.read()
-    if not htmlText:
-        raise HTTPException(status_code=400, detail="htmlText is required")
-    if len(htmlText+specification+webAuditResults)>2*1024*1024:
-        raise HTTPException(status_code=400, detail="Files are too large")
-    if designFile and len(designFile_content)>5*1024*1024:
-        raise HTTPException(status_code=400, detail="Files are too large")
-    if designFile and not designFile.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="designFile must be an image")
-    if webAuditResults:
+    designFile_content, evaluations = await read_and_validate_inputs(htmlText, specification, webAuditResults, designFile)
+    design_hash = design_file_hash(designFile_content) if designFile else None
+    prepare_design = partial(prepare_design_contents, designFile, designFile_content)
+    context = analysis_context(specification, evaluations, design_hash)
+    result = None
+    if previousAnalysis:
+        previous = await analysis_store.get(previousAnalysis)
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Unknown previous analysis")
+        result = await run_incremental(response.headers, previous, htmlText, specification, context, design_hash, prepare_design)
+    if result is None:
+        result = await run_analysis(response.headers, htmlText, specification, evaluations, design_hash, prepare_design,
+                                    bypassCache=bypassCache, chunked=chunked, fanout=fanout)
+    if analysis_store.enabled and not response.headers.get("X-Fanout-Failed"):
+        request_key = analysis_cache_key(htmlText, specification, evaluations, design_hash, model, pipeline_fingerprint(chunked, ANALYSIS_FANOUT if fanout is None else fanout))
+        record = analysis_store.add(htmlText, context, result, specification=specification, url=url, label=label, model=model, request_key=request_key)
+        response.headers["X-Analysis-Id"] = record.id
+        response.headers["X-Content-Hash"] = record.content_hash
+    return result
+
+
+@app.post("/webpage-analysis/stream")
+async def webpage_analysis_stream(
+    htmlText: Annotated[str, Form()],
+    specification: Annotated[str | None, Form()] = "",
+    webAuditResults: Annotated[str | None, Form()] = "",
+    designFile: Annotated[UploadFile | None, File()] = None,
+    bypassCache: Annotated[bool, Form()] = False
+):
+    """
+    Streams a webpage analysis as Server-Sent Events.
+
+    Accepts the same inputs as `/webpage-analysis` (chunked analysis is not available here). Inputs are
+    validated before the stream starts, so invalid requests still fail with a 400.
+
+    Events:
+        - `section`: `{"path": [...], "data": ...}` as soon as a top-level section (or a "Detailed Analysis"
+          category) is complete, validated against its sub-model.
+        - `complete`: The full validated `WebpageAnalysisResponse`.
+        - `error`: `{"detail": ...}` if generation or validation fails mid-stream (plus `retry_after` if
+          the call was not admitted by the rate limiter).
+
+    Returns:
+        StreamingResponse: A `text/event-stream` response.
+    """
+    designFile_content, evaluations = await read_and_validate_inputs(htmlText, specification, webAuditResults, designFile)
+    design_hash = design_file_hash(designFile_content) if designFile else None
+    request_key = analysis_cache_key(htmlText, specification, evaluations, design_hash, model, pipeline_fingerprint(False))
+    cached = None
+    if result_cache.enabled and not bypassCache:
+        cached = await result_cache.get(request_key)
+    lease = None
+    if cached is None:
+        lease = client_pool.lease()
+        # Once the stream has started the status can no longer change, so a full queue is rejected here
         try:
-            parsed_audit = json.loads(webAuditResults)
-            # Check required keys inside parsed_audit
-            required_keys = {"axeCoreResult", "pageSpeedResult", "nuValidatorResult", "responsivenessResult"}
-            if not all(key in parsed_audit for key in required_keys):
-                raise HTTPException(status_code=400, detail="Invalid webAuditResults structure")
-        except (json.JSONDecodeError, TypeError):
-            raise HTTPException(status_code=400, detail="Invalid webAuditResults JSON")
-    contents = [get_prompt(htmlText=htmlText, specification=specification, designFile=designFile!=None, webAuditResults=webAuditResults)]
+            rate_limiters.for_model(model, lease.name).check()
+        except RateLimited as e:
+            lease.release()
+            raise HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+    async def events():
+        if cached is not None:
+            for path, value in iter_sections(cached):
+                yield sse_event("section", {"path": list(path), "data": value})
+            yield sse_event("complete", cached.model_dump(mode="json", by_alias=True))
+            return
+
+        uploads = []
+        try:
+            with stage("reduce"):
+                reduction = await asyncio.to_thread(html_reducer.reduce, htmlText)
+            with stage("compact"):
+                audits = await asyncio.to_thread(compact_audits, evaluations)
+            plan = await plan_prompt({}, reduction.html, specification, audits.audits, evaluations, designFile is not None)
+            schema, local_evaluations = render_evaluations(evaluations)
+            if schema is LLMAnalysisResponse:
+                # Available before generation starts
+                yield sse_event("section", {"path": ["Non-LLM Evaluations"], "data": validate_section(("Non-LLM Evaluations",), local_evaluations)})
+            with stage("upload"):
+                design_contents, uploads = await prepare_design_contents(designFile, designFile_content, lease)
+            with stage("prompt"):
+                contents, config = build_contents(design_contents, schema, prefix_cache=lease.client is client, htmlText=plan.html, specification=plan.specification, designFile=designFile!=None, evaluations=plan.audits)
+            parser = SectionParser()
+            record_stage("queue", await rate_limiters.for_model(model, lease.name).acquire(estimate_contents_tokens(contents)))
+            usage = None
+            with stage("generate", model=model), lease.track():
+                stream = await lease.models.generate_content_stream(model=model, contents=contents, config=config)
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    for path, value in parser.feed(chunk.text or ""):
+                        validated = validate_section(path, value)
+                        if validated is not None:
+                            yield sse_event("section", {"path": list(path), "data": reduction.restore_json(validated)})
+            record_usage(model, usage)
+            with stage("parse"):
+                validated_response = WebpageAnalysisResponse.model_validate_json(parser.document())
+            if schema is LLMAnalysisResponse:
+                validated_response.Non_LLM_Evaluations = local_evaluations
+            reduction.restore_response(validated_response)
+            if result_cache.enabled:
+                await result_cache.set(request_key, validated_response)
+            yield sse_event("complete", validated_response.model_dump(mode="json", by_alias=True))
+        except RateLimited as e:
+            logging.error(e)
+            yield sse_event("error", {"detail": e.detail, "retry_after": e.retry_after})
+        except Exception as e:
+            logging.error(e)
+            yield sse_event("error", {"detail": str(e) or "Error with server"})
+        finally:
+            for uploaded in uploads:
+                await dispose_design_file(lease.client, uploaded)
+            lease.release()
+
+    headers = {"Cache-Control": "no-cache"}
+    if result_cache.enabled:
+        headers["X-Cache"] = "HIT" if cached is not None else ("BYPASS" if bypassCache else "MISS")
+    # Also released if the client disconnects before the stream starts
+    background = BackgroundTask(lease.release) if lease is not None else None
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers, background=background)
+
+
+@app.post("/webpage-analysis/batch")
+async def webpage_analysis_batch(
+    background_tasks: BackgroundTasks,
+    pages: Annotated[str, Form()],
+    specification: Annotated[str | None, Form()] = "",
+    designFile: Annotated[UploadFile | None, File()] = None,
+    bypassCache: Annotated[bool, Form()] = False,
+    concurrency: Annotated[int | None, Form()] = None,
+    stream: Annotated[bool, Form()] = False,
+    offline: Annotated[bool, Form()] = False
+):
+    """
+    Analyzes many pages in one request (see `app.batch`).
+
+    Accepts:
+        - `pages`: JSON array of `{"id"?, "htmlText", "specification"?, "webAuditResults"?}` objects.
+        - `specification`: Specification used for pages without their own.
+        - `designFile`: Optional design image shared by all pages; prepared (inlined or uploaded) once.
+        - `bypassCache`: Skip the result cache lookup.
+        - `concurrency`: Maximum number of pages analyzed at the same time (capped at `BATCH_CONCURRENCY`).
+        - `stream`: Stream one NDJSON line per page as it completes instead of returning all results at once.
+        - `offline`: Submit the pages to the provider's batch-prediction API and return the job name; collect
+          the results later with `GET /webpage-analysis/batch/{name}`.
+
+    Pages are validated individually: an invalid page yields an error entry, not a failed request.
+
+    Returns:
+        `{"results": [...]}` in page order, an NDJSON stream of result entries, or (offline) `{"batch", "state", "results"}`.
+
+    Raises:
+        HTTPException:
+            - 400: Malformed `pages` or invalid design file.
+    """
+    try:
+        parsed_pages = parse_batch_pages(pages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    designFile_content = await read_design_file(designFile)
+    design_hash = design_file_hash(designFile_content) if designFile else None
+    if offline:
+        return await submit_offline_batch(parsed_pages, specification, designFile, designFile_content, design_hash, bypassCache)
+
+    shared_design: list[tuple[list, list]] = []
+    design_lock = asyncio.Lock()
+    # An uploaded design only exists for the client that uploaded it, so such batches stay on one client;
+    # otherwise every page is routed on its own
+    batch_lease = client_pool.lease() if designFile and not can_inline(designFile_content) else None
+
+    async def prepare_shared_design(lease: ClientLease) -> tuple[list, list]:
+        # Prepared on the first cache miss, then reused by every page; deleted after the batch
+        async with design_lock:
+            if not shared_design:
+                shared_design.append(await prepare_design_contents(designFile, designFile_content, lease))
+        return shared_design[0][0], []
+
+    async def analyse_page(index: int, page: dict) -> dict:
+        page_specification = page.get("specification") or specification
+        evaluations = validate_text_inputs(page.get("htmlText"), page_specification, page["webAuditResults"])
+        headers = {}
+        result = await run_analysis(headers, page["htmlText"], page_specification, evaluations, design_hash, prepare_shared_design,
+                                    bypassCache=bypassCache, chunked=page.get("chunked"), fanout=page.get("fanout"), lease=batch_lease)
+        return {"index": index, "id": page_id(page, index), "status": "ok", "cache": headers.get("X-Cache"),
+                "result": result.model_dump(mode="json", by_alias=True)}
+
+    async def delete_shared_design():
+        for uploaded in shared_design[0][1] if shared_design else []:
+            await dispose_design_file(batch_lease.client, uploaded)
+        if batch_lease is not None:
+            batch_lease.release()
+
+    limit = min(concurrency, BATCH_CONCURRENCY) if concurrency else BATCH_CONCURRENCY
+    if stream:
+        async def lines():
+            try:
+                async for entry in run_batch(parsed_pages, analyse_page, limit):
+                    yield ndjson_line(entry)
+            finally:
+                await delete_shared_design()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = [entry async for entry in run_batch(parsed_pages, analyse_page, limit)]
+    background_tasks.add_task(delete_shared_design)
+    return {"results": sorted(results, key=lambda entry: entry["index"])}
+
+
+async def submit_offline_batch(pages: list[dict], specification: str | None, designFile: UploadFile | None, designFile_content: bytes | None, design_hash: str | None, bypassCache: bool) -> JSONResponse:
+    """
+    Submits one generation request per page to the provider's batch-prediction API.
+
+    Cache hits and invalid pages are resolved immediately. Offline requests carry the full prompt (a cached
+    prompt prefix may expire before the job runs) and use single-call generation, without chunking or fan-out.
+
+    Returns:
+        JSONResponse: 202 with `{"batch": <job name or null>, "state", "results"}` (results known so far).
+    """
+    batch = OfflineBatch()
+    requests = []
+    design_contents = []
     if designFile:
-      temp_file_path = ''.join(random.choices(string.ascii_letters + string.digits, k=12)) + designFile.filename 
+        images = await normalize_design(designFile, designFile_content)
+        design_contents = design_preamble(len(images))
+        for index, (content, mime_type) in enumerate(images):
+            if can_inline(content):
+                design_contents.append(inline_design_part(content, mime_type))
+            else:
+                # Dedicated uploads: must outlive the job, independent of the design file cache
+                uploaded = await upload_design_file(client, content, mime_type, design_display_name(designFile, index, len(images)))
+                design_contents.append(uploaded)
+                batch.uploads.append(uploaded.name)
+
+    for index, page in enumerate(pages):
+        try:
+            page_specification = page.get("specification") or specification
+            evaluations = validate_text_inputs(page.get("htmlText"), page_specification, page["webAuditResults"])
+            request_key = analysis_cache_key(page["htmlText"], page_specification, evaluations, design_hash, model, pipeline_fingerprint(False))
+            cached = await result_cache.get(request_key) if result_cache.enabled and not bypassCache else None
+            if cached is not None:
+                batch.results[index] = {"index": index, "id": page_id(page, index), "status": "ok", "cache": "HIT",
+                                        "result": cached.model_dump(mode="json", by_alias=True)}
+                continue
+            reduction = await asyncio.to_thread(html_reducer.reduce, page["htmlText"])
+            audits = await asyncio.to_thread(compact_audits, evaluations)
+            plan = await plan_prompt({}, reduction.html, page_specification, audits.audits, evaluations, design_hash is not None)
+            schema, local_evaluations = render_evaluations(evaluations)
+            prompt = get_prompt(htmlText=plan.html, specification=plan.specification, designFile=design_hash is not None, evaluations=plan.audits)
+            requests.append({"contents": [prompt, *design_contents], "config": generation_config(schema)})
+
+            async def finish(text: str, reduction=reduction, schema=schema, local_evaluations=local_evaluations, request_key=request_key) -> dict:
+                validated_response = WebpageAnalysisResponse.model_validate_json(text)
+                if schema is LLMAnalysisResponse:
+                    validated_response.Non_LLM_Evaluations = local_evaluations
+                reduction.restore_response(validated_response)
+                if result_cache.enabled:
+                    await result_cache.set(request_key, validated_response)
+                return validated_response.model_dump(mode="json", by_alias=True)
+
+            batch.pages.append(OfflinePage(index=index, id=page_id(page, index), request_key=request_key, finish=finish))
+        except Exception as e:
+            batch.results[index] = error_entry(index, page, e)
+
+    if not requests:
+        for upload in batch.uploads:
+            await delete_design_file(client, upload)
+        return JSONResponse(status_code=202, content={"batch": None, "state": "JOB_STATE_SUCCEEDED", "results": batch.ordered_results()})
     try:
-      if designFile:
-          with open(temp_file_path, "wb") as f:
-              f.write(designFile_content)
-          
-          uploaded = client.files.upload(file=temp_file_path)
-          contents.append(uploaded)
-          os.remove(temp_file_path)
-      # contents = [text_prompt, uploaded]
-      response = client.models.generate_content(
-          model=model,
-          contents=contents
-      )
-
-      if designFile:
-          client.files.delete(name=uploaded.name)
-      return_object = json.loads(response.text)
-      validated_response = WebpageAnalysisResponse.model_validate(return_object)
-
-      return validated_response
+        job = await client.batches.create(model=model, src=requests, config={"display_name": f"webpage-analysis-{len(requests)}-pages"})
     except Exception as e:
         logging.error(e)
-        raise HTTPException(status_code=500, detail=str(e) or "Error with server")
-    finally:
-        if designFile and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-    
\ No newline at end of file
+        for upload in batch.uploads:
+            await delete_design_file(client, upload)
+        raise HTTPException(status_code=502, detail=f"Batch submission failed: {e}")
+    offline_batches.add(job.name, batch)
+    state = getattr(job.state, "value", job.state)
+    return JSONResponse(status_code=202, content={"batch": job.name, "state": state, "results": batch.ordered_results()})
+
+
+@app.get("/webpage-analysis/batch/{name:path}")
+async def webpage_analysis_batch_status(name: str):
+    """
+    Returns the state of an offline batch and, once the provider job has finished, every page's result.
+
+    Returns:
+        `{"batch", "state", "done", "results"}`; `results` holds all pages once `done` is true.
+
+    Raises:
+        HTTPException:
+            - 404: Unknown batch (e.g. submitted to another worker, before a restart, or collected more than
+              `OFFLINE_BATCH_TTL_SECONDS` ago).
+            - 502: The provider could not be queried.
+    """
+    batch = offline_batches.get(name)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Unknown batch")
+    if not batch.collected:
+        state = await offline_batch_polls.do(name, partial(poll_offline_batch, name, batch))
+        if not batch.collected:
+            return {"batch": name, "state": state, "done": False, "results": batch.ordered_results()}
+    return {"batch": name, "state": batch.state, "done": True, "results": batch.ordered_results()}
+
+
+async def poll_offline_batch(name: str, batch: OfflineBatch) -> str:
+    """
+    Queries the provider job of an offline batch and collects it once finished, deleting its uploads.
+
+    Runs once per batch among concurrent polls (see `offline_batch_polls`).
+
+    Returns:
+        str: The provider job's state.
+
+    Raises:
+        HTTPException:
+            - 502: The provider could not be queried.
+    """
+    if batch.collected:
+        # Collected by a poll that finished while this one was being scheduled
+        return batch.state
+    try:
+        job = await client.batches.get(name=name)
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(status_code=502, detail=f"Batch lookup failed: {e}")
+    state = getattr(job.state, "value", job.state)
+    if state in TERMINAL_STATES:
+        await collect_offline_batch(batch, job)
+        offline_batches.collected(batch)
+        for upload in batch.uploads:
+            await delete_design_file(client, upload)
+    return state
+
+
+async def process_job(job: Job) -> str:
+    """
+    Runs the analysis of a claimed job (see `app.jobs`).
+
+    Args:
+        job (Job): The job with its stored inputs.
+
+    Returns:
+        str: The validated `WebpageAnalysisResponse` as JSON.
+    """
+    payload = job.payload
+    evaluations = validate_text_inputs(payload["htmlText"], payload["specification"], payload["webAuditResults"])
+    designFile = None
+    if job.design is not None:
+        designFile = UploadFile(io.BytesIO(job.design), filename=job.design_name, headers=Headers({"content-type": job.design_type}))
+    design_hash = design_file_hash(job.design) if job.design is not None else None
+    result = await run_analysis({}, payload["htmlText"], payload["specification"], evaluations, design_hash,
+                                partial(prepare_design_contents, designFile, job.design),
+                                bypassCache=payload["bypassCache"], chunked=payload["chunked"], fanout=payload["fanout"])
+    return result.model_dump_json(by_alias=True)
+
+
+job_workers = JobWorkers(job_store, process_job)
+
+JOBS_DISABLED = "Job queue disabled, set JOBS_PATH to enable it"
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    response: Response,
+    htmlText: Annotated[str, Form()],
+    specification: Annotated[str | None, Form()] = "",
+    webAuditResults: Annotated[str | None, Form()] = "",
+    designFile: Annotated[UploadFile | None, File()] = None,
+    bypassCache: Annotated[bool, Form()] = False,
+    chunked: Annotated[bool | None, Form()] = None,
+    fanout: Annotated[bool | None, Form()] = None,
+    idempotency_key: Annotated[str | None, Header(alias="Idempotency-Key")] = None
+):
+    """
+    Validates an analysis request and enqueues it as a job (see `app.jobs`).
+
+    Accepts the same inputs as `/webpage-analysis`, plus an optional `Idempotency-Key` header: resubmitting
+    with the same key returns the existing job (200) instead of enqueueing another one.
+
+    Returns:
+        `{"id", "status", ...}` (202, `Location: /jobs/{id}`).
+
+    Raises:
+        HTTPException:
+            - 400: Invalid or missing input data.
+            - 409: The idempotency key was used for different inputs.
+            - 503: The job queue is disabled (`JOBS_PATH` unset) or its store is unavailable.
+    """
+    if not job_store.enabled:
+        raise HTTPException(status_code=503, detail=JOBS_DISABLED)
+    designFile_content, evaluations = await read_and_validate_inputs(htmlText, specification, webAuditResults, designFile)
+    design_hash = design_file_hash(designFile_content) if designFile else None
+    request_key = analysis_cache_key(htmlText, specification, evaluations, design_hash, model, pipeline_fingerprint(chunked, fanout))
+    payload = {"htmlText": htmlText, "specification": specification, "webAuditResults": webAuditResults,
+               "bypassCache": bypassCache, "chunked": chunked, "fanout": fanout}
+    try:
+        job, created = await asyncio.to_thread(
+            job_store.create, request_key, payload, designFile_content,
+            designFile.content_type if designFile else None, designFile.filename if designFile else None, idempotency_key
+        )
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different request")
+    except sqlite3.Error as e:
+        logging.error(e)
+        raise HTTPException(status_code=503, detail="Job store unavailable")
+    if created:
+        job_workers.notify()
+    else:
+        response.status_code = 200
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job.public()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns a job's status and, once it succeeded, the validated `WebpageAnalysisResponse` (or the error).
+
+    Raises:
+        HTTPException:
+            - 404: Unknown or purged job.
+            - 503: The job queue is disabled (`JOBS_PATH` unset).
+    """
+    if not job_store.enabled:
+        raise HTTPException(status_code=503, detail=JOBS_DISABLED)
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.public()
@@ -0,0 +1,338 @@
+"""
+Per-stage latency, token and payload instrumentation.
+
+Stages of an analysis are timed with `stage(name)`:
+
+    intake      Receiving and parsing the multipart form (until the endpoint runs).
+    validate    Size checks and parsing/verifying `webAuditResults`.
+    diff        Diffing a resubmitted page against a previous analysis (see `app.incremental`).
+    reduce      HTML reduction (see `app.html_reduction`).
+    compact     Audit compaction (see `app.audit_compaction`).
+    budget      Token preflight (see `app.budget`).
+    design      Normalizing the design image (see `app.design_images`).
+    prompt      Building the prompt and generation config.
+    upload      Inlining or uploading the design file.
+    queue       Waiting for the rate limiter (see `app.rate_limit`).
+    generate    The `generate_content` call.
+    parse       Parsing and validating the model's JSON output.
+
+Every stage is recorded three ways:
+- in the `analysis_stage_seconds` histogram of the process-wide `registry`, exported in the Prometheus
+  text format at `GET /metrics` (with upstream token usage, payload sizes and error classes),
+- in the current request's `RequestTimings`, sent back as a `Server-Timing` response header by
+  `MetricsMiddleware` (`SERVER_TIMING_ENABLED`). Stages that run several times in one request (retries,
+  chunks, fan-out calls) are summed, so concurrent stages may add up to more than the wall time,
+- as an OpenTelemetry span when `OTEL_TRACING_ENABLED` is set and `opentelemetry-api` is installed. The
+  spans go wherever the configured tracer provider exports them (e.g. `opentelemetry-instrument`).
+
+The process also reports its event-loop lag (`event_loop_lag_seconds`, sampled every
+`EVENT_LOOP_LAG_INTERVAL_SECONDS` by `monitor_event_loop`) and resident memory, which the benchmark
+harness (`app.bench`) reads from `/metrics`.
+
+Streaming responses send their headers before generation starts, so their `Server-Timing` only covers
+the stages before the stream.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+OTEL_TRACING_ENABLED = os.getenv("OTEL_TRACING_ENABLED", "false").lower() == "true"
+# How often the event loop's scheduling delay is sampled. 0 disables the monitor.
+EVENT_LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.1"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+TOKEN_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[tuple(map(str, labels))] += amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, usually set right before rendering.
+    """
+    type = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[tuple(map(str, labels))] = value
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, with their count and sum.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = (*buckets, math.inf)
+        self.counts: dict[tuple[str, ...], list[int]] = {}
+        self.sums: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, *labels: str, value: float) -> None:
+        key = tuple(map(str, labels))
+        counts = self.counts.setdefault(key, [0] * len(self.buckets))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        self.sums[key] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, counts in sorted(self.counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, f'le=\"{_number(bound)}\"')} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(self.sums[key])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of the process, rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+requests_total = registry.counter("http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+request_seconds = registry.histogram("http_request_duration_seconds", "Time until the response headers were sent.", ("route", "method"))
+stage_seconds = registry.histogram("analysis_stage_seconds", "Duration of each analysis stage.", ("stage",))
+payload_bytes = registry.histogram("analysis_payload_bytes", "Size of analysis inputs and model outputs.", ("field",), SIZE_BUCKETS)
+upstream_tokens = registry.histogram("gemini_tokens", "Tokens of each generation call as reported by the API.", ("model", "kind"), TOKEN_BUCKETS)
+design_image_saved = registry.counter("design_image_saved_total", "Bytes and estimated image tokens saved by design image normalization.", ("unit",))
+generation_attempts_total = registry.counter("generation_attempts_total", "Generation attempts by model, kind and outcome.", ("model", "kind", "outcome"))
+errors_total = registry.counter("analysis_errors_total", "Failed analyses by stage and error class.", ("stage", "error"))
+event_loop_lag = registry.histogram("event_loop_lag_seconds", "Delay of the event loop in running a scheduled wake-up.", (), LAG_BUCKETS)
+resident_memory = registry.gauge("process_resident_memory_bytes", "Resident memory size of the process.")
+
+
+class RequestTimings:
+    """
+    Stage durations of one request, for the `Server-Timing` header.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.start = clock()
+        self.stages: dict[str, float] = defaultdict(float)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] += seconds
+
+    def elapsed(self) -> float:
+        return self._clock() - self.start
+
+    def server_timing(self) -> str:
+        """
+        Renders the stages as a `Server-Timing` header value, e.g. "validate;dur=1.2, generate;dur=830.5".
+        """
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+
+_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+_tracer = trace.get_tracer("webpage-analysis") if trace is not None and OTEL_TRACING_ENABLED else None
+
+
+def current_timings() -> RequestTimings | None:
+    """
+    Returns the timings of the request being handled, if any (None in job workers and tests without
+    the middleware).
+    """
+    return _timings.get()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """
+    Records a stage measured by the caller.
+    """
+    if METRICS_ENABLED:
+        stage_seconds.observe(name, value=seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Times one analysis stage (see the module docstring). Errors escaping the stage are counted by class.
+
+    Args:
+        name (str): The stage name.
+        **attributes: Span attributes when tracing is enabled.
+    """
+    start = time.perf_counter()
+    span = _tracer.start_as_current_span(f"analysis.{name}", attributes=attributes) if _tracer is not None else nullcontext()
+    try:
+        with span:
+            yield
+    except Exception as e:
+        record_error(name, e)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_error(stage_name: str, error: Exception) -> None:
+    if METRICS_ENABLED:
+        errors_total.inc(stage_name, type(error).__name__)
+
+
+def record_size(field: str, size: int) -> None:
+    """
+    Records the size in bytes (or characters, for text) of an input or output.
+    """
+    if METRICS_ENABLED:
+        payload_bytes.observe(field, value=size)
+
+
+def record_usage(model: str, usage) -> None:
+    """
+    Records the token counts of a generation call from its `usage_metadata`.
+
+    Args:
+        model (str): The model that was called.
+        usage: The response's `usage_metadata` (prompt, candidates and cached-content token counts).
+            Missing counts are skipped.
+    """
+    if not METRICS_ENABLED or usage is None:
+        return
+    for kind, attribute in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("cached", "cached_content_token_count")):
+        count = getattr(usage, attribute, None)
+        if isinstance(count, int):
+            upstream_tokens.observe(model, kind, value=count)
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS, clock=time.perf_counter) -> None:
+    """
+    Samples how late the event loop wakes up from a sleep, until cancelled. Blocking work on the loop
+    (CPU-bound parsing, synchronous I/O) shows up as lag.
+    """
+    while True:
+        start = clock()
+        await asyncio.sleep(interval)
+        event_loop_lag.observe(value=max(0.0, clock() - start - interval))
+
+
+def resident_memory_bytes() -> int | None:
+    """
+    Returns the resident memory of this process (Linux), or None where it cannot be read.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and their latency by route, and adding the `Server-Timing` header.
+
+    Routes are labelled with their path template (`/jobs/{job_id}`), so ids do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if METRICS_ENABLED:
+                    request_seconds.observe(_route(scope), scope["method"], value=timings.elapsed())
+                if SERVER_TIMING_ENABLED and timings.stages:
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", timings.server_timing().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            if METRICS_ENABLED:
+                requests_total.inc(_route(scope), scope["method"], status)
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
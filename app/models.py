@@ -141,3 +141,24 @@ class WebpageAnalysisResponse(BaseModel):
         "alias_generator": None,
         "json_encoders": {},
     }
+
+
+class LLMAnalysisResponse(BaseModel):
+    """
+    The part of `WebpageAnalysisResponse` generated by the model when the "Non-LLM Evaluations" section
+    is rendered locally (see `app.audit_reports`). Used as the response schema in that mode.
+
+    Attributes:
+        Executive_Summary: Brief summary of key findings.
+        Detailed_Analysis: In-depth breakdown of issues (content, styling, etc.).
+        Other_Issues: Any other findings not captured by the categories above.
+    """
+    Executive_Summary: Optional[str] = Field(default=None, alias="Executive Summary")
+    Detailed_Analysis: Optional[DetailedAnalysis] = Field(default=None, alias="Detailed Analysis")
+    Other_Issues: List[OtherIssue] = Field(default_factory=list, alias="Other Issues")
+
+    model_config = {
+        "populate_by_name": True,
+        "alias_generator": None,
+        "json_encoders": {},
+    }
@@ -0,0 +1,221 @@
+"""
+Admission control in front of `generate_content`, per model.
+
+Gemini enforces requests-per-minute (RPM) and input-tokens-per-minute (TPM) quotas per model; going over
+them returns 429s for every call until the minute rolls over. `RateLimiter` keeps the service under the
+configured quota instead: each call takes one request and its estimated prompt tokens (see
+`app.tokens.estimate_contents_tokens`) from two token buckets refilled continuously at `rpm`/`tpm` per
+minute. Calls that have to wait queue up in FIFO order.
+
+The queue is bounded twice, so bursts fail fast instead of piling up:
+- at most `RATE_LIMIT_QUEUE_SIZE` calls wait at the same time,
+- a call is rejected right away if it would wait longer than `RATE_LIMIT_MAX_WAIT_SECONDS`.
+
+Rejected calls raise `RateLimited`, which the endpoints turn into a 429 with a `Retry-After` header.
+A limit of 0 disables that bucket; both 0 (the default) disables admission control.
+"""
+
+import asyncio
+import math
+import os
+import time
+
+# Default quota of every model. 0 disables the limit.
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "0"))
+# Per-model overrides: "model=rpm:tpm,other-model=rpm:tpm"
+MODEL_RATE_LIMITS = os.getenv("MODEL_RATE_LIMITS", "")
+# Maximum number of calls waiting for quota at the same time
+RATE_LIMIT_QUEUE_SIZE = int(os.getenv("RATE_LIMIT_QUEUE_SIZE", "100"))
+# Calls that would wait longer than this for quota are rejected
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+
+
+class RateLimited(Exception):
+    """
+    Raised when a call is not admitted. Carries the HTTP status like `HTTPException`, so batch
+    entries and jobs report it as a 429.
+
+    Attributes:
+        retry_after: Suggested number of seconds to wait before retrying.
+    """
+    status_code = 429
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Model quota exhausted, retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.detail = str(self)
+
+
+def parse_model_limits(value: str) -> dict[str, tuple[int, int]]:
+    """
+    Parses `MODEL_RATE_LIMITS`.
+
+    Args:
+        value (str): e.g. "gemini-2.5-pro=150:2000000,gemini-2.5-flash=1000:1000000".
+
+    Returns:
+        dict[str, tuple[int, int]]: (rpm, tpm) by model.
+
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    limits = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(","))):
+        name, _, quota = entry.rpartition("=")
+        rpm, _, tpm = quota.partition(":")
+        if not name or not rpm.strip().isdigit() or not tpm.strip().isdigit():
+            raise ValueError(f"Invalid MODEL_RATE_LIMITS entry: {entry!r}")
+        limits[name.strip()] = (int(rpm), int(tpm))
+    return limits
+
+
+class RateLimiter:
+    """
+    RPM/TPM token buckets of one model with a bounded FIFO wait queue.
+    """
+
+    def __init__(self, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM, queue_size: int = RATE_LIMIT_QUEUE_SIZE, max_wait: float = RATE_LIMIT_MAX_WAIT_SECONDS, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        # Buckets start full: a fresh process may use a whole minute's quota right away
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+        self.queued = 0
+        self.stats = {"admitted": 0, "rejected": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _delay(self, tokens: int) -> float:
+        # Seconds until both buckets hold enough for this call
+        delay = 0.0
+        if self.rpm:
+            delay = max(delay, (1 - self._requests) * 60 / self.rpm)
+        if self.tpm:
+            delay = max(delay, (tokens - self._tokens) * 60 / self.tpm)
+        return delay
+
+    def _reject(self, delay: float, ahead: int) -> RateLimited:
+        self.stats["rejected"] += 1
+        # Time for the calls queued ahead to drain, plus this call's own wait
+        backlog = ahead * 60 / self.rpm if self.rpm else 0
+        return RateLimited(max(1, math.ceil(delay + backlog)))
+
+    def check(self) -> None:
+        """
+        Fails fast when the wait queue is full, e.g. before starting a streaming response.
+
+        Raises:
+            RateLimited: If no more calls may queue.
+        """
+        if self.enabled and self.queued >= self.queue_size:
+            raise self._reject(self._delay(0), self.queued)
+
+    async def acquire(self, tokens: int) -> float:
+        """
+        Waits until the call fits the quota and takes it from the buckets.
+
+        Args:
+            tokens (int): Estimated input tokens of the call. Capped at `tpm`, so an oversized prompt
+                waits for a full bucket instead of never being admitted.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            RateLimited: If the queue is full or the call would wait longer than `max_wait`.
+        """
+        if not self.enabled:
+            return 0.0
+        self.check()
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        start = self._clock()
+        self.queued += 1
+        try:
+            if not self._lock.locked():
+                await self._lock.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(self._lock.acquire(), self.max_wait)
+                except asyncio.TimeoutError:
+                    raise self._reject(self.max_wait, self.queued - 1)
+            try:
+                self._refill()
+                delay = self._delay(tokens)
+                if delay > 0 and self._clock() - start + delay > self.max_wait:
+                    raise self._reject(delay, self.queued - 1)
+                if delay > 0:
+                    await self._sleep(delay)
+                    self._refill()
+                if self.rpm:
+                    self._requests -= 1
+                if self.tpm:
+                    self._tokens -= tokens
+            finally:
+                self._lock.release()
+        finally:
+            self.queued -= 1
+        waited = self._clock() - start
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds_total"] += waited
+        self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+        return waited
+
+    def snapshot(self) -> dict:
+        """
+        Returns the limits, current queue depth and wait statistics.
+        """
+        self._refill()
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "queued": self.queued,
+            "queue_size": self.queue_size,
+            "available_requests": math.floor(self._requests) if self.rpm else None,
+            "available_tokens": math.floor(self._tokens) if self.tpm else None,
+            **self.stats,
+        }
+
+
+class RateLimiters:
+    """
+    One `RateLimiter` per model (and per client of the pool, since quotas are per key / project),
+    created on first use with the model's quota.
+    """
+
+    def __init__(self, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM, model_limits: dict[str, tuple[int, int]] | None = None, queue_size: int = RATE_LIMIT_QUEUE_SIZE, max_wait: float = RATE_LIMIT_MAX_WAIT_SECONDS, **limiter_kwargs):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.model_limits = parse_model_limits(MODEL_RATE_LIMITS) if model_limits is None else model_limits
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._limiter_kwargs = limiter_kwargs
+        self._limiters: dict[str, RateLimiter] = {}
+
+    def for_model(self, model: str, client_name: str | None = None) -> RateLimiter:
+        key = f"{client_name}:{model}" if client_name else model
+        if key not in self._limiters:
+            rpm, tpm = self.model_limits.get(model, (self.rpm, self.tpm))
+            self._limiters[key] = RateLimiter(rpm, tpm, self.queue_size, self.max_wait, **self._limiter_kwargs)
+        return self._limiters[key]
+
+    def snapshot(self) -> dict[str, dict]:
+        return {model: limiter.snapshot() for model, limiter in self._limiters.items()}
@@ -0,0 +1,215 @@
+"""
+Retries, hedging and model fallback around one generation call.
+
+`ResilientGenerator.run` wraps a call that returns the model's raw JSON text, and returns the output
+validated (parsed) by the caller's `validate`:
+
+- Transient errors (timeouts, connection errors, 408/429/5xx from the API) are retried up to
+  `GENERATION_MAX_RETRIES` times with full-jitter exponential backoff (`GENERATION_BACKOFF_SECONDS`,
+  capped at `GENERATION_BACKOFF_MAX_SECONDS`).
+- Output that fails schema validation is re-issued once (`GENERATION_REVALIDATE`).
+- With `HEDGE_AFTER_SECONDS` set, a second identical call is started when the first one has not
+  finished after that long; the first valid result wins and the other call is cancelled.
+- With `FALLBACK_MODEL` set, the call is repeated on that model once the primary model has used up
+  its retries on transient errors or invalid output.
+
+Rejections of the local rate limiter (`app.rate_limit.RateLimited`) are never retried: they mean the
+quota is exhausted and the caller should back off.
+
+Every attempt is recorded in `AttemptStats` by model, kind and outcome.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, TypeVar
+
+from pydantic import ValidationError
+
+from .metrics import generation_attempts_total
+from .rate_limit import RateLimited
+
+T = TypeVar("T")
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+GENERATION_MAX_RETRIES = int(os.getenv("GENERATION_MAX_RETRIES", "2"))
+GENERATION_BACKOFF_SECONDS = float(os.getenv("GENERATION_BACKOFF_SECONDS", "1"))
+GENERATION_BACKOFF_MAX_SECONDS = float(os.getenv("GENERATION_BACKOFF_MAX_SECONDS", "10"))
+# Re-issue the call once when the model's output fails schema validation
+GENERATION_REVALIDATE = os.getenv("GENERATION_REVALIDATE", "true").lower() == "true"
+# Start a second, identical call when the first has not finished after this long. 0 disables hedging.
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "0"))
+# Model used once the primary model keeps failing. Empty disables the fallback.
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "")
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Checks whether a generation error is worth retrying.
+
+    Args:
+        error (Exception): The error raised by the call.
+
+    Returns:
+        bool: True for timeouts, connection errors and 408/429/5xx API errors.
+    """
+    if isinstance(error, RateLimited):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    # google.genai.errors.APIError carries the HTTP status as `code`
+    code = getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = getattr(error, "status_code", None)
+    return code in TRANSIENT_STATUS_CODES
+
+
+class AttemptStats:
+    """
+    Counts generation attempts and their duration by (model, kind, outcome). Attempts are also counted in
+    the process-wide `generation_attempts_total` metric.
+
+    Kinds: "first", "retry", "revalidate", "hedge". Outcomes: "ok", "invalid", "transient", "error",
+    "cancelled".
+    """
+
+    def __init__(self):
+        self.counts: dict[tuple[str, str, str], int] = defaultdict(int)
+        self.seconds: dict[tuple[str, str, str], float] = defaultdict(float)
+
+    def record(self, model: str, kind: str, outcome: str, seconds: float) -> None:
+        key = (model, kind, outcome)
+        self.counts[key] += 1
+        self.seconds[key] += seconds
+        generation_attempts_total.inc(model, kind, outcome)
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {"model": model, "kind": kind, "outcome": outcome, "count": count, "seconds_total": self.seconds[(model, kind, outcome)]}
+            for (model, kind, outcome), count in sorted(self.counts.items())
+        ]
+
+
+class ResilientGenerator:
+    """
+    Runs generation calls with retries, hedging and model fallback (see the module docstring).
+    """
+
+    def __init__(self, max_retries: int = GENERATION_MAX_RETRIES, backoff: float = GENERATION_BACKOFF_SECONDS, backoff_max: float = GENERATION_BACKOFF_MAX_SECONDS, revalidate: bool = GENERATION_REVALIDATE, hedge_after: float = HEDGE_AFTER_SECONDS, fallback_model: str = FALLBACK_MODEL, sleep=asyncio.sleep, jitter=random.random):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.revalidate = revalidate
+        self.hedge_after = hedge_after
+        self.fallback_model = fallback_model
+        self.stats = AttemptStats()
+        self._sleep = sleep
+        self._jitter = jitter
+
+    def backoff_delay(self, retry: int) -> float:
+        """
+        Full-jitter exponential backoff before the given retry (1-based).
+        """
+        return self._jitter() * min(self.backoff_max, self.backoff * 2 ** (retry - 1))
+
+    async def _attempt(self, model: str, kind: str, call: Callable[[str], Awaitable[str]], validate: Callable[[str], T]) -> T:
+        start = time.monotonic()
+        outcome = "error"
+        try:
+            text = await call(model)
+            try:
+                output = validate(text)
+            except ValidationError:
+                outcome = "invalid"
+                raise
+            outcome = "ok"
+            return output
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            if outcome != "invalid" and is_transient(e):
+                outcome = "transient"
+            raise
+        finally:
+            self.stats.record(model, kind, outcome, time.monotonic() - start)
+
+    async def _hedged(self, model: str, kind: str, call: Callable[[str], Awaitable[str]], validate: Callable[[str], T]) -> T:
+        first = asyncio.create_task(self._attempt(model, kind, call, validate))
+        if self.hedge_after <= 0:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                logging.info(f"Generation on {model} slower than {self.hedge_after}s, sending a hedge request")
+                tasks.add(asyncio.create_task(self._attempt(model, "hedge", call, validate)))
+            errors = []
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+            # Both calls failed: report the first failure
+            raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run_model(self, model: str, call: Callable[[str], Awaitable[str]], validate: Callable[[str], T]) -> T:
+        retries = 0
+        revalidated = False
+        kind = "first"
+        while True:
+            try:
+                return await self._hedged(model, kind, call, validate)
+            except ValidationError:
+                if not self.revalidate or revalidated:
+                    raise
+                revalidated = True
+                kind = "revalidate"
+                logging.warning(f"Output of {model} failed validation, re-issuing the call")
+            except Exception as e:
+                if not is_transient(e) or retries >= self.max_retries:
+                    raise
+                retries += 1
+                kind = "retry"
+                delay = self.backoff_delay(retries)
+                logging.warning(f"Transient error from {model} ({e}), retry {retries}/{self.max_retries} in {delay:.1f}s")
+                await self._sleep(delay)
+
+    async def run(self, model: str, call: Callable[[str], Awaitable[str]], validate: Callable[[str], T]) -> T:
+        """
+        Runs a generation call until it returns valid output.
+
+        Args:
+            model (str): The primary model.
+            call (Callable[[str], Awaitable[str]]): Runs one generation call on the given model and
+                returns the raw JSON text.
+            validate (Callable[[str], T]): Parses the output; raises `pydantic.ValidationError` for invalid output.
+
+        Returns:
+            T: The first valid output, as returned by `validate`.
+
+        Raises:
+            Exception: The last error if every attempt failed.
+        """
+        try:
+            return await self._run_model(model, call, validate)
+        except Exception as e:
+            if not self.fallback_model or self.fallback_model == model or not (is_transient(e) or isinstance(e, ValidationError)):
+                raise
+            logging.warning(f"Generation on {model} failed ({e}), falling back to {self.fallback_model}")
+            return await self._run_model(self.fallback_model, call, validate)
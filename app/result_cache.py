@@ -0,0 +1,228 @@
+"""
+Response cache for `/webpage-analysis`.
+
+Identical analysis requests (same normalized inputs, design image, model and prompt template version)
+return the stored, already validated `WebpageAnalysisResponse` instead of making a new LLM call.
+
+The cache has two tiers:
+1. An in-process LRU (`MemoryTier`), bounded by entry count.
+2. An optional SQLite tier (`SqliteTier`) that survives restarts and can be shared by several workers
+   on the same host. Enabled by setting `RESULT_CACHE_PATH`.
+
+Both tiers expire entries after `RESULT_CACHE_TTL_SECONDS` and evict the least recently used entries
+when full.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .models import WebpageAnalysisResponse
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# SQLite file for the persistent tier. Empty disables it.
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+RESULT_CACHE_MAX_DISK_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_DISK_ENTRIES", "10000"))
+
+
+def _normalize_text(text: str | None) -> str:
+    return (text or "").replace("\r\n", "\n").strip()
+
+
+def _normalize_audit(webAuditResults: str | dict | None) -> str:
+    # Key order and whitespace in the audit JSON must not change the key
+    if not webAuditResults:
+        return ""
+    try:
+        parsed = json.loads(webAuditResults) if isinstance(webAuditResults, str) else webAuditResults
+        return json.dumps(parsed, sort_keys=True, separators=(",", ":"))
+    except (json.JSONDecodeError, TypeError):
+        return _normalize_text(webAuditResults)
+
+
+def analysis_cache_key(htmlText: str, specification: str | None, webAuditResults: str | dict | None, design_hash: str | None, model: str | None, prompt_version: str) -> str:
+    """
+    Builds a stable cache key for an analysis request.
+
+    Args:
+        htmlText (str): The HTML content to be analyzed.
+        specification (str | None): Optional design or functional specifications.
+        webAuditResults (str | dict | None): Optional audit JSON string, or the already parsed object.
+            Compared structurally, not textually.
+        design_hash (str | None): SHA-256 of the design image, if any.
+        model (str | None): The Gemini model name.
+        prompt_version (str): Version of the prompt template; bump it to invalidate old results.
+
+    Returns:
+        str: A hex SHA-256 digest identifying the request.
+    """
+    payload = json.dumps([
+        _normalize_text(htmlText),
+        _normalize_text(specification),
+        _normalize_audit(webAuditResults),
+        design_hash or "",
+        model or "",
+        prompt_version,
+    ], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """
+    In-process LRU of serialized responses with a per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (value, self._clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteTier:
+    """
+    Persistent cache tier backed by a SQLite file in WAL mode, so several workers can share it.
+
+    Methods are blocking; `ResultCache` runs them in a worker thread.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS analysis_cache_accessed ON analysis_cache (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call: cheap for SQLite and safe across worker threads
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> str | None:
+        now = self._clock()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = self._clock()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now),
+            )
+            conn.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN ("
+                "SELECT key FROM analysis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class ResultCache:
+    """
+    Two-tier cache of validated `WebpageAnalysisResponse` objects with hit/miss counters.
+
+    Attributes:
+        memory: The in-process LRU tier.
+        disk: The optional persistent tier, or None.
+        stats: Counters for memory hits, disk hits and misses.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS, path: str | None = RESULT_CACHE_PATH, max_disk_entries: int = RESULT_CACHE_MAX_DISK_ENTRIES):
+        self.memory = MemoryTier(max_entries, ttl_seconds)
+        self.disk = SqliteTier(path, max_disk_entries, ttl_seconds) if path else None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory.max_entries > 0 or self.disk is not None
+
+    async def get(self, key: str) -> WebpageAnalysisResponse | None:
+        """
+        Looks up a cached response, promoting disk hits into memory.
+
+        Args:
+            key (str): A key from `analysis_cache_key`.
+
+        Returns:
+            WebpageAnalysisResponse | None: The cached response, or None on a miss.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return WebpageAnalysisResponse.model_validate_json(value)
+        if self.disk is not None:
+            try:
+                value = await asyncio.to_thread(self.disk.get, key)
+            except sqlite3.Error as e:
+                logging.warning(f"Result cache read failed: {e}")
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.set(key, value)
+                return WebpageAnalysisResponse.model_validate_json(value)
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: WebpageAnalysisResponse) -> None:
+        """
+        Stores a validated response in every enabled tier.
+
+        Args:
+            key (str): A key from `analysis_cache_key`.
+            response (WebpageAnalysisResponse): The validated response to store.
+        """
+        value = response.model_dump_json(by_alias=True)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except sqlite3.Error as e:
+                # A broken cache must never fail the request it is caching
+                logging.warning(f"Result cache write failed: {e}")
@@ -0,0 +1,73 @@
+"""
+In-flight de-duplication ("single flight") of concurrent identical analyses.
+
+When several requests with the same content hash arrive while an analysis for that hash is still
+running, they all await the one upstream call instead of starting their own. The shared call runs in
+its own task, so a disconnecting client does not cancel it for the others; it is only cancelled when
+every waiter has gone away. Results and errors (including cancellation) reach every waiter.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, tuple[asyncio.Task, list[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def waiters(self, key: str) -> int:
+        """
+        Returns the number of callers currently awaiting the call for `key`.
+        """
+        call = self._calls.get(key)
+        return call[1][0] if call else 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `fn` once per key among concurrent callers and returns its result to all of them.
+
+        Args:
+            key (str): The content hash identifying identical work.
+            fn (Callable[[], Awaitable[T]]): Coroutine factory performing the work. Only the first
+                caller's `fn` is used while the call is in flight.
+
+        Returns:
+            T: The shared result.
+
+        Raises:
+            Exception: Whatever the shared call raised, re-raised in every waiter.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.get_running_loop().create_task(fn())
+            call = (task, [0])
+            self._calls[key] = call
+            task.add_done_callback(lambda _: self._forget(key, task))
+        task, waiters = call
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Cancel the shared call only once nobody is left to receive it
+            if waiters[0] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved; waiters have already re-raised it
+            task.exception()
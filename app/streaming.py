@@ -0,0 +1,205 @@
+"""
+Incremental delivery of an analysis as Server-Sent Events.
+
+The model's JSON output is scanned as it streams in (`SectionParser`). As soon as a top-level section
+of `WebpageAnalysisResponse` is complete (and, inside "Detailed Analysis", as soon as each category
+is complete) it is validated against the matching sub-model from `app/models.py` and emitted as an
+SSE `section` event. A final `complete` event carries the full validated response; failures are
+reported as an `error` event, since the HTTP status has already been sent.
+"""
+
+import json
+from typing import Iterator
+
+from pydantic import TypeAdapter, ValidationError
+
+from .models import WebpageAnalysisResponse, DetailedAnalysis
+
+DETAILED_ANALYSIS = "Detailed Analysis"
+
+# Validators for every section that is emitted on its own, keyed by JSON path
+SECTION_VALIDATORS: dict[tuple[str, ...], TypeAdapter] = {}
+for _field in WebpageAnalysisResponse.model_fields.values():
+    if _field.alias == DETAILED_ANALYSIS:
+        for _category in DetailedAnalysis.model_fields.values():
+            SECTION_VALIDATORS[(DETAILED_ANALYSIS, _category.alias)] = TypeAdapter(_category.annotation)
+    else:
+        SECTION_VALIDATORS[(_field.alias,)] = TypeAdapter(_field.annotation)
+
+# Objects whose members are emitted as they complete
+_WATCHED_OBJECTS = {(), (DETAILED_ANALYSIS,)}
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "state", "key", "value_start", "primitive")
+
+    def __init__(self, kind: str, path: tuple):
+        self.kind = kind
+        self.path = path
+        self.state = "key"
+        self.key = None
+        self.value_start = None
+        self.primitive = False
+
+
+class SectionParser:
+    """
+    Incremental scanner that reports completed members of the response object while JSON streams in.
+
+    Text before the first "{" (e.g. a markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def feed(self, text: str) -> list[tuple[tuple[str, ...], object]]:
+        """
+        Consumes the next piece of model output.
+
+        Args:
+            text (str): The newly streamed text.
+
+        Returns:
+            list[tuple[tuple[str, ...], object]]: The (path, decoded value) of every watched member
+            completed by this piece, in order.
+        """
+        self.text += text
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_string(i, completed)
+                continue
+            if not self._started:
+                if c == "{":
+                    self._started = True
+                    self._stack.append(_Frame("{", ()))
+                continue
+            if not self._stack:
+                continue
+            frame = self._stack[-1]
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                if frame.kind == "{" and frame.state == "value" and frame.value_start is None:
+                    frame.value_start = i
+            elif c == ":":
+                if frame.kind == "{":
+                    frame.state = "value"
+                    frame.value_start = None
+                    frame.primitive = False
+            elif c in "{[":
+                if frame.kind == "{" and frame.state == "value":
+                    frame.value_start = i
+                self._stack.append(_Frame(c, frame.path + (frame.key,) if frame.kind == "{" else frame.path))
+            elif c in "}]":
+                if frame.kind == "{" and frame.state == "value" and frame.primitive:
+                    self._complete(frame, i, completed)
+                self._stack.pop()
+                if self._stack:
+                    parent = self._stack[-1]
+                    if parent.kind == "{" and parent.state == "value":
+                        self._complete(parent, i + 1, completed)
+            elif c == ",":
+                if frame.kind == "{":
+                    if frame.state == "value" and frame.primitive:
+                        self._complete(frame, i, completed)
+                    frame.state = "key"
+            elif not c.isspace():
+                if frame.kind == "{" and frame.state == "value" and frame.value_start is None:
+                    frame.value_start = i
+                    frame.primitive = True
+        self._pos = len(text)
+        return completed
+
+    def _end_string(self, end: int, completed: list) -> None:
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        if frame.kind != "{":
+            return
+        if frame.state == "key":
+            frame.key = json.loads(self.text[self._string_start:end + 1])
+        elif frame.state == "value" and frame.value_start == self._string_start:
+            self._complete(frame, end + 1, completed)
+
+    def _complete(self, frame: _Frame, end: int, completed: list) -> None:
+        path = frame.path + (frame.key,)
+        frame.state = "done"
+        frame.primitive = False
+        if frame.path in _WATCHED_OBJECTS and path in SECTION_VALIDATORS:
+            try:
+                completed.append((path, json.loads(self.text[frame.value_start:end])))
+            except json.JSONDecodeError:
+                pass
+
+    def document(self) -> str:
+        """
+        Returns the streamed JSON document, without any surrounding markdown fence or text.
+        """
+        start = self.text.find("{")
+        end = self.text.rfind("}")
+        return self.text[start:end + 1] if start != -1 and end > start else self.text
+
+
+def validate_section(path: tuple[str, ...], value) -> object | None:
+    """
+    Validates a completed section against its sub-model and returns it in JSON-ready form.
+
+    Args:
+        path (tuple[str, ...]): The section's JSON path, e.g. ("Detailed Analysis", "Content Discrepancies").
+        value: The decoded JSON value.
+
+    Returns:
+        object | None: The validated value dumped by alias, or None if it does not validate.
+    """
+    adapter = SECTION_VALIDATORS[path]
+    try:
+        return adapter.dump_python(adapter.validate_python(value), mode="json", by_alias=True)
+    except ValidationError:
+        return None
+
+
+def iter_sections(response: WebpageAnalysisResponse) -> Iterator[tuple[tuple[str, ...], object]]:
+    """
+    Yields the sections of an already complete response, in the order they would stream.
+
+    Args:
+        response (WebpageAnalysisResponse): A validated response, e.g. from the result cache.
+
+    Yields:
+        tuple[tuple[str, ...], object]: (path, JSON-ready value) pairs.
+    """
+    dumped = response.model_dump(mode="json", by_alias=True)
+    for path in SECTION_VALIDATORS:
+        value = dumped
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        yield path, value
+
+
+def sse_event(event: str, data) -> str:
+    """
+    Formats one Server-Sent Event.
+
+    Args:
+        event (str): The event name.
+        data: JSON-serializable payload.
+
+    Returns:
+        str: The encoded event, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+import app.analysis_store as analysis_store
+from app.analysis_store import AnalysisStore, SqliteAnalyses, compress, decompress
+from app.incremental import AnalysisHistory, content_hash
+from app.models import WebpageAnalysisResponse
+
+RESULT = WebpageAnalysisResponse.model_validate({"Executive Summary": "Fine.", "Other Issues": [{"Issue": "Typo", "Code": "<p>teh</p>"}]})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_blobs_round_trip_and_zlib_rows_stay_readable(monkeypatch):
+    codec, blob = compress(b"{\"a\": 1}" * 100)
+    assert len(blob) < 800 and decompress(codec, blob) == b"{\"a\": 1}" * 100
+    monkeypatch.setattr(analysis_store, "zstd", None)
+    codec, blob = compress(b"{}")
+    assert codec == "zlib" and decompress(codec, blob) == b"{}"
+
+
+def test_writes_are_batched_off_the_request_path(tmp_path):
+    async def run():
+        store = AnalysisStore(path=str(tmp_path / "analyses.sqlite3"), memory=AnalysisHistory(max_entries=8), batch_size=3)
+        records = [store.add(f"<p>{i}</p>", "ctx", RESULT, url="https://example.com/", model="m") for i in range(2)]
+        assert store.queued == 2 and store.stats["written"] == 0
+        # Queued records are still served
+        assert (await store.get(records[0].id)).htmlText == "<p>0</p>"
+        store.add("<p>2</p>", "ctx", RESULT)
+        await asyncio.sleep(0.1)
+        assert store.stats["written"] == 3 and store.queued == 0
+        with sqlite3.connect(store.disk.path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM analyses").fetchone() == (3,)
+        return records
+
+    records = asyncio.run(run())
+    stored = SqliteAnalyses(str(tmp_path / "analyses.sqlite3")).get(records[1].id)
+    assert stored.result == RESULT and stored.url == "https://example.com/" and stored.model == "m"
+
+
+def test_content_hash_finds_the_latest_analysis_on_disk_or_in_memory(tmp_path):
+    async def run():
+        path = str(tmp_path / "analyses.sqlite3")
+        old = AnalysisStore(path=path)
+        first = old.add("<p>a</p>", "ctx", RESULT, label="v1")
+        await old.flush()
+        store = AnalysisStore(path=path)
+        assert (await store.get(content_hash("<p>a</p>"))).id == first.id
+        second = store.add("<p>a</p>", "ctx", RESULT, label="v2")
+        assert (await store.get(content_hash("<p>a</p>"))).id == second.id
+        page = await store.list({"content_hash": content_hash("<p>a</p>")}, limit=1)
+        assert [item["label"] for item in page["items"]] == ["v2"] and page["next_cursor"]
+        page = await store.list({"content_hash": content_hash("<p>a</p>")}, cursor=page["next_cursor"], limit=1)
+        assert [item["label"] for item in page["items"]] == ["v1"] and page["next_cursor"] is None
+        # Listing never reads the stored inputs
+        with sqlite3.connect(path) as conn:
+            conn.execute("UPDATE analyses SET inputs = x'00'")
+        assert [item["executive_summary"] for item in (await store.list())["items"]] == ["Fine.", "Fine."]
+
+    asyncio.run(run())
+
+
+def test_memory_only_store_lists_and_purge_removes_expired(tmp_path):
+    async def run():
+        store = AnalysisStore(path=None, memory=AnalysisHistory(max_entries=4))
+        store.add("<p>a</p>", "ctx", RESULT, label="v1")
+        store.add("<p>b</p>", "ctx", RESULT, label="v2")
+        assert [item["label"] for item in (await store.list({"label": "v1"}))["items"]] == ["v1"]
+        assert store.queued == 0
+
+    asyncio.run(run())
+
+    clock = FakeClock()
+    disk = SqliteAnalyses(str(tmp_path / "analyses.sqlite3"), ttl_seconds=10, clock=clock)
+    store = AnalysisStore(path=None)
+    disk.write([store.add("<p>a</p>", "ctx", RESULT)])
+    clock.now = store.memory.records()[0].created_at + 11
+    assert disk.purge() == 1
+    assert disk.list({}, None, None, None, 10) == []
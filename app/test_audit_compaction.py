@@ -0,0 +1,99 @@
+import json
+from app.audit_compaction import compact_axe, compact_lighthouse, compact_nu, compact_audits
+
+
+def axe_node(target, summary="Fix this"):
+    return {"html": "<img src='x'>", "target": target, "failureSummary": summary, "any": [], "all": [], "none": []}
+
+
+axe_result = {
+    "testEngine": {"name": "axe-core", "version": "4.8.0"},
+    "passes": [{"id": f"pass-{i}", "nodes": [axe_node(["body"])] * 20} for i in range(30)],
+    "inapplicable": [{"id": "audio-caption", "nodes": []}],
+    "violations": [
+        {"id": "region", "impact": "moderate", "help": "Content should be in landmarks", "nodes": [axe_node(["#a"])]},
+        {"id": "image-alt", "impact": "critical", "help": "Images must have alt text",
+         "nodes": [axe_node(["#hero img"]), axe_node(["#hero img"]), axe_node(["footer img"])]},
+        {"id": "color-contrast", "impact": "serious", "description": "Contrast", "nodes": [axe_node(["iframe", ".btn"])]},
+    ],
+}
+
+lighthouse_result = {
+    "lighthouseResult": {
+        "categories": {"performance": {"score": 0.42, "auditRefs": [{"id": "lcp"}] * 50}},
+        "audits": {
+            "final-screenshot": {"id": "final-screenshot", "score": None, "scoreDisplayMode": "informative",
+                                 "details": {"data": "data:image/jpeg;base64," + "A" * 5000}},
+            "largest-contentful-paint": {"id": "largest-contentful-paint", "title": "Largest Contentful Paint",
+                                         "score": 0.1, "scoreDisplayMode": "numeric", "displayValue": "6.1 s"},
+            "unsized-images": {"id": "unsized-images", "title": "Image elements do not have explicit width and height",
+                               "score": 0.5, "scoreDisplayMode": "metricSavings",
+                               "details": {"items": [{"node": {"selector": "div > img"}}, {"node": {"selector": "div > img"}}, {"url": "https://x/a.png"}]}},
+            "viewport": {"id": "viewport", "title": "Has a viewport meta tag", "score": 1, "scoreDisplayMode": "binary"},
+        },
+    },
+}
+
+nu_result = {
+    "messages": [
+        {"type": "info", "message": "Trailing slash on void elements"},
+        {"type": "info", "subType": "warning", "message": "Section lacks heading", "lastLine": 9, "extract": "<section>"},
+        {"type": "error", "message": "Duplicate ID x", "lastLine": 3, "extract": "<div id=x>"},
+        {"type": "error", "message": "Duplicate ID x", "lastLine": 7, "extract": "<div id=x>"},
+    ],
+}
+
+
+def test_axe_keeps_violations_by_impact_with_distinct_targets():
+    compacted = compact_axe(axe_result)
+    assert list(compacted) == ["violations"]
+    assert [v["id"] for v in compacted["violations"]] == ["image-alt", "color-contrast", "region"]
+    image_alt = compacted["violations"][0]
+    assert image_alt["occurrences"] == 3
+    assert image_alt["targets"] == ["#hero img", "footer img"]
+    assert compacted["violations"][1]["targets"] == ["iframe >> .btn"]
+    assert compacted["violations"][1]["help"] == "Contrast"
+
+
+def test_axe_caps_violations_and_nodes():
+    compacted = compact_axe(axe_result, max_items=1, max_nodes=1)
+    assert len(compacted["violations"]) == 1
+    assert compacted["omittedViolations"] == 2
+    assert compacted["violations"][0]["targets"] == ["#hero img"]
+
+
+def test_lighthouse_keeps_scores_and_failed_audits_lowest_first():
+    compacted = compact_lighthouse(lighthouse_result)
+    assert compacted["scores"] == {"performance": 0.42}
+    assert [a["id"] for a in compacted["failedAudits"]] == ["largest-contentful-paint", "unsized-images"]
+    assert compacted["failedAudits"][1]["targets"] == ["div > img", "https://x/a.png"]
+
+
+def test_nu_keeps_errors_then_warnings_grouped_by_message():
+    compacted = compact_nu(nu_result)
+    assert compacted["messages"] == [
+        {"type": "error", "message": "Duplicate ID x", "occurrences": 2, "lines": [3, 7], "extracts": ["<div id=x>"]},
+        {"type": "warning", "message": "Section lacks heading", "occurrences": 1, "lines": [9], "extracts": ["<section>"]},
+    ]
+
+
+def test_unknown_shapes_pass_through():
+    assert compact_axe(["contrast"]) == ["contrast"]
+    assert compact_lighthouse(90) == 90
+    assert compact_nu({"errors": 1}) == {"errors": 1}
+
+
+def test_compact_audits_reports_savings():
+    evaluations = {"axeCoreResult": axe_result, "pageSpeedResult": lighthouse_result, "nuValidatorResult": nu_result, "responsivenessResult": {"overflow": False}}
+    compaction = compact_audits(evaluations)
+    assert compaction.audits["responsivenessResult"] == {"overflow": False}
+    assert compaction.original_chars == len(json.dumps(evaluations, separators=(",", ":")))
+    assert compaction.compacted_chars < compaction.original_chars / 10
+    assert compaction.chars_saved == compaction.original_chars - compaction.compacted_chars
+
+
+def test_disabled_compaction_keeps_audits():
+    evaluations = {"axeCoreResult": axe_result}
+    compaction = compact_audits(evaluations, enabled=False)
+    assert compaction.audits == evaluations
+    assert compaction.chars_saved == 0
@@ -0,0 +1,70 @@
+import pytest
+from app.audit_reports import render_non_llm_evaluations, render_layout, UnrecognizedAudit
+
+axe_result = {
+    "passes": [{"id": "document-title", "nodes": [{"target": ["title"]}]}],
+    "violations": [
+        {"id": "region", "impact": "moderate", "help": "Content should be in landmarks", "nodes": [{"target": ["#a"]}]},
+        {"id": "image-alt", "impact": "critical", "help": "Images must have alt text",
+         "nodes": [{"target": ["#hero img"], "failureSummary": "Fix any of the following: Element does not have an alt attribute"}, {"target": ["footer img"]}]},
+    ],
+}
+lighthouse_result = {
+    "lighthouseResult": {
+        "categories": {"performance": {"score": 0.42}},
+        "audits": {
+            "largest-contentful-paint": {"id": "largest-contentful-paint", "title": "Largest Contentful Paint", "score": 0.1,
+                                         "scoreDisplayMode": "numeric", "displayValue": "6.1 s",
+                                         "description": "LCP marks the time at which the largest text or image is painted. [Learn more about LCP](https://web.dev/lcp)."},
+            "viewport": {"id": "viewport", "title": "Has a viewport meta tag", "score": 1, "scoreDisplayMode": "binary"},
+        },
+    },
+}
+nu_result = {"messages": [
+    {"type": "error", "message": "Duplicate ID x", "lastLine": 3, "extract": "<div id=x>"},
+    {"type": "error", "message": "Duplicate ID x", "lastLine": 7, "extract": "<div id=x>"},
+    {"type": "info", "subType": "warning", "message": "Section lacks heading", "lastLine": 9, "extract": "<section>"},
+]}
+evaluations = {"axeCoreResult": axe_result, "pageSpeedResult": lighthouse_result, "nuValidatorResult": nu_result, "responsivenessResult": False}
+
+
+def test_reports_are_rendered_from_audits():
+    section = render_non_llm_evaluations(evaluations).model_dump(by_alias=True)
+
+    accessibility = section["Accessibility Report"]
+    assert accessibility["Summary"] == "axe-core found 2 accessibility violations (1 critical, 1 moderate) affecting 3 elements."
+    assert accessibility["Key Findings"][0]["Issue"] == "Images must have alt text [image-alt, critical]: 2 elements, e.g. #hero img, footer img"
+    assert accessibility["Key Findings"][0]["Recommended Fix"].startswith("Fix any of the following")
+
+    performance = section["Performance Report"]
+    assert performance["Summary"] == "Lighthouse scores: performance 42/100. 1 audit failed."
+    assert performance["Key Findings"] == [{
+        "Issue": "Largest Contentful Paint: 6.1 s (score 0.10)",
+        "Recommended Fix": "LCP marks the time at which the largest text or image is painted.",
+    }]
+
+    validation = section["Validation Report"]
+    assert validation["Summary"] == "The Nu HTML Checker reported 2 errors and 1 warning (2 distinct messages)."
+    assert validation["Key Findings"][0] == {"Issue": "Error: Duplicate ID x (2 occurrences)", "Recommended Fix": "Correct the markup at line 3, 7: <div id=x>"}
+
+    assert section["Layout Report"]["Summary"] == "No horizontal overflow was detected at desktop width."
+
+
+def test_missing_audits_render_as_null():
+    section = render_non_llm_evaluations({"axeCoreResult": {"violations": []}, "pageSpeedResult": None, "nuValidatorResult": None, "responsivenessResult": None})
+    assert section.Accessibility_Report.Summary == "axe-core found no accessibility violations."
+    assert section.Performance_Report is None
+    assert render_non_llm_evaluations({}) is None
+
+
+def test_layout_report_handles_overflow_flags():
+    assert render_layout(True).Recommended_Fix is not None
+    assert render_layout({"overflow": False}).Recommended_Fix is None
+    assert "#wide" in render_layout({"elements": ["#wide"]}).Summary
+
+
+def test_unrecognized_audit_format_raises():
+    with pytest.raises(UnrecognizedAudit):
+        render_non_llm_evaluations({**evaluations, "pageSpeedResult": 90})
+    with pytest.raises(UnrecognizedAudit):
+        render_non_llm_evaluations({**evaluations, "axeCoreResult": {"violations": ["contrast"]}})
@@ -0,0 +1,75 @@
+import asyncio
+import struct
+import zlib
+import httpx
+from fastapi import FastAPI, Form
+from fastapi.responses import PlainTextResponse
+from app.bench import Scenario, build_request, compare, lag_summary, parse_metrics, percentile, run_load, synthetic_audits, synthetic_page, synthetic_png
+from app.audit_compaction import compact_audits
+
+
+def test_percentile_interpolates():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([0, 10], 95) == 9.5
+
+
+def test_synthetic_png_is_valid():
+    png = synthetic_png(20, 50)
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    width, height = struct.unpack(">II", png[16:24])
+    assert (width, height) == (20, 50)
+    idat_length = struct.unpack(">I", png[33:37])[0]
+    assert len(zlib.decompress(png[41:41 + idat_length])) == 50 * (1 + 20 * 3)
+
+
+def test_synthetic_payloads_are_realistic():
+    page = synthetic_page(50_000)
+    assert 50_000 <= len(page) < 60_000
+    assert "<script>" in page and "data:image/png" in page
+    audits = synthetic_audits()
+    assert compact_audits(audits).chars_saved > 0
+    data, files = build_request(Scenario("x", html_chars=1000, audits=True, design=(4, 4)))
+    assert data["bypassCache"] == "true" and "webAuditResults" in data
+    assert files["designFile"][2] == "image/png"
+
+
+def test_lag_summary_from_metrics_scrapes():
+    before = parse_metrics('event_loop_lag_seconds_bucket{le="0.001"} 5\nevent_loop_lag_seconds_bucket{le="0.01"} 5\n'
+                           'event_loop_lag_seconds_bucket{le="+Inf"} 5\nevent_loop_lag_seconds_sum 0.001\nevent_loop_lag_seconds_count 5\n')
+    after = parse_metrics('event_loop_lag_seconds_bucket{le="0.001"} 5\nevent_loop_lag_seconds_bucket{le="0.01"} 105\n'
+                          'event_loop_lag_seconds_bucket{le="+Inf"} 105\nevent_loop_lag_seconds_sum 0.501\nevent_loop_lag_seconds_count 105\n')
+    assert lag_summary(before, after) == {"mean_ms": 5.0, "p99_ms": 10.0}
+    assert lag_summary(after, after) == {"mean_ms": None, "p99_ms": None}
+
+
+def test_run_load_reports_statuses_and_latency():
+    app = FastAPI()
+    calls = []
+
+    @app.post("/webpage-analysis")
+    async def analyse(htmlText: str = Form()):
+        calls.append(len(htmlText))
+        return {}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return "process_resident_memory_bytes 1024\n"
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            return await run_load(client, Scenario("tiny", html_chars=100), concurrency=3, requests=7)
+
+    result = asyncio.run(run())
+    assert len(calls) == 7
+    assert result["statuses"] == {"200": 7}
+    assert result["latency_ms"]["p50"] is not None and result["rps"] > 0
+    assert result["rss_bytes"] == {"before": 1024, "after": 1024}
+
+
+def test_compare_reports_relative_changes():
+    def run(rps, p95):
+        return {"scenario": "small", "concurrency": 8, "rps": rps, "latency_ms": {"p95": p95, "p99": p95}}
+
+    lines = compare({"results": [run(10.0, 200.0)]}, {"results": [run(12.0, 150.0), {**run(1.0, 1.0), "scenario": "new"}]})
+    assert lines == ["small @ 8: rps 10.0 -> 12.0 (+20.0%), p95 200.0 -> 150.0 (-25.0%), p99 200.0 -> 150.0 (-25.0%)"]
@@ -0,0 +1,64 @@
+import pytest
+from app.budget import OverBudget, SPECIFICATION_TRUNCATED, elide_html, fit_prompt, parse_model_budgets
+
+
+def measure(html, specification, audits):
+    """One token per character of every input, like a prompt with no template around them."""
+    return len(html) + len(specification or "") + len(str(audits or ""))
+
+
+evaluations = {"axeCoreResult": {"violations": [{"id": f"rule-{i}", "nodes": [{"target": [f"#n{j}"]} for j in range(5)]} for i in range(20)]}}
+page = "<html><head><title>T</title></head><body>" + "".join(f"<section><p>{'x' * 200}</p></section>" for _ in range(10)) + "</body></html>"
+
+
+def test_prompt_within_budget_is_unchanged():
+    plan = fit_prompt("<p>hi</p>", "spec", None, None, measure, budget=100)
+    assert plan.plan == "full"
+    assert plan.html == "<p>hi</p>" and plan.specification == "spec"
+    assert plan.tokens == plan.original_tokens == 13
+
+
+def test_zero_budget_only_measures():
+    plan = fit_prompt(page, "spec", None, None, measure, budget=0)
+    assert plan.plan == "full" and plan.tokens == measure(page, "spec", None)
+
+
+def test_audits_are_recompacted_first():
+    audits = evaluations
+    full = measure("<p/>", None, audits)
+    plan = fit_prompt("<p/>", None, audits, evaluations, measure, budget=full - 1)
+    assert plan.steps == ["audits"]
+    assert plan.tokens < full
+
+
+def test_specification_is_truncated_with_marker():
+    plan = fit_prompt("<p/>", "s" * 1000, None, None, lambda h, s, a: (len(h) + len(s or "")) // 4, budget=100)
+    assert plan.steps == ["specification"]
+    assert plan.specification.endswith(SPECIFICATION_TRUNCATED)
+    assert plan.tokens <= 100
+
+
+def test_html_is_elided_keeping_head_and_leading_sections():
+    plan = fit_prompt(page, None, None, None, lambda h, s, a: len(h) // 4, budget=200)
+    assert plan.steps == ["html"]
+    assert plan.tokens <= 200
+    assert plan.html.startswith("<head><title>T</title></head>")
+    assert plan.html.count("<section>") >= 1
+    assert plan.html.endswith("elided to fit the model's token budget -->\n</body>")
+
+
+def test_over_budget_raises():
+    with pytest.raises(OverBudget) as error:
+        fit_prompt(page, None, None, None, lambda h, s, a: len(h) // 4, budget=10, elide=False)
+    assert error.value.budget == 10
+
+
+def test_elide_html_returns_fitting_page_unchanged():
+    assert elide_html(page, len(page)) == page
+
+
+def test_parse_model_budgets():
+    assert parse_model_budgets("a=100, b-2=2000") == {"a": 100, "b-2": 2000}
+    assert parse_model_budgets("") == {}
+    with pytest.raises(ValueError):
+        parse_model_budgets("a=lots")
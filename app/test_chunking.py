@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from app.chunking import split_html, merge_responses, analyse_chunks
+from app.models import WebpageAnalysisResponse
+
+HEAD = "<head><style>.card { color: red; }</style></head>"
+
+
+def make_page(sections: int, paragraphs: int = 10) -> str:
+    body = "".join(
+        f"<section id='s{i}'><h2>Title {i}</h2>" + "".join(f"<p>Paragraph {j} {'x' * 40}</p>" for j in range(paragraphs)) + "</section>\n"
+        for i in range(sections)
+    )
+    return f"<!DOCTYPE html><html>{HEAD}<body>\n{body}</body></html>"
+
+
+def body_of(chunk: str) -> str:
+    return chunk.split("<body>\n", 1)[1].rsplit("\n</body>", 1)[0]
+
+
+def test_small_page_is_a_single_chunk():
+    page = make_page(2)
+    assert split_html(page, max_chars=len(page)) == [page]
+
+
+def test_chunks_carry_head_and_cover_body_in_order():
+    page = make_page(12)
+    chunks = split_html(page, max_chars=1500)
+
+    assert len(chunks) > 1
+    assert all(chunk.startswith(HEAD) for chunk in chunks)
+    assert all(len(body_of(chunk)) <= 1500 for chunk in chunks)
+    original_body = page.split("<body>", 1)[1].rsplit("</body>", 1)[0]
+    assert "".join(body_of(chunk) for chunk in chunks) == original_body
+    # Sections are not cut in half when they fit
+    assert all(body_of(chunk).count("<section") == body_of(chunk).count("</section>") for chunk in chunks)
+
+
+def test_oversized_section_is_split_at_its_children():
+    page = make_page(1, paragraphs=60)
+    chunks = split_html(page, max_chars=1000)
+
+    assert len(chunks) > 1
+    assert all(len(body_of(chunk)) <= 1000 for chunk in chunks)
+
+
+def finding(issue, code):
+    return {"Issue": issue, "Code": code, "Details": "d", "Recommended Fix": "f"}
+
+
+def test_merge_concatenates_and_dedupes_findings():
+    first = WebpageAnalysisResponse.model_validate({
+        "Executive Summary": "Header issues.",
+        "Detailed Analysis": {"Content Discrepancies": {"Summary": "A", "Findings": [finding("Typo", "<h1>Helo</h1>")]}},
+        "Non-LLM Evaluations": {"Layout Report": {"Summary": "No overflow"}},
+        "Other Issues": [finding("Missing alt", "<img>")],
+    })
+    second = WebpageAnalysisResponse.model_validate({
+        "Executive Summary": "Footer issues.",
+        "Detailed Analysis": {"Content Discrepancies": {"Summary": "B", "Findings": [finding("typo", "<h1>Helo</h1> "), finding("Broken link", "<a>")]}},
+        "Other Issues": [finding("Missing alt", "<img>")],
+    })
+
+    merged = merge_responses([first, second])
+
+    content = merged.Detailed_Analysis.Content_Discrepancies
+    assert [f.Issue for f in content.Findings] == ["Typo", "Broken link"]
+    assert content.Summary == "A B"
+    assert merged.Executive_Summary == "Analysis of 2 page sections. Header issues. Footer issues."
+    assert merged.Non_LLM_Evaluations.Layout_Report.Summary == "No overflow"
+    assert len(merged.Other_Issues) == 1
+
+
+def test_analyse_chunks_bounds_concurrency():
+    running = 0
+    peak = 0
+
+    async def analyse_chunk(index, chunk):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return WebpageAnalysisResponse(Executive_Summary=f"chunk {index}")
+
+    merged = asyncio.run(analyse_chunks([str(i) for i in range(6)], analyse_chunk, concurrency=2))
+
+    assert peak == 2
+    assert merged.Executive_Summary.startswith("Analysis of 6 page sections. chunk 0 chunk 1")
+
+
+def test_failed_chunk_cancels_the_others():
+    started = []
+    cancelled = []
+
+    async def analyse_chunk(index, chunk):
+        started.append(index)
+        if index == 0:
+            raise ValueError("chunk 0 failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+
+    async def run():
+        with pytest.raises(ValueError, match="chunk 0 failed"):
+            await analyse_chunks([str(i) for i in range(4)], analyse_chunk, concurrency=2)
+        # Cancelled by the time the error is raised, not only when the event loop shuts down
+        assert 0 in started and sorted(cancelled) == sorted(set(started) - {0})
+
+    asyncio.run(run())
@@ -0,0 +1,103 @@
+import pytest
+from app.client_pool import ClientPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def fail(lease, error):
+    with pytest.raises(type(error)):
+        with lease.track():
+            raise error
+
+
+def test_leases_go_to_least_loaded_client():
+    pool = ClientPool(["a", "b"], clock=Clock())
+
+    first, second, third = pool.lease(), pool.lease(), pool.lease()
+
+    assert [first.client, second.client, third.client] == ["a", "b", "a"]
+    assert [member.in_flight for member in pool.members] == [2, 1]
+    first.release()
+    first.release()
+    assert [member.in_flight for member in pool.members] == [1, 1]
+
+
+def test_lower_latency_breaks_ties():
+    clock = Clock()
+    pool = ClientPool(["a", "b"], clock=clock)
+    for name, seconds in (("a", 5.0), ("b", 1.0)):
+        with pool.lease() as lease:
+            assert lease.client == name
+            with lease.track():
+                clock.now += seconds
+
+    with pool.lease() as lease:
+        assert lease.client == "b"
+
+
+def test_transient_errors_put_client_in_cooldown():
+    clock = Clock()
+    pool = ClientPool(["a", "b"], cooldown=10, cooldown_max=15, clock=clock)
+
+    with pool.lease() as lease:
+        fail(lease, ApiError(429))
+    assert pool.lease().client == "b"
+    assert pool.snapshot()[0]["cooldown_seconds"] == 10
+
+    clock.now += 10
+    with pool.lease() as lease:
+        assert lease.client == "a"
+        fail(lease, ApiError(503))
+    # Doubled, then capped
+    assert pool.snapshot()[0]["cooldown_seconds"] == 15
+
+
+def test_client_errors_do_not_cool_down():
+    pool = ClientPool(["a", "b"], clock=Clock())
+
+    with pool.lease() as lease:
+        fail(lease, ApiError(400))
+
+    assert pool.snapshot()[0]["errors"] == 1
+    assert pool.snapshot()[0]["cooldown_seconds"] == 0
+
+
+def test_all_cooling_down_uses_first_to_recover():
+    clock = Clock()
+    pool = ClientPool(["a", "b"], cooldown=10, clock=clock)
+    with pool.lease() as lease:
+        fail(lease, ApiError(500))
+    clock.now += 5
+    with pool.lease() as lease:
+        fail(lease, ApiError(500))
+
+    assert pool.lease().client == "a"
+
+
+def test_lease_forwards_to_client():
+    class Client:
+        models = "models"
+
+    with ClientPool([Client()], names=["key-1"]).lease() as lease:
+        assert lease.models == "models"
+        assert lease.name == "key-1"
+
+
+def test_empty_pool():
+    pool = ClientPool([])
+
+    assert pool.primary is None
+    with pytest.raises(RuntimeError):
+        pool.lease()
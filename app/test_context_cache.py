@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from app.context_cache import PromptPrefixCache, LocalCaches
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(clock, **kwargs):
+    caches = LocalCaches(clock=clock)
+    cache = PromptPrefixCache(enabled=True, ttl_seconds=3600, refresh_margin_seconds=300, retry_seconds=600, min_tokens=0, clock=clock, **kwargs)
+    return SimpleNamespace(caches=caches), cache
+
+
+def test_ensure_creates_entry_once_per_model_and_version():
+    clock = FakeClock()
+    client, cache = make(clock)
+    name = asyncio.run(cache.ensure(client, "m", "1", "instructions"))
+    assert cache.get("m", "1") == name
+    assert asyncio.run(cache.ensure(client, "m", "1", "instructions")) == name
+    assert len(client.caches.entries) == 1
+    assert cache.get("m", "2") is None
+    assert cache.get("other", "1") is None
+
+
+def test_entry_close_to_expiry_is_refreshed_in_place():
+    clock = FakeClock()
+    client, cache = make(clock)
+    name = asyncio.run(cache.ensure(client, "m", "1", "instructions"))
+    clock.now += 3400
+    assert asyncio.run(cache.ensure(client, "m", "1", "instructions")) == name
+    clock.now += 3000
+    assert cache.get("m", "1") == name
+    assert asyncio.run(client.caches.get(name=name)).name == name
+
+
+def test_expired_entry_is_recreated():
+    clock = FakeClock()
+    client, cache = make(clock)
+    name = asyncio.run(cache.ensure(client, "m", "1", "instructions"))
+    clock.now += 3700
+    assert cache.get("m", "1") is None
+    new_name = asyncio.run(cache.ensure(client, "m", "1", "instructions"))
+    assert new_name != name
+    assert cache.get("m", "1") == new_name
+
+
+def test_failed_create_falls_back_and_retries_after_backoff():
+    clock = FakeClock()
+    client, cache = make(clock)
+    client.caches.create = AsyncMock(side_effect=RuntimeError("too few tokens"))
+    assert asyncio.run(cache.ensure(client, "m", "1", "short")) is None
+    assert cache.get("m", "1") is None
+    asyncio.run(cache.ensure(client, "m", "1", "short"))
+    assert client.caches.create.await_count == 1
+    clock.now += 601
+    asyncio.run(cache.ensure(client, "m", "1", "short"))
+    assert client.caches.create.await_count == 2
+
+
+def test_prefix_below_minimum_size_is_never_cached():
+    clock = FakeClock()
+    client, cache = make(clock)
+    cache.min_tokens = 1024
+    client.caches.create = AsyncMock()
+    assert not cache.cacheable("short")
+    assert asyncio.run(cache.ensure(client, "m", "1", "short")) is None
+    assert cache.cacheable("x" * 8192)
+    client.caches.create.assert_not_awaited()
+
+
+def test_disabled_cache_never_calls_the_api():
+    clock = FakeClock()
+    client, _ = make(clock)
+    cache = PromptPrefixCache(enabled=False, clock=clock)
+    assert asyncio.run(cache.ensure(client, "m", "1", "instructions")) is None
+    assert client.caches.entries == {}
+
+
+def test_close_deletes_upstream_entries():
+    clock = FakeClock()
+    client, cache = make(clock)
+    asyncio.run(cache.ensure(client, "m", "1", "instructions"))
+    asyncio.run(cache.close(client))
+    assert client.caches.entries == {}
+    assert cache.get("m", "1") is None
@@ -0,0 +1,120 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+from app.design_files import DesignFileCache, design_file_hash, sniff_image_type
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client():
+    client = Mock()
+    client.files.upload = AsyncMock(side_effect=lambda file, config: _handle(config["display_name"]))
+    client.files.delete = AsyncMock()
+    return client
+
+
+def _handle(name):
+    handle = Mock()
+    handle.name = name
+    return handle
+
+
+def test_design_file_hash_is_content_addressed():
+    assert design_file_hash(b"a") == design_file_hash(b"a")
+    assert design_file_hash(b"a") != design_file_hash(b"b")
+
+
+def test_cache_evicts_least_recently_used_and_deletes_it():
+    async def run():
+        client = make_client()
+        cache = DesignFileCache(max_entries=2, ttl_seconds=60)
+        for name in ("one", "two", "one", "three"):  # the second "one" refreshes it
+            cache.release(await cache.get_or_upload(client, name.encode(), "image/png", name))
+        await asyncio.sleep(0)  # let the background delete run
+        evicted = [call.kwargs["name"] for call in client.files.delete.await_args_list]
+        await cache.clear()
+        return client, evicted
+
+    client, evicted = asyncio.run(run())
+    assert client.files.upload.await_count == 3
+    assert evicted == ["two"]
+    deleted = sorted(call.kwargs["name"] for call in client.files.delete.await_args_list)
+    assert deleted == ["one", "three", "two"]
+
+
+def test_cache_expires_entries_and_sweeper_deletes_them():
+    async def run():
+        client = make_client()
+        clock = FakeClock()
+        cache = DesignFileCache(max_entries=4, ttl_seconds=10, clock=clock)
+        cache.release(await cache.get_or_upload(client, b"one", "image/png", "one"))
+        clock.now = 5
+        cache.release(await cache.get_or_upload(client, b"two", "image/png", "two"))
+        clock.now = 11
+        removed = await cache.sweep()
+        return client, cache, removed
+
+    client, cache, removed = asyncio.run(run())
+    assert removed == 1
+    assert len(cache) == 1
+    client.files.delete.assert_awaited_once_with(name="one")
+
+
+def test_leased_file_is_deleted_only_after_its_last_release():
+    async def run():
+        client = make_client()
+        clock = FakeClock()
+        cache = DesignFileCache(max_entries=1, ttl_seconds=10, clock=clock)
+        one = await cache.get_or_upload(client, b"one", "image/png", "one")
+        again = await cache.get_or_upload(client, b"one", "image/png", "one")
+        cache.release(await cache.get_or_upload(client, b"two", "image/png", "two"))  # evicts "one"
+        clock.now = 11
+        await cache.sweep()  # expires "two", which is not leased
+        await asyncio.sleep(0)
+        deleted = [call.kwargs["name"] for call in client.files.delete.await_args_list]
+        assert cache.release(one)
+        await asyncio.sleep(0)
+        assert deleted == ["two"] and client.files.delete.await_count == 1
+        assert cache.release(again) and not cache.release(_handle("fresh"))
+        await asyncio.sleep(0)
+        return client
+
+    client = asyncio.run(run())
+    assert [call.kwargs["name"] for call in client.files.delete.await_args_list] == ["two", "one"]
+
+
+def test_concurrent_requests_share_one_upload():
+    async def run():
+        client = make_client()
+        gate = asyncio.Event()
+
+        async def slow_upload(file, config):
+            await gate.wait()
+            return _handle("shared")
+
+        client.files.upload = AsyncMock(side_effect=slow_upload)
+        cache = DesignFileCache(max_entries=4, ttl_seconds=60)
+        tasks = [asyncio.create_task(cache.get_or_upload(client, b"same", "image/png", "shared")) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        handles = await asyncio.gather(*tasks)
+        return client, handles
+
+    client, handles = asyncio.run(run())
+    client.files.upload.assert_awaited_once()
+    assert len({id(handle) for handle in handles}) == 1
+
+
+def test_sniff_image_type_uses_magic_bytes():
+    assert sniff_image_type(b"\x89PNG\r\n\x1a\n\0\0\0\r") == "image/png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0\0\x10JFIF\0\1") == "image/jpeg"
+    assert sniff_image_type(b"RIFF\0\0\0\0WEBP") == "image/webp"
+    assert sniff_image_type(b"\0\0\0\x18ftypheic") == "image/heic"
+    assert sniff_image_type(b"\0\0\0\x18ftypmif1") == "image/heif"
+    assert sniff_image_type(b"%PDF-1.7\n%\xe2\xe3\xcf") is None
+    assert sniff_image_type(b"\x89PNG") is None
@@ -0,0 +1,75 @@
+import asyncio
+import io
+import pytest
+from app.design_images import DesignImageProcessor, DesignImageSettings, normalize_design_image
+from app.tokens import image_tokens, IMAGE_TOKENS
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def png(width: int, height: int, noise: bool = False) -> bytes:
+    image = Image.effect_noise((width, height), 64).convert("RGB") if noise else Image.new("RGB", (width, height), "white")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def sizes(images: list[tuple[bytes, str]]) -> list[tuple[int, int]]:
+    return [Image.open(io.BytesIO(content)).size for content, _ in images]
+
+
+def test_image_tokens_follow_tiling():
+    assert image_tokens() == IMAGE_TOKENS
+    assert image_tokens(300, 384) == IMAGE_TOKENS
+    assert image_tokens(3840, 2160) == 5 * 3 * IMAGE_TOKENS
+
+
+def test_wide_design_is_downscaled():
+    source = png(1920, 1080, noise=True)
+    design = normalize_design_image(source, "image/png", DesignImageSettings(max_width=720, tile_height=4096, format="keep"))
+
+    assert sizes(design.images) == [(720, 405)]
+    assert design.images[0][1] == "image/png"
+    assert design.bytes_saved > len(source) // 2
+    assert design.tokens_saved == image_tokens(1920, 1080) - image_tokens(720, 405)
+
+
+def test_tall_screenshot_is_tiled_top_to_bottom():
+    settings = DesignImageSettings(max_width=360, tile_height=1024, max_tiles=4, format="webp", quality=80)
+    design = normalize_design_image(png(720, 5000), "image/png", settings)
+
+    assert sizes(design.images) == [(360, 834), (360, 834), (360, 832)]
+    assert {mime_type for _, mime_type in design.images} == {"image/webp"}
+
+    design = normalize_design_image(png(360, 8192), "image/png", settings)
+    assert sizes(design.images) == [(180, 1024)] * 4
+
+
+def test_small_or_unreadable_designs_are_sent_unchanged():
+    settings = DesignImageSettings(max_width=1440, tile_height=4096, format="keep")
+    source = png(800, 600)
+    assert normalize_design_image(source, "image/png", settings).images == [(source, "image/png")]
+    assert normalize_design_image(b"\x89PNG\r\n\x1a\n", "image/png", settings).images == [(b"\x89PNG\r\n\x1a\n", "image/png")]
+
+
+def test_processor_caches_by_source_hash():
+    processor = DesignImageProcessor(enabled=True, settings=DesignImageSettings(max_width=100), workers=0, max_entries=4)
+    source = png(400, 100)
+
+    async def run():
+        return await asyncio.gather(processor.process(source, "image/png"), processor.process(source, "image/png"))
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert sizes(first.images) == [(100, 25)]
+    assert asyncio.run(processor.process(source, "image/png")) is first
+    assert (processor.hits, processor.misses) == (1, 2)
+
+
+def test_processor_runs_in_worker_processes():
+    processor = DesignImageProcessor(enabled=True, settings=DesignImageSettings(max_width=100), workers=1)
+    try:
+        design = asyncio.run(processor.process(png(400, 100), "image/png"))
+    finally:
+        processor.close()
+    assert sizes(design.images) == [(100, 25)]
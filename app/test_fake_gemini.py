@@ -0,0 +1,54 @@
+import json
+from fastapi.testclient import TestClient
+from app.fake_gemini import FakeGeminiConfig, create_app, analysis_text
+from app.models import WebpageAnalysisResponse
+
+
+def fake(**kwargs):
+    return TestClient(create_app(FakeGeminiConfig(**{"latency_ms": 0.0, "upload_ms": 0.0, "delete_ms": 0.0, **kwargs})))
+
+
+def test_response_validates_and_grows_with_findings():
+    WebpageAnalysisResponse.model_validate_json(analysis_text(3))
+    assert len(analysis_text(10)) > len(analysis_text(1))
+
+
+def test_generate_content_returns_text_and_usage():
+    client = fake()
+    response = client.post("/v1beta/models/bench-model:generateContent", json={"contents": [{"parts": [{"text": "x" * 400}]}]})
+
+    assert response.status_code == 200
+    body = response.json()
+    WebpageAnalysisResponse.model_validate_json(body["candidates"][0]["content"]["parts"][0]["text"])
+    assert body["usageMetadata"]["promptTokenCount"] > 100
+    assert client.get("/stats").json() == {"generateContent:ok": 1}
+
+
+def test_stream_reassembles_to_the_full_response():
+    client = fake(stream_chunks=5)
+    response = client.post("/v1beta/models/bench-model:streamGenerateContent?alt=sse", json={})
+
+    chunks = [json.loads(line[len("data: "):]) for line in response.text.split("\r\n\r\n") if line]
+    assert len(chunks) == 5
+    assert "".join(chunk["candidates"][0]["content"]["parts"][0]["text"] for chunk in chunks) == analysis_text(5)
+    assert "usageMetadata" in chunks[-1]
+
+
+def test_injected_errors():
+    response = fake(error_rate=1.0, error_status=429).post("/v1beta/models/bench-model:generateContent", json={})
+    assert response.status_code == 429
+    assert response.json()["error"]["code"] == 429
+
+
+def test_resumable_upload_and_delete():
+    client = fake()
+    start = client.post("/upload/v1beta/files", headers={"x-goog-upload-command": "start"})
+    upload_url = start.headers["x-goog-upload-url"]
+
+    done = client.post(upload_url, content=b"\x89PNG" + b"0" * 10, headers={"x-goog-upload-command": "upload, finalize"})
+
+    assert done.headers["x-goog-upload-status"] == "final"
+    name = done.json()["file"]["name"]
+    assert done.json()["file"]["sizeBytes"] == "14"
+    assert client.delete(f"/v1beta/{name}").status_code == 200
+    assert client.get("/stats").json() == {"upload:start": 1, "upload:finalize": 1, "files:delete": 1}
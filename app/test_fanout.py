@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from app.fanout import FANOUT_SCHEMAS, run_fanout, assemble
+
+outputs = {
+    "content": {"Content Discrepancies": {"Summary": "Typos.", "Findings": [{"Issue": "Typo", "Code": "<h1>Helo</h1>"}]}},
+    "styling": {"Styling Discrepancies": {"Summary": "Colors off.", "Findings": []}},
+    "intentional": {"Intentional Flaws And Known Issues": None},
+    "functional": {"Functional Discrepancies": {"Summary": "Broken link.", "Findings": []}, "Other Issues": [{"Issue": "Slow"}]},
+}
+
+
+def test_schemas_only_contain_their_sections():
+    assert list(FANOUT_SCHEMAS["functional"].model_json_schema(by_alias=True)["properties"]) == ["Functional Discrepancies", "Other Issues"]
+    assert list(FANOUT_SCHEMAS["evaluations"].model_json_schema(by_alias=True)["properties"]) == ["Non-LLM Evaluations"]
+
+
+def test_run_fanout_assembles_all_sections():
+    async def generate(job, schema):
+        assert schema is FANOUT_SCHEMAS[job]
+        return schema.model_validate(outputs[job])
+
+    response, failed = asyncio.run(run_fanout(list(outputs), generate))
+
+    assert failed == []
+    dumped = response.model_dump(by_alias=True)
+    assert dumped["Detailed Analysis"]["Content Discrepancies"]["Findings"][0]["Code"] == "<h1>Helo</h1>"
+    assert dumped["Other Issues"][0]["Issue"] == "Slow"
+    assert dumped["Executive Summary"] == "Content Discrepancies: Typos. Styling Discrepancies: Colors off. Functional Discrepancies: Broken link."
+
+
+def test_run_fanout_returns_remaining_sections_when_one_job_fails():
+    async def generate(job, schema):
+        if job == "styling":
+            raise RuntimeError("upstream error")
+        return schema.model_validate(outputs[job])
+
+    response, failed = asyncio.run(run_fanout(list(outputs), generate))
+
+    assert failed == ["styling"]
+    assert response.Detailed_Analysis.Styling_Discrepancies is None
+    assert response.Detailed_Analysis.Content_Discrepancies.Summary == "Typos."
+
+
+def test_run_fanout_bounds_concurrency_and_raises_when_all_fail():
+    running = 0
+    peak = 0
+
+    async def generate(job, schema):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        raise RuntimeError(job)
+
+    with pytest.raises(RuntimeError, match="content"):
+        asyncio.run(run_fanout(list(outputs), generate, concurrency=2))
+    assert peak == 2
+
+
+def test_assemble_without_detailed_sections():
+    response = assemble({"functional": FANOUT_SCHEMAS["functional"].model_validate({"Other Issues": []})})
+    assert response.Detailed_Analysis.Functional_Discrepancies is None
+    assert response.Executive_Summary is None
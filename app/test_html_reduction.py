@@ -0,0 +1,80 @@
+from app.html_reduction import HtmlReducer
+from app.models import WebpageAnalysisResponse
+
+SCRIPT = "window.bundle = function () { return 42; };" * 10
+DATA_URI = "data:image/png;base64," + "A" * 200
+PATH = "M0 0 L10 10 " * 20
+
+PAGE = f"""<!DOCTYPE html>
+<html>
+  <head>
+    <!-- generated by the build -->
+    <style>
+      body {{   background: url({DATA_URI}); }}
+    </style>
+    <script src="/app.js"></script>
+    <script>{SCRIPT}</script>
+  </head>
+  <body>
+    <h1 class="title">Hello &amp; welcome</h1>
+    <img src="{DATA_URI}" alt="logo">
+    <svg><path d="{PATH}"/></svg>
+    <pre>  keep
+    this</pre>
+  </body>
+</html>"""
+
+
+def test_reduce_elides_payloads_and_keeps_markup():
+    result = HtmlReducer().reduce(PAGE)
+
+    assert SCRIPT not in result.html
+    assert DATA_URI not in result.html
+    assert PATH not in result.html
+    assert "generated by the build" not in result.html
+    assert '<script src="/app.js"></script>' in result.html
+    assert '<h1 class="title">Hello &amp; welcome</h1>' in result.html
+    assert "<pre>  keep\n    this</pre>" in result.html
+    assert "\n  " not in result.html.split("<pre>")[0]
+    assert result.bytes_saved > len(SCRIPT) + 2 * len(DATA_URI)
+    assert result.tokens_saved > 0
+
+
+def test_placeholders_restore_original_code():
+    result = HtmlReducer().reduce(PAGE)
+    reduced_img = next(line for line in result.html.splitlines() if line.startswith("<img"))
+
+    assert result.restore(reduced_img) == f'<img src="{DATA_URI}" alt="logo">'
+
+    response = WebpageAnalysisResponse.model_validate({"Other Issues": [{"Code": reduced_img}]})
+    result.restore_response(response)
+    assert response.Other_Issues[0].Code == f'<img src="{DATA_URI}" alt="logo">'
+
+
+def test_text_resembling_a_placeholder_is_not_restored():
+    page = f'<p>__ELIDED_1__ __ELIDED_00000000_1__</p><img src="{DATA_URI}">'
+    result = HtmlReducer().reduce(page)
+
+    assert DATA_URI not in result.html
+    assert result.restore("<p>__ELIDED_1__ __ELIDED_00000000_1__</p>") == "<p>__ELIDED_1__ __ELIDED_00000000_1__</p>"
+    assert result.restore(result.html) == page
+
+
+def test_steps_are_configurable():
+    result = HtmlReducer(steps="comments", min_elide_chars=64).reduce(PAGE)
+
+    assert SCRIPT in result.html
+    assert DATA_URI in result.html
+    assert "generated by the build" not in result.html
+    assert HtmlReducer(steps="").reduce(PAGE).html == PAGE
+
+
+def test_small_payloads_are_left_in_place():
+    html = "<script>init()</script>"
+    assert HtmlReducer().reduce(html).html == html
+
+
+def test_end_tags_are_kept_verbatim():
+    html = '<DIV Class="a"><P>text</P ></DIV>\n<svg><path d="M0"/></Svg>'
+
+    assert HtmlReducer(steps="whitespace").reduce(html).html == html
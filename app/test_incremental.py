@@ -0,0 +1,68 @@
+from app.incremental import AnalysisHistory, content_hash, diff_pages, split_findings, merge_incremental
+from app.models import WebpageAnalysisResponse
+
+HEAD = "<html><head><style>h1 { color: red }</style></head>"
+PAGE = HEAD + "<body><header><h1>Shop</h1></header><main><button class=\"buy\">Buy now</button></main><footer><a href=\"/terms\">Terms and conditions</a></footer></body></html>"
+EDITED = PAGE.replace("<button class=\"buy\">Buy now</button>", "<button class=\"buy\" aria-label=\"Buy\">Buy now</button>")
+
+
+def analysis(content: list[dict], other: list[dict] | None = None, summary: str = "Summary.") -> WebpageAnalysisResponse:
+    return WebpageAnalysisResponse.model_validate({
+        "Executive Summary": summary,
+        "Detailed Analysis": {"Content Discrepancies": {"Summary": f"Content {summary}", "Findings": content}},
+        "Non-LLM Evaluations": {"Layout Report": {"Summary": "No overflow."}},
+        "Other Issues": other or [],
+    })
+
+
+def test_diff_pages_finds_changed_regions():
+    diff = diff_pages(PAGE, EDITED, max_chars=100)
+
+    assert diff.changed == ["<main><button class=\"buy\" aria-label=\"Buy\">Buy now</button></main>"]
+    assert diff.removed == ["<main><button class=\"buy\">Buy now</button></main>"]
+    assert len(diff.unchanged) == 2 and diff.regions == 3
+    assert not diff.head_changed
+    assert diff.html().startswith(HEAD.removeprefix("<html>")) and "aria-label" in diff.html() and "<footer>" not in diff.html()
+
+    assert diff_pages(PAGE, PAGE.replace("red", "blue"), max_chars=100).head_changed
+    assert diff_pages(PAGE, PAGE.replace("</main>", "</main>\n  "), max_chars=100).changed == []
+
+
+def test_findings_are_split_by_region_and_merged():
+    previous = analysis(
+        content=[{"Issue": "Button without label", "Code": "<button class=\"buy\">Buy now</button>"},
+                 {"Issue": "Vague link", "Code": "<a href=\"/terms\">Terms and conditions</a>"},
+                 {"Issue": "Page-level issue"}],
+        other=[{"Issue": "Heading colour", "Code": "<h1>Shop</h1>"}],
+    )
+    diff = diff_pages(PAGE, EDITED, max_chars=100)
+
+    carried, touched = split_findings(previous, diff)
+
+    assert [f.Issue for f in carried.Detailed_Analysis.Content_Discrepancies.Findings] == ["Vague link", "Page-level issue"]
+    assert [f.Issue for f in carried.Other_Issues] == ["Heading colour"]
+    assert touched == {"Content Discrepancies": [{"Issue": "Button without label", "Code": "<button class=\"buy\">Buy now</button>"}]}
+    assert len(previous.Detailed_Analysis.Content_Discrepancies.Findings) == 3
+
+    update = analysis(content=[{"Issue": "Vague link", "Code": "<a href=\"/terms\">Terms and conditions</a>"},
+                               {"Issue": "Low contrast", "Code": "<button class=\"buy\" aria-label=\"Buy\">Buy now</button>"}], summary="Updated.")
+    update.Non_LLM_Evaluations = None
+    merged = merge_incremental(carried, update)
+
+    assert [f.Issue for f in merged.Detailed_Analysis.Content_Discrepancies.Findings] == ["Vague link", "Page-level issue", "Low contrast"]
+    assert merged.Executive_Summary == "Updated."
+    assert merged.Detailed_Analysis.Content_Discrepancies.Summary == "Content Updated."
+    assert merged.Non_LLM_Evaluations.Layout_Report.Summary == "No overflow."
+
+
+def test_history_is_referenced_by_id_or_content_hash():
+    history = AnalysisHistory(max_entries=2)
+    first = history.add(PAGE, "context", analysis([]))
+    second = history.add(EDITED, "context", analysis([]))
+
+    assert history.get(first.id) is first
+    assert history.get(content_hash(EDITED)) is second
+    history.add("<p>Other</p>", "context", analysis([]))
+    # The least recently used entry is evicted, with its hash
+    assert history.get(first.id) is None and history.get(content_hash(PAGE)) is None
+    assert history.get(second.id) is second
@@ -0,0 +1,106 @@
+import inspect
+import pytest
+from urllib.parse import quote
+from fastapi import FastAPI, Form, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+from starlette.formparsers import FormParser, MultiPartParser, MultipartPart
+from starlette.requests import Request
+from app.intake import IntakeLimits, intake_route, utf8_chars
+
+PNG = b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR"
+JPEG = b"\xff\xd8\xff\xe0\0\x10JFIF\0\1\1\0"
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.router.route_class = intake_route({"/limited": IntakeLimits(text_chars=10, file_bytes=32, max_request_bytes=2048)})
+
+    async def endpoint(htmlText: str = Form(...), specification: str = Form(""), designFile: UploadFile | None = File(None)):
+        file = {"type": designFile.content_type, "size": len(await designFile.read())} if designFile else None
+        return {"chars": len(htmlText) + len(specification), "file": file}
+
+    app.post("/limited")(endpoint)
+    app.post("/unlimited")(endpoint)
+    return TestClient(app)
+
+
+def test_utf8_chars_counts_characters_across_chunks():
+    data = "aé€😀".encode()
+    assert utf8_chars(data) == 4
+    assert sum(utf8_chars(data[i:i + 1]) for i in range(len(data))) == 4
+
+
+def test_text_limit_counts_decoded_characters(client):
+    # 10 characters, 30 bytes once percent-encoded
+    response = client.post("/limited", content="htmlText=" + quote("€" * 5) + "&specification=" + quote("é" * 5),
+                           headers={"content-type": "application/x-www-form-urlencoded"})
+    assert response.status_code == 200
+    assert response.json()["chars"] == 10
+
+    response = client.post("/limited", data={"htmlText": "€" * 6, "specification": "é" * 5})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Files are too large"
+
+    response = client.post("/limited", data={"htmlText": "a" * 6, "specification": "b" * 5}, files={"designFile": ("a.png", PNG, "image/png")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Files are too large"
+
+
+def test_other_fields_and_unlimited_routes(client):
+    response = client.post("/limited", data={"htmlText": "a", "extra": "x" * 2000})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Field extra is too large"
+
+    response = client.post("/unlimited", data={"htmlText": "a" * 100})
+    assert response.status_code == 200
+
+
+def test_request_size_is_checked_before_reading(client):
+    response = client.post("/limited", content=b"htmlText=a", headers={"content-type": "application/x-www-form-urlencoded", "content-length": "4096"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Files are too large"
+
+
+def test_design_file_is_sniffed(client):
+    response = client.post("/limited", data={"htmlText": "a"}, files={"designFile": ("a.png", JPEG, "image/png")})
+    assert response.status_code == 200
+    assert response.json()["file"] == {"type": "image/jpeg", "size": len(JPEG)}
+
+    response = client.post("/limited", data={"htmlText": "a"}, files={"designFile": ("a.png", b"%PDF-1.7\n%\xe2\xe3\xcf\xd3", "image/png")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "designFile must be an image"
+
+    response = client.post("/limited", data={"htmlText": "a"}, files={"designFile": ("a.png", PNG, "application/pdf")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "designFile must be an image"
+
+    response = client.post("/limited", data={"htmlText": "a"}, files={"designFile": ("a.png", PNG + b"\0" * 32, "image/png")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Files are too large"
+
+
+def test_unexpected_file_fields_are_rejected(client):
+    response = client.post("/limited", data={"htmlText": "a"}, files={"specification": ("a.png", PNG, "image/png")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unexpected file field specification"
+
+
+def test_starlette_internals_used_by_intake_are_present():
+    # app.intake relies on these private parts of Starlette; update the pins in requirements.txt
+    # (and app.intake) if this fails after an upgrade
+    async def stream():
+        yield b""
+
+    parser = MultiPartParser(Headers(), stream())
+    assert hasattr(parser, "_current_part") and hasattr(MultipartPart(), "item_headers")
+    for method in ("on_headers_finished", "on_part_data", "on_part_end"):
+        assert callable(getattr(MultiPartParser, method, None)), method
+    for method in ("on_field_start", "on_field_name", "on_field_data"):
+        assert callable(getattr(FormParser, method, None)), method
+    for parser_class in (MultiPartParser, FormParser):
+        assert "max_part_size" in inspect.signature(parser_class).parameters
+    request = Request({"type": "http", "method": "POST", "headers": []})
+    assert hasattr(request, "_form") and request._form is None
+    assert inspect.iscoroutinefunction(Request._get_form)
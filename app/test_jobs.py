@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+from app.jobs import JobStore, JobWorkers, IdempotencyConflict
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return JobStore(path=str(tmp_path / "jobs.sqlite3"), lease_seconds=60, max_attempts=2, ttl_seconds=3600, clock=clock)
+
+
+def test_jobs_are_claimed_oldest_first(store, clock):
+    first, _ = store.create("k1", {"htmlText": "a"})
+    clock.now += 1
+    second, _ = store.create("k2", {"htmlText": "b"}, b"png", "image/png", "design.png")
+
+    claimed = store.claim()
+    assert claimed.id == first.id
+    assert claimed.status == "running"
+    assert claimed.attempts == 1
+    claimed = store.claim()
+    assert claimed.id == second.id
+    assert claimed.design == b"png"
+    assert store.claim() is None
+
+
+def test_finish_stores_result_and_drops_design(store):
+    job, _ = store.create("k", {}, b"png", "image/png", "design.png")
+    claimed = store.claim()
+
+    assert store.finish(job.id, claimed.attempts, '{"ok": true}')
+
+    finished = store.get(job.id)
+    assert finished.public()["result"] == {"ok": True}
+    assert finished.design is None
+
+
+def test_expired_lease_is_reclaimed_until_max_attempts(store, clock):
+    job, _ = store.create("k", {})
+    store.claim()
+    assert store.claim() is None
+
+    clock.now += 61
+    assert store.claim().attempts == 2
+
+    clock.now += 61
+    assert store.claim() is None
+    failed = store.get(job.id)
+    assert failed.status == "failed"
+    assert failed.error
+
+
+def test_stale_claim_cannot_finish_or_release_the_job(store, clock):
+    job, _ = store.create("k", {})
+    stale = store.claim()
+    clock.now += 61
+    current = store.claim()
+
+    assert not store.finish(job.id, stale.attempts, '{"stale": true}')
+    assert not store.release(job.id, stale.attempts) and not store.extend_lease(job.id, stale.attempts)
+    assert store.get(job.id).status == "running"
+    assert store.finish(job.id, current.attempts, '{"ok": true}')
+    assert store.get(job.id).public()["result"] == {"ok": True}
+
+
+def test_idempotency_key_returns_existing_job(store):
+    job, created = store.create("k", {}, idempotency_key="retry")
+    replay, replay_created = store.create("k", {}, idempotency_key="retry")
+
+    assert created and not replay_created
+    assert replay.id == job.id
+    with pytest.raises(IdempotencyConflict):
+        store.create("other", {}, idempotency_key="retry")
+
+
+def test_purge_removes_only_old_finished_jobs(store, clock):
+    done, _ = store.create("k1", {})
+    store.finish(done.id, store.claim().attempts, error="boom")
+    queued, _ = store.create("k2", {})
+
+    clock.now += 3601
+
+    assert store.purge() == 1
+    assert store.get(done.id) is None
+    assert store.get(queued.id) is not None
+
+
+def test_workers_record_handler_errors(store):
+    async def handler(job):
+        raise ValueError("bad input")
+
+    job, _ = store.create("k", {})
+    workers = JobWorkers(store, handler)
+
+    assert asyncio.run(workers.run_once()) is True
+    assert store.get(job.id).public()["error"] == "bad input"
+
+
+def test_running_job_lease_is_extended_until_it_finishes(store, clock):
+    async def handler(job):
+        # Outlives the 60s lease; the heartbeat keeps it from being claimed again
+        for _ in range(3):
+            clock.now += 40
+            await asyncio.sleep(0.02)
+        assert store.claim() is None
+        return "{}"
+
+    job, _ = store.create("k", {})
+    workers = JobWorkers(store, handler, heartbeat_seconds=0.01)
+
+    assert asyncio.run(workers.run_once()) is True
+    assert store.get(job.id).status == "succeeded"
+
+
+def test_idle_store_does_not_create_its_file(tmp_path):
+    store = JobStore(path=str(tmp_path / "jobs.sqlite3"))
+    assert store.claim() is None and store.purge() == 0 and store.get("x") is None
+    assert not (tmp_path / "jobs.sqlite3").exists()
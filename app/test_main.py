@@ -1,11 +1,25 @@
 #mistakes: sending client.post here as files= instead of data=, using pydantic model on endpoint to sending file doesn't work. pydantic is just for json
 from fastapi.testclient import TestClient
-from unittest.mock import patch, Mock
+from unittest.mock import patch, Mock, AsyncMock
 from app.main import app
 import os
 import pytest
 import app.main as main
+from app.design_files import DesignFileCache
+from app.design_images import DesignImageProcessor, DesignImageSettings
+from app.incremental import AnalysisHistory
+from app.analysis_store import AnalysisStore
+from app.result_cache import ResultCache, analysis_cache_key
+from app.context_cache import PromptPrefixCache, LocalCaches
+from app.jobs import JobStore, JobWorkers
+from app.rate_limit import RateLimiters
+from app.resilience import ResilientGenerator
+from app.client_pool import ClientPool
 import json
+import io
+import asyncio
+import re
+import httpx
 client = TestClient(app)
 
 html_json = {"htmlText": "<h1>Hello</h1>"}
@@ -104,16 +118,28 @@ mock_api_response = {
 }
 
 @pytest.fixture(autouse=True)
-def mock_gemini_client(monkeypatch):
+def mock_gemini_client(monkeypatch, tmp_path):
     mock = Mock()
-    mock.models.generate_content = Mock()
+    mock.models.generate_content = AsyncMock()
     mock.models.generate_content.return_value.text = json.dumps(mock_api_response)
-    mock.files.upload = Mock(return_value="mock_upload")
-    mock.files.delete = Mock(return_value="mock_delete")
+    mock.files.upload = AsyncMock(return_value="mock_upload")
+    mock.files.delete = AsyncMock(return_value="mock_delete")
     monkeypatch.setattr(main, "client", mock)
-    monkeypatch.setattr(os, "getenv", "mock_api_key")
+    monkeypatch.setattr(main, "client_pool", ClientPool([mock]))
+    # Upload + delete per request unless a test opts into the design file cache
+    monkeypatch.setattr(main, "design_file_cache", DesignFileCache(max_entries=0))
+    monkeypatch.setattr(main, "design_images", DesignImageProcessor(workers=0))
+    monkeypatch.setattr(main, "analysis_store", AnalysisStore(path=str(tmp_path / "analyses.sqlite3"), memory=AnalysisHistory(max_entries=8)))
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=0, path=None))
+    monkeypatch.setattr(main, "prompt_cache", PromptPrefixCache(enabled=False))
+    job_store = JobStore(path=str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(main, "job_store", job_store)
+    monkeypatch.setattr(main, "job_workers", JobWorkers(job_store, main.process_job, concurrency=0))
+    monkeypatch.setattr(main, "rate_limiters", RateLimiters(rpm=0, tpm=0, model_limits={}))
+    monkeypatch.setattr(main, "generator", ResilientGenerator(max_retries=2, revalidate=True, hedge_after=0, fallback_model="", sleep=AsyncMock()))
+    monkeypatch.setattr(os, "getenv", lambda *args, **kwargs: "mock_api_key")
     from .main import client as imported_client
-    assert imported_client.models.generate_content(model="xxx", contents=["xxx"]).text == json.dumps(mock_api_response)
+    assert isinstance(imported_client.models.generate_content, AsyncMock)
 
 @patch("app.main.client.models.generate_content")
 @patch("app.main.client.files.upload")
@@ -129,7 +155,7 @@ def test_htmlText_only_returns_200(mock_delete, mock_upload, mock_generate):
 
     assert response.status_code == 200
     assert json.loads(response.text) == mock_api_response
-    mock_generate.assert_called_once()
+    mock_generate.assert_awaited_once()
     mock_delete.assert_not_called()
     mock_upload.assert_not_called()
 
@@ -173,9 +199,9 @@ def test_htmlText_with_designFile_returns_200(mock_delete, mock_upload, mock_gen
     os.remove("test.png")
     assert response.status_code == 200
     assert json.loads(response.text) == mock_api_response
-    mock_generate.assert_called_once()
-    mock_delete.assert_called_once()
-    mock_upload.assert_called_once()
+    mock_generate.assert_awaited_once()
+    mock_delete.assert_awaited_once()
+    mock_upload.assert_awaited_once()
 
 @patch("app.main.client.models.generate_content")
 @patch("app.main.client.files.upload")
@@ -344,3 +370,920 @@ def test_webAuditResults_missing_keys_throws_400(mock_delete, mock_upload, mock_
     mock_delete.assert_not_called()
     mock_upload.assert_not_called()
 
+
+
+@patch("app.main.client.models.generate_content")
+@patch("app.main.client.files.upload")
+@patch("app.main.client.files.delete")
+def test_designFile_is_uploaded_from_memory(mock_delete, mock_upload, mock_generate):
+    """Test that the design file is uploaded as an in-memory stream and no temp file is written."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    mock_upload.return_value.name = "files/abc"
+    files_before = set(os.listdir("."))
+
+    response = client.post(
+        "/webpage-analysis",
+        data=html_json,
+        files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+    )
+
+    assert response.status_code == 200
+    assert set(os.listdir(".")) == files_before
+    upload_kwargs = mock_upload.call_args.kwargs
+    assert upload_kwargs["file"].getvalue() == b"\x89PNG\r\n\x1a\n"
+    assert upload_kwargs["config"]["mime_type"] == "image/png"
+    mock_delete.assert_awaited_once_with(name="files/abc")
+
+
+@patch("app.main.client.models.generate_content")
+@patch("app.main.client.files.upload")
+@patch("app.main.client.files.delete")
+def test_small_designFile_is_sent_inline(mock_delete, mock_upload, mock_generate, monkeypatch):
+    """Test that a design file under the inline limit skips the Files API entirely."""
+    monkeypatch.setattr("app.design_files.DESIGN_FILE_INLINE_MAX_BYTES", 1024)
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+
+    response = client.post(
+        "/webpage-analysis",
+        data=html_json,
+        files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+    )
+
+    assert response.status_code == 200
+    image_part = mock_generate.call_args.kwargs["contents"][1]
+    assert image_part.inline_data.data == b"\x89PNG\r\n\x1a\n"
+    assert image_part.inline_data.mime_type == "image/png"
+    mock_upload.assert_not_called()
+    mock_delete.assert_not_called()
+
+
+@patch("app.main.client.models.generate_content")
+@patch("app.main.client.files.upload")
+@patch("app.main.client.files.delete")
+def test_designFile_is_deleted_when_generation_fails(mock_delete, mock_upload, mock_generate):
+    """Test that an uploaded design file is still cleaned up when generation raises."""
+    mock_generate.side_effect = RuntimeError("upstream failure")
+    mock_upload.return_value.name = "files/abc"
+
+    response = client.post(
+        "/webpage-analysis",
+        data=html_json,
+        files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+    )
+
+    assert response.status_code == 500
+    mock_delete.assert_awaited_once_with(name="files/abc")
+
+
+@patch("app.main.client.models.generate_content")
+@patch("app.main.client.files.upload")
+@patch("app.main.client.files.delete")
+def test_repeated_designFile_reuses_cached_upload(mock_delete, mock_upload, mock_generate, monkeypatch):
+    """Test that the same design image is uploaded once and reused while cached."""
+    monkeypatch.setattr(main, "design_file_cache", DesignFileCache(max_entries=4))
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    mock_upload.return_value.name = "files/abc"
+
+    for _ in range(3):
+        response = client.post(
+            "/webpage-analysis",
+            data=html_json,
+            files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+        )
+        assert response.status_code == 200
+
+    mock_upload.assert_awaited_once()
+    mock_delete.assert_not_called()
+    assert mock_generate.await_count == 3
+    assert mock_generate.call_args.kwargs["contents"][1] is mock_upload.return_value
+
+
+@patch("app.main.client.models.generate_content")
+@patch("app.main.client.files.upload")
+@patch("app.main.client.files.delete")
+def test_tall_designFile_is_downscaled_and_tiled(mock_delete, mock_upload, mock_generate, monkeypatch):
+    """Test that a tall design is sent as downscaled tiles, each uploaded and deleted."""
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.setattr(main, "design_images", DesignImageProcessor(enabled=True, settings=DesignImageSettings(max_width=100, tile_height=200, format="keep"), workers=0))
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    mock_upload.return_value.name = "files/tile"
+    buffer = io.BytesIO()
+    Image.new("RGB", (400, 1200), "white").save(buffer, format="PNG")
+
+    response = client.post(
+        "/webpage-analysis",
+        data=html_json,
+        files={"designFile": ("design.png", buffer.getvalue(), "image/png")}
+    )
+
+    assert response.status_code == 200
+    assert mock_upload.await_count == 2
+    assert [Image.open(call.kwargs["file"]).size for call in mock_upload.call_args_list] == [(100, 150), (100, 150)]
+    assert mock_upload.call_args.kwargs["config"]["display_name"] == "design.png (2 of 2)"
+    contents = mock_generate.call_args.kwargs["contents"]
+    assert "2 consecutive parts" in contents[1]
+    assert contents[2:] == [mock_upload.return_value] * 2
+    assert mock_delete.await_count == 2
+
+
+@patch("app.main.client.models.generate_content")
+def test_resubmitted_page_is_reanalyzed_incrementally(mock_generate):
+    """Test that only the changed region is sent, with its previous findings, and the rest is carried over."""
+    page = "<html><head><title>Shop</title></head><body>" + "".join(
+        f"<section><button id=\"b{i}\">Button number {i}</button>{'<p>Filler text.</p>' * 10}</section>" for i in range(4)) + "</body></html>"
+    edited = page.replace("<button id=\"b1\">", "<button id=\"b1\" aria-label=\"One\">")
+    previous = json.loads(json.dumps(mock_api_response))
+    previous["Detailed Analysis"]["Content Discrepancies"]["Findings"][0].update({"Issue": "Missing label", "Code": "<button id=\"b1\">Button number 1</button>"})
+    mock_generate.return_value.text = json.dumps(previous)
+
+    first = client.post("/webpage-analysis", data={"htmlText": page})
+    assert first.status_code == 200
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+
+    response = client.post("/webpage-analysis", data={"htmlText": edited, "previousAnalysis": first.headers["X-Analysis-Id"]})
+
+    assert response.status_code == 200
+    assert response.headers["X-Incremental"] == "1 of 4 regions"
+    prompt = mock_generate.call_args.kwargs["contents"][0]
+    assert "aria-label" in prompt and "Button number 2" not in prompt
+    assert "**Previous Findings:**" in prompt and "Missing label" in prompt
+    result = response.json()
+    assert [f["Issue"] for f in result["Detailed Analysis"]["Content Discrepancies"]["Findings"]] == ["Mock Issue"]
+    assert result["Non-LLM Evaluations"] == previous["Non-LLM Evaluations"]
+
+    again = client.post("/webpage-analysis", data={"htmlText": edited, "previousAnalysis": response.headers["X-Content-Hash"]})
+    assert again.headers["X-Incremental"] == "unchanged"
+    assert again.json() == result
+    assert mock_generate.await_count == 2
+
+    assert client.post("/webpage-analysis", data={"htmlText": edited, "previousAnalysis": "unknown"}).status_code == 404
+    changed_spec = client.post("/webpage-analysis", data={"htmlText": edited, "specification": "New", "previousAnalysis": response.headers["X-Analysis-Id"]})
+    assert changed_spec.headers["X-Incremental"] == "full"
+
+
+@patch("app.main.client.models.generate_content")
+def test_analyses_are_stored_and_queryable(mock_generate, monkeypatch, tmp_path):
+    """Test that analyses can be fetched and listed, also after a restart, without calling the LLM again."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    ids = [client.post("/webpage-analysis", data={**html_spec_json, "htmlText": f"<p>{i}</p>", "url": "https://example.com/", "label": "v1"}).headers["X-Analysis-Id"]
+           for i in range(3)]
+    client.post("/webpage-analysis", data={**html_json, "label": "v2"})
+
+    first = client.get("/analyses", params={"label": "v1", "limit": 2}).json()
+    assert [item["id"] for item in first["items"]] == ids[:0:-1]
+    rest = client.get("/analyses", params={"label": "v1", "limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [item["id"] for item in rest["items"]] == ids[:1] and rest["next_cursor"] is None
+    assert client.get("/analyses", params={"cursor": "bad"}).status_code == 400
+
+    # A restarted service reads the analyses back from disk
+    monkeypatch.setattr(main, "analysis_store", AnalysisStore(path=str(tmp_path / "analyses.sqlite3"), memory=AnalysisHistory(max_entries=8)))
+    stored = client.get(f"/analyses/{ids[1]}", params={"inputs": "true"}).json()
+    assert stored["url"] == "https://example.com/" and stored["htmlText"] == "<p>1</p>"
+    assert stored["result"] == mock_api_response
+    assert "htmlText" not in client.get(f"/analyses/{ids[1]}").json()
+    assert client.get("/analyses/unknown").status_code == 404
+    assert mock_generate.await_count == 4
+
+
+@patch("app.main.client.models.generate_content")
+def test_identical_request_is_served_from_result_cache(mock_generate, monkeypatch):
+    """Test that a repeated identical request skips the LLM call and reports a cache hit."""
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=8, path=None))
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+
+    first = client.post("/webpage-analysis", data=html_spec_json)
+    second = client.post("/webpage-analysis", data=html_spec_json)
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert json.loads(second.text) == mock_api_response
+    mock_generate.assert_awaited_once()
+    assert main.result_cache.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+
+
+@patch("app.main.client.models.generate_content")
+def test_bypassCache_forces_a_fresh_analysis(mock_generate, monkeypatch):
+    """Test that bypassCache skips the lookup and refreshes the stored result."""
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=8, path=None))
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+
+    client.post("/webpage-analysis", data=html_json)
+    response = client.post("/webpage-analysis", data={**html_json, "bypassCache": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "BYPASS"
+    assert mock_generate.await_count == 2
+
+
+@patch("app.main.client.models.generate_content")
+def test_result_cache_persists_on_disk(mock_generate, monkeypatch, tmp_path):
+    """Test that the SQLite tier serves results to a fresh cache instance, e.g. after a restart."""
+    path = str(tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=8, path=path))
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    client.post("/webpage-analysis", data=html_json)
+
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=8, path=path))
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.headers["X-Cache"] == "HIT"
+    assert json.loads(response.text) == mock_api_response
+    mock_generate.assert_awaited_once()
+    assert main.result_cache.stats["disk_hits"] == 1
+
+
+def test_concurrent_identical_requests_share_one_llm_call(monkeypatch):
+    """Test that identical requests arriving together are coalesced into one upstream call."""
+    gate = asyncio.Event()
+
+    async def slow_generate(**kwargs):
+        await gate.wait()
+        result = Mock()
+        result.text = json.dumps(mock_api_response)
+        return result
+
+    mock_generate = AsyncMock(side_effect=slow_generate)
+    monkeypatch.setattr(main.client.models, "generate_content", mock_generate)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            requests = [asyncio.create_task(async_client.post("/webpage-analysis", data=html_json)) for _ in range(4)]
+            key = analysis_cache_key(html_json["htmlText"], "", "", None, main.model, main.pipeline_fingerprint())
+            while main.inflight.waiters(key) < 4:
+                await asyncio.sleep(0.01)
+            gate.set()
+            return await asyncio.gather(*requests)
+
+    reduce = Mock(side_effect=main.html_reducer.reduce)
+    monkeypatch.setattr(main.html_reducer, "reduce", reduce)
+
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 4
+    assert all(json.loads(response.text) == mock_api_response for response in responses)
+    # Duplicates receive the shared run's headers without repeating its work
+    assert all(response.headers["X-Analysis-Chunks"] == "1" and "X-Html-Bytes-Saved" in response.headers for response in responses)
+    mock_generate.assert_awaited_once()
+    reduce.assert_called_once()
+
+
+@patch("app.main.client.models.generate_content")
+def test_htmlText_is_reduced_before_prompting(mock_generate):
+    """Test that inline scripts are elided from the prompt and the savings are reported."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    script = "console.log('bundle');" * 100
+    response = client.post(
+        "/webpage-analysis",
+        data={"htmlText": f"<h1>Hello</h1><script>{script}</script>"}
+    )
+
+    assert response.status_code == 200
+    prompt = mock_generate.call_args.kwargs["contents"][0]
+    assert script not in prompt
+    assert re.search(r"<script>__ELIDED_[0-9a-f]{8}_1__</script>", prompt)
+    assert int(response.headers["X-Html-Bytes-Saved"]) > len(script) - 30
+    assert int(response.headers["X-Html-Tokens-Saved"]) > 0
+
+
+@patch("app.main.client.models.generate_content")
+def test_chunked_analysis_splits_page_and_merges_results(mock_generate, monkeypatch):
+    """Test that a chunked request makes one call per section and returns one merged response."""
+    monkeypatch.setattr(main, "CHUNK_MAX_CHARS", 400)
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    sections = "".join(f"<section><h2>Section {i}</h2><p>{'text ' * 40}</p></section>" for i in range(4))
+    audit = json.dumps({"axeCoreResult": {"violations": ["contrast"]}, "pageSpeedResult": 90, "nuValidatorResult": [], "responsivenessResult": True})
+
+    response = client.post(
+        "/webpage-analysis",
+        data={"htmlText": f"<html><head><title>T</title></head><body>{sections}</body></html>", "webAuditResults": audit, "chunked": "true"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["X-Analysis-Chunks"] == "4"
+    assert mock_generate.await_count == 4
+    prompts = [call.kwargs["contents"][0] for call in mock_generate.call_args_list]
+    assert sum("contrast" in prompt for prompt in prompts) == 1
+    assert all("<title>T</title>" in prompt for prompt in prompts)
+    body = json.loads(response.text)
+    # Identical findings from every chunk are de-duplicated
+    assert len(body["Detailed Analysis"]["Content Discrepancies"]["Findings"]) == 1
+    assert body["Executive Summary"] == "Analysis of 4 page sections. Mock summary."
+
+
+def parse_sse(text):
+    """Splits an SSE body into (event, data) pairs."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def mock_stream(text, size=40):
+    """Returns an AsyncMock that streams `text` in small pieces like generate_content_stream."""
+    async def chunks():
+        for start in range(0, len(text), size):
+            chunk = Mock()
+            chunk.text = text[start:start + size]
+            yield chunk
+
+    return AsyncMock(side_effect=lambda **kwargs: chunks())
+
+
+def test_stream_emits_sections_then_complete_response(monkeypatch):
+    """Test that the SSE endpoint emits each validated section as it completes, then the full response."""
+    fenced = "```json\n" + json.dumps(mock_api_response, indent=2) + "\n```"
+    monkeypatch.setattr(main.client.models, "generate_content_stream", mock_stream(fenced))
+
+    response = client.post("/webpage-analysis/stream", data=html_json)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    sections = [tuple(data["path"]) for event, data in events if event == "section"]
+    assert sections == [
+        ("Executive Summary",),
+        ("Detailed Analysis", "Content Discrepancies"),
+        ("Detailed Analysis", "Styling Discrepancies"),
+        ("Detailed Analysis", "Intentional Flaws And Known Issues"),
+        ("Detailed Analysis", "Functional Discrepancies"),
+        ("Non-LLM Evaluations",),
+        ("Other Issues",),
+    ]
+    assert events[1][1]["data"] == mock_api_response["Detailed Analysis"]["Content Discrepancies"]
+    assert events[-1] == ("complete", mock_api_response)
+
+
+def test_stream_reports_invalid_output_as_error_event(monkeypatch):
+    """Test that a model output that fails validation ends the stream with an error event."""
+    monkeypatch.setattr(main.client.models, "generate_content_stream", mock_stream('{"Executive Summary": "ok", "Other Issues": "not a list"}'))
+
+    response = client.post("/webpage-analysis/stream", data=html_json)
+
+    events = parse_sse(response.text)
+    assert events[0] == ("section", {"path": ["Executive Summary"], "data": "ok"})
+    assert events[-1][0] == "error"
+
+
+def test_stream_validates_inputs_before_streaming():
+    """Test that invalid input is rejected with a 400 rather than an event stream."""
+    response = client.post(
+        "/webpage-analysis/stream",
+        data={"htmlText": "<h1>Test</h1>", "webAuditResults": "{invalid json}"}
+    )
+
+    assert response.status_code == 400
+    assert "Invalid webAuditResults JSON" in response.text
+
+
+@patch("app.main.client.models.generate_content")
+def test_generation_enforces_response_schema(mock_generate):
+    """Test that the response schema is passed to the model instead of an example in the prompt."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 200
+    config = mock_generate.call_args.kwargs["config"]
+    assert config["response_mime_type"] == "application/json"
+    assert config["response_schema"] is main.WebpageAnalysisResponse
+    assert "Example Output Format" not in mock_generate.call_args.kwargs["contents"][0]
+
+
+@patch("app.main.client.models.generate_content")
+def test_output_not_matching_schema_returns_500(mock_generate):
+    """Test that output failing validation is reported as a server error."""
+    mock_generate.return_value.text = json.dumps({"Other Issues": "not a list"})
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 500
+
+
+class RejectedCache(Exception):
+    code = 404
+
+
+def enable_prompt_cache(monkeypatch):
+    main.client.caches = LocalCaches()
+    # The instructions are below Gemini's minimum cacheable size; the API is faked here
+    prompt_cache = PromptPrefixCache(enabled=True, min_tokens=0)
+    monkeypatch.setattr(main, "prompt_cache", prompt_cache)
+    name = asyncio.run(prompt_cache.ensure(main.client, main.model, main.PROMPT_VERSION, main.get_instructions()))
+    return name
+
+
+@patch("app.main.client.models.generate_content")
+def test_cached_prompt_prefix_is_referenced_instead_of_resent(mock_generate, monkeypatch):
+    """Test that only the inputs are sent when the static prefix is cached upstream."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    name = enable_prompt_cache(monkeypatch)
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 200
+    kwargs = mock_generate.call_args.kwargs
+    assert kwargs["config"]["cached_content"] == name
+    assert kwargs["contents"][0].startswith("**Inputs for Analysis:**")
+    assert main.get_instructions() not in kwargs["contents"][0]
+    assert main.client.caches.entries[name]["config"]["system_instruction"] == main.get_instructions()
+
+
+@patch("app.main.client.models.generate_content")
+def test_rejected_prompt_cache_falls_back_to_full_prompt(mock_generate, monkeypatch):
+    """Test that a rejected cached-content reference is dropped and the full prompt is sent."""
+    ok = Mock(text=json.dumps(mock_api_response))
+    mock_generate.side_effect = [RejectedCache("cached content not found"), ok]
+    enable_prompt_cache(monkeypatch)
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 200
+    retry = mock_generate.call_args_list[1].kwargs
+    assert "cached_content" not in retry["config"]
+    assert retry["contents"][0].startswith(main.get_instructions())
+    assert main.prompt_cache.get(main.model, main.PROMPT_VERSION) is None
+
+
+@patch("app.main.client.models.generate_content")
+def test_webAuditResults_are_compacted_before_prompting(mock_generate):
+    """Test that passing axe-core checks are dropped from the prompt and the savings are reported."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    axe = {
+        "passes": [{"id": "document-title", "nodes": [{"html": "<title>T</title>", "target": ["title"]}]}] * 50,
+        "violations": [{"id": "image-alt", "impact": "critical", "help": "Images must have alt text", "nodes": [{"target": ["#hero img"]}]}],
+    }
+    audit = json.dumps({"axeCoreResult": axe, "pageSpeedResult": None, "nuValidatorResult": None, "responsivenessResult": None})
+
+    response = client.post("/webpage-analysis", data={"htmlText": "<h1>Test</h1>", "webAuditResults": audit})
+
+    assert response.status_code == 200
+    prompt = mock_generate.call_args.kwargs["contents"][0]
+    assert '"image-alt"' in prompt and "#hero img" in prompt
+    assert "document-title" not in prompt
+    assert int(response.headers["X-Audit-Bytes-Saved"]) > 0
+
+
+@patch("app.main.client.models.generate_content")
+def test_local_non_llm_evaluations_are_not_generated(mock_generate, monkeypatch):
+    """Test that in local mode the model only generates the other sections and the audits are rendered locally."""
+    monkeypatch.setattr(main, "NON_LLM_EVALUATIONS", "local")
+    llm_output = {key: value for key, value in mock_api_response.items() if key != "Non-LLM Evaluations"}
+    mock_generate.return_value.text = json.dumps(llm_output)
+    audit = json.dumps({"axeCoreResult": {"violations": []}, "pageSpeedResult": None, "nuValidatorResult": None, "responsivenessResult": True})
+
+    response = client.post("/webpage-analysis", data={"htmlText": "<h1>Test</h1>", "webAuditResults": audit})
+
+    assert response.status_code == 200
+    assert response.headers["X-Non-LLM-Evaluations"] == "local"
+    assert mock_generate.call_args.kwargs["config"]["response_schema"] is main.LLMAnalysisResponse
+    body = json.loads(response.text)
+    assert body["Detailed Analysis"] == mock_api_response["Detailed Analysis"]
+    assert body["Non-LLM Evaluations"]["Accessibility Report"]["Summary"] == "axe-core found no accessibility violations."
+    assert body["Non-LLM Evaluations"]["Layout Report"]["Summary"] == "Horizontal overflow was detected at desktop width."
+    assert body["Non-LLM Evaluations"]["Performance Report"] is None
+
+
+@patch("app.main.client.models.generate_content")
+def test_unrecognized_audits_fall_back_to_model_evaluations(mock_generate, monkeypatch):
+    """Test that audits in an unknown format are still summarized by the model in local mode."""
+    monkeypatch.setattr(main, "NON_LLM_EVALUATIONS", "local")
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    audit = json.dumps({"axeCoreResult": ["contrast"], "pageSpeedResult": 90, "nuValidatorResult": [], "responsivenessResult": True})
+
+    response = client.post("/webpage-analysis", data={"htmlText": "<h1>Test</h1>", "webAuditResults": audit})
+
+    assert response.status_code == 200
+    assert response.headers["X-Non-LLM-Evaluations"] == "model"
+    assert mock_generate.call_args.kwargs["config"]["response_schema"] is main.WebpageAnalysisResponse
+    assert json.loads(response.text) == mock_api_response
+
+
+def test_stream_emits_local_non_llm_evaluations_first(monkeypatch):
+    """Test that the locally rendered section is streamed before any generated section."""
+    monkeypatch.setattr(main, "NON_LLM_EVALUATIONS", "local")
+    llm_output = {key: value for key, value in mock_api_response.items() if key != "Non-LLM Evaluations"}
+    main.client.models.generate_content_stream = mock_stream(json.dumps(llm_output))
+    audit = json.dumps({"axeCoreResult": None, "pageSpeedResult": None, "nuValidatorResult": None, "responsivenessResult": False})
+
+    response = client.post("/webpage-analysis/stream", data={"htmlText": "<h1>Test</h1>", "webAuditResults": audit})
+
+    events = parse_sse(response.text)
+    assert events[0][1]["path"] == ["Non-LLM Evaluations"]
+    assert events[0][1]["data"]["Layout Report"]["Summary"] == "No horizontal overflow was detected at desktop width."
+    assert events[-1][0] == "complete"
+    assert events[-1][1]["Non-LLM Evaluations"] == events[0][1]["data"]
+
+
+def fanout_output(config):
+    """Returns the part of mock_api_response matching a fan-out call's schema."""
+    aliases = config["response_schema"].model_json_schema(by_alias=True)["properties"]
+    detailed = mock_api_response["Detailed Analysis"]
+    return json.dumps({alias: detailed[alias] if alias in detailed else mock_api_response[alias] for alias in aliases})
+
+
+@patch("app.main.client.models.generate_content")
+def test_fanout_generates_each_category_concurrently(mock_generate, monkeypatch):
+    """Test that fan-out makes one call per category with its own schema and assembles the response."""
+    mock_generate.side_effect = lambda **kwargs: Mock(text=fanout_output(kwargs["config"]))
+    audit = json.dumps({"axeCoreResult": None, "pageSpeedResult": None, "nuValidatorResult": None, "responsivenessResult": True})
+
+    response = client.post("/webpage-analysis", data={"htmlText": "<h1>Test</h1>", "webAuditResults": audit, "fanout": "true"})
+
+    assert response.status_code == 200
+    assert mock_generate.await_count == 5
+    prompts = [call.kwargs["contents"][0] for call in mock_generate.call_args_list]
+    assert any('Only fill in the "Styling Discrepancies" section(s)' in prompt for prompt in prompts)
+    body = json.loads(response.text)
+    assert body["Detailed Analysis"] == mock_api_response["Detailed Analysis"]
+    assert body["Other Issues"] == mock_api_response["Other Issues"]
+    assert body["Non-LLM Evaluations"] == mock_api_response["Non-LLM Evaluations"]
+    assert body["Executive Summary"].startswith("Content Discrepancies: Mock content summary.")
+
+
+@patch("app.main.client.models.generate_content")
+def test_fanout_returns_other_categories_when_one_fails(mock_generate, monkeypatch):
+    """Test that a failed category call is reported and the partial result is not cached."""
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=8, path=None))
+
+    def generate(**kwargs):
+        if "Styling Discrepancies" in kwargs["config"]["response_schema"].model_json_schema(by_alias=True)["properties"]:
+            raise RuntimeError("upstream error")
+        return Mock(text=fanout_output(kwargs["config"]))
+    mock_generate.side_effect = generate
+
+    response = client.post("/webpage-analysis", data={"htmlText": "<h1>Test</h1>", "fanout": "true"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Fanout-Failed"] == "styling"
+    body = json.loads(response.text)
+    assert body["Detailed Analysis"]["Styling Discrepancies"] is None
+    assert body["Detailed Analysis"]["Content Discrepancies"] == mock_api_response["Detailed Analysis"]["Content Discrepancies"]
+    assert len(main.result_cache.memory) == 0
+
+
+def batch_pages(*pages):
+    return json.dumps([{"id": f"p{i}", "htmlText": html} for i, html in enumerate(pages)])
+
+
+@patch("app.main.client.models.generate_content")
+def test_batch_returns_per_page_results_and_errors(mock_generate):
+    """Test that a batch analyzes every valid page and reports invalid ones individually."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    pages = json.loads(batch_pages("<h1>A</h1>", "<h1>B</h1>"))
+    pages.append({"id": "bad", "htmlText": "<h1>C</h1>", "webAuditResults": {"axeCoreResult": []}})
+
+    response = client.post("/webpage-analysis/batch", data={"pages": json.dumps(pages), "specification": "Shared spec"})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [entry["id"] for entry in results] == ["p0", "p1", "bad"]
+    assert [entry["status"] for entry in results] == ["ok", "ok", "error"]
+    assert results[0]["result"] == mock_api_response
+    assert results[2]["status_code"] == 400 and results[2]["detail"] == "Invalid webAuditResults structure"
+    assert mock_generate.await_count == 2
+    assert all("Shared spec" in call.kwargs["contents"][0] for call in mock_generate.call_args_list)
+
+
+@patch("app.main.client.models.generate_content")
+@patch("app.main.client.files.upload")
+@patch("app.main.client.files.delete")
+def test_batch_uploads_shared_design_once(mock_delete, mock_upload, mock_generate):
+    """Test that the shared design file is uploaded once for all pages and deleted afterwards."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    mock_upload.return_value.name = "files/shared"
+
+    response = client.post(
+        "/webpage-analysis/batch",
+        data={"pages": batch_pages("<h1>A</h1>", "<h1>B</h1>", "<h1>C</h1>")},
+        files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")}
+    )
+
+    assert response.status_code == 200
+    assert mock_generate.await_count == 3
+    mock_upload.assert_awaited_once()
+    mock_delete.assert_awaited_once_with(name="files/shared")
+
+
+def test_batch_streams_ndjson_with_bounded_concurrency(monkeypatch):
+    """Test that the NDJSON stream yields one line per page and respects the concurrency limit."""
+    running = 0
+    peak = 0
+
+    async def generate(**kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return Mock(text=json.dumps(mock_api_response))
+    main.client.models.generate_content = AsyncMock(side_effect=generate)
+
+    response = client.post("/webpage-analysis/batch", data={"pages": batch_pages(*[f"<h1>{i}</h1>" for i in range(6)]), "stream": "true", "concurrency": "2"})
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(entry["id"] for entry in entries) == [f"p{i}" for i in range(6)]
+    assert all(entry["status"] == "ok" for entry in entries)
+    assert peak == 2
+
+
+def test_batch_rejects_malformed_pages():
+    """Test that a pages field that is not a JSON array of objects, or has an invalid page, returns 400."""
+    response = client.post("/webpage-analysis/batch", data={"pages": "{}"})
+    assert response.status_code == 400
+
+    for page in ({"id": "a"}, {"id": "a", "htmlText": 42}, {"id": "a", "htmlText": "<p>a</p>", "specification": ["x"]}):
+        response = client.post("/webpage-analysis/batch", data={"pages": json.dumps([page])})
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("Page a: ")
+
+
+def test_offline_batch_is_submitted_and_collected(monkeypatch):
+    """Test the offline mode end to end against the local fake batch provider."""
+    from app.batch import LocalBatches, OfflineBatches
+    main.client.models.generate_content.return_value.text = json.dumps(mock_api_response)
+    main.client.batches = LocalBatches(main.client.models)
+    monkeypatch.setattr(main, "offline_batches", OfflineBatches())
+    monkeypatch.setattr(main, "result_cache", ResultCache(max_entries=8, path=None))
+
+    submitted = client.post("/webpage-analysis/batch", data={"pages": batch_pages("<h1>A</h1>", ""), "offline": "true"})
+
+    assert submitted.status_code == 202
+    body = submitted.json()
+    assert body["state"] == "JOB_STATE_PENDING"
+    assert body["results"] == [{"index": 1, "id": "p1", "status": "error", "status_code": 400, "detail": "htmlText is required"}]
+    main.client.models.generate_content.assert_not_awaited()
+
+    collected = client.get(f"/webpage-analysis/batch/{body['batch']}")
+
+    assert collected.status_code == 200
+    assert collected.json()["done"] is True
+    results = collected.json()["results"]
+    assert results[0] == {"index": 0, "id": "p0", "status": "ok", "result": mock_api_response}
+    assert len(main.result_cache.memory) == 1
+    assert client.get("/webpage-analysis/batch/batches/unknown").status_code == 404
+
+    # Collected batches are forgotten after their retention period
+    main.offline_batches.ttl_seconds = 0
+    main.offline_batches.collected(main.offline_batches.get(body["batch"]))
+    assert client.get(f"/webpage-analysis/batch/{body['batch']}").status_code == 404
+    assert len(main.offline_batches) == 0
+
+
+def test_concurrent_polls_collect_an_offline_batch_once(monkeypatch):
+    """Test that polls racing on a finished offline batch query, collect and clean it up only once."""
+    from app.batch import OfflineBatch, OfflineBatches
+
+    async def get(name):
+        await asyncio.sleep(0.01)
+        return Mock(state="JOB_STATE_FAILED", dest=None)
+
+    main.client.batches = Mock(get=AsyncMock(side_effect=get))
+    delete = AsyncMock()
+    monkeypatch.setattr(main, "delete_design_file", delete)
+    monkeypatch.setattr(main, "offline_batches", OfflineBatches())
+    main.offline_batches.add("batches/1", OfflineBatch(uploads=["files/design"]))
+
+    async def poll_twice():
+        return await asyncio.gather(*(main.webpage_analysis_batch_status("batches/1") for _ in range(2)))
+
+    assert [body["done"] for body in asyncio.run(poll_twice())] == [True, True]
+    main.client.batches.get.assert_awaited_once()
+    delete.assert_awaited_once_with(main.client, "files/design")
+
+
+def test_job_is_queued_then_processed():
+    """Test that POST /jobs returns 202 right away and GET /jobs/{id} serves the result once a worker ran it."""
+    main.client.models.generate_content.return_value.text = json.dumps(mock_api_response)
+    main.client.files.upload = AsyncMock(return_value=Mock(uri="files/design", mime_type="image/png"))
+
+    submitted = client.post("/jobs", data=html_json, files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")})
+
+    assert submitted.status_code == 202
+    job_id = submitted.json()["id"]
+    assert submitted.headers["Location"] == f"/jobs/{job_id}"
+    assert client.get(f"/jobs/{job_id}").json()["status"] == "queued"
+    main.client.models.generate_content.assert_not_awaited()
+
+    assert asyncio.run(main.job_workers.run_once()) is True
+
+    body = client.get(f"/jobs/{job_id}").json()
+    assert body["status"] == "succeeded"
+    assert body["result"] == mock_api_response
+    main.client.models.generate_content.assert_awaited_once()
+    assert asyncio.run(main.job_workers.run_once()) is False
+
+
+def test_jobs_are_disabled_without_jobs_path(monkeypatch, tmp_path):
+    """Test that the job endpoints answer 503 and create no file when JOBS_PATH is unset."""
+    monkeypatch.setattr(main, "job_store", JobStore(path=""))
+
+    assert client.post("/jobs", data=html_json).status_code == 503
+    assert client.get("/jobs/unknown").status_code == 503
+    assert not list(tmp_path.glob("*.sqlite3"))
+
+
+def test_job_failure_is_reported():
+    """Test that a job whose analysis raises ends up failed with the error detail."""
+    main.client.models.generate_content.side_effect = Exception("boom")
+
+    job_id = client.post("/jobs", data=html_json).json()["id"]
+    asyncio.run(main.job_workers.run_once())
+
+    body = client.get(f"/jobs/{job_id}").json()
+    assert body["status"] == "failed"
+    assert body["error"]
+
+
+def test_job_idempotency_key():
+    """Test that a retried submission returns the same job, and a reused key with other inputs returns 409."""
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post("/jobs", data=html_json, headers=headers)
+    replay = client.post("/jobs", data=html_json, headers=headers)
+    conflict = client.post("/jobs", data=html_spec_json, headers=headers)
+
+    assert first.status_code == 202
+    assert replay.status_code == 200
+    assert replay.json()["id"] == first.json()["id"]
+    assert conflict.status_code == 409
+    assert main.job_store.counts() == {"queued": 1}
+
+
+def test_job_rejects_invalid_input_and_unknown_id():
+    """Test that invalid inputs are rejected at submission and unknown job ids return 404."""
+    assert client.post("/jobs", data={"htmlText": "<h1>Hi</h1>", "webAuditResults": "{"}).status_code == 400
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_rate_limited_request_returns_429(monkeypatch):
+    """Test that a call that would wait longer than the maximum queue time returns 429 with Retry-After, without reaching the model."""
+    monkeypatch.setattr(main, "rate_limiters", RateLimiters(rpm=1, tpm=0, model_limits={}, max_wait=0))
+    main.client.models.generate_content.return_value.text = json.dumps(mock_api_response)
+
+    assert client.post("/webpage-analysis", data=html_json).status_code == 200
+    limited = client.post("/webpage-analysis", data={"htmlText": "<h1>Other</h1>"})
+
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    main.client.models.generate_content.assert_awaited_once()
+    stats = client.get("/rate-limit-stats").json()[f"client-1:{main.model}"]
+    assert (stats["admitted"], stats["rejected"]) == (1, 1)
+
+
+def test_rate_limited_job_is_requeued(monkeypatch):
+    """Test that a job rejected by the rate limiter goes back to the queue instead of failing."""
+    monkeypatch.setattr(main, "rate_limiters", RateLimiters(rpm=1, tpm=0, model_limits={}, max_wait=0))
+    main.rate_limiters.for_model(main.model, "client-1")._requests = 0
+    main.job_workers.poll_seconds = 0
+    monkeypatch.setattr(asyncio, "sleep", AsyncMock())
+
+    job_id = client.post("/jobs", data=html_json).json()["id"]
+    asyncio.run(main.job_workers.run_once())
+
+    job = main.job_store.get(job_id)
+    assert (job.status, job.attempts) == ("queued", 0)
+    main.client.models.generate_content.assert_not_awaited()
+
+
+class UpstreamError(Exception):
+    def __init__(self, code):
+        super().__init__(f"upstream returned {code}")
+        self.code = code
+
+
+def test_transient_upstream_error_is_retried():
+    """Test that a 503 from the model is retried instead of failing the request, and the attempts are reported."""
+    ok = Mock(text=json.dumps(mock_api_response))
+    main.client.models.generate_content.side_effect = [UpstreamError(503), ok]
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 200
+    assert main.client.models.generate_content.await_count == 2
+    attempts = {(a["kind"], a["outcome"]): a["count"] for a in client.get("/generation-stats").json()["attempts"]}
+    assert attempts == {("first", "transient"): 1, ("retry", "ok"): 1}
+
+
+def test_invalid_model_output_is_reissued_then_fails():
+    """Test that output failing validation is re-issued once before the request fails with 500."""
+    main.client.models.generate_content.return_value.text = "{not json"
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 500
+    assert main.client.models.generate_content.await_count == 2
+
+
+def test_fallback_model_is_used(monkeypatch):
+    """Test that the fallback model serves the request once the primary model keeps failing."""
+    monkeypatch.setattr(main, "generator", ResilientGenerator(max_retries=0, hedge_after=0, fallback_model="backup-model", sleep=AsyncMock()))
+    ok = Mock(text=json.dumps(mock_api_response))
+    main.client.models.generate_content.side_effect = [UpstreamError(500), ok]
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 200
+    assert [call.kwargs["model"] for call in main.client.models.generate_content.await_args_list] == [main.model, "backup-model"]
+
+
+def pooled_mock():
+    mock = Mock()
+    mock.models.generate_content = AsyncMock(return_value=Mock(text=json.dumps(mock_api_response)))
+    mock.files.upload = AsyncMock(return_value=Mock(uri="files/design", mime_type="image/png"))
+    mock.files.delete = AsyncMock()
+    return mock
+
+
+def test_design_upload_stays_on_its_client(monkeypatch):
+    """Test that a request uploads, generates and deletes through the same pooled client, and that requests are spread over the pool."""
+    first, second = pooled_mock(), pooled_mock()
+    monkeypatch.setattr(main, "client_pool", ClientPool([first, second]))
+    busy = main.client_pool.lease()
+
+    response = client.post("/webpage-analysis", data=html_json, files={"designFile": ("design.png", b"\x89PNG\r\n\x1a\n", "image/png")})
+
+    assert response.status_code == 200
+    first.models.generate_content.assert_not_awaited()
+    second.files.upload.assert_awaited_once()
+    second.models.generate_content.assert_awaited_once()
+    second.files.delete.assert_awaited_once()
+    busy.release()
+    assert [c["in_flight"] for c in client.get("/client-stats").json()["clients"]] == [0, 0]
+
+
+def test_rate_limited_client_is_avoided(monkeypatch):
+    """Test that a client answering 429 is put in cooldown and the next request goes to another client."""
+    first, second = pooled_mock(), pooled_mock()
+    first.models.generate_content.side_effect = UpstreamError(429)
+    monkeypatch.setattr(main, "client_pool", ClientPool([first, second]))
+    monkeypatch.setattr(main, "generator", ResilientGenerator(max_retries=0, revalidate=False, hedge_after=0, fallback_model="", sleep=AsyncMock()))
+
+    assert client.post("/webpage-analysis", data=html_json).status_code == 500
+    assert client.post("/webpage-analysis", data={"htmlText": "<h1>Other</h1>"}).status_code == 200
+
+    first.models.generate_content.assert_awaited_once()
+    second.models.generate_content.assert_awaited_once()
+    stats = client.get("/client-stats").json()["clients"]
+    assert stats[0]["cooldown_seconds"] > 0
+
+
+@patch("app.main.client.models.generate_content")
+def test_prompt_within_budget_reports_full_plan(mock_generate):
+    """Test that the token preflight reports the estimate and leaves a small prompt unchanged."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+
+    response = client.post("/webpage-analysis", data=html_spec_json)
+
+    assert response.status_code == 200
+    assert response.headers["X-Prompt-Plan"] == "full"
+    assert 0 < int(response.headers["X-Prompt-Tokens"]) <= int(response.headers["X-Prompt-Token-Budget"])
+
+
+@patch("app.main.client.models.generate_content")
+def test_prompt_over_budget_is_trimmed(mock_generate, monkeypatch):
+    """Test that an over-budget prompt has its specification truncated before the call."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    small = main.estimate_tokens(main.get_prompt(htmlText="<h1>Hello</h1>", specification="", designFile=False, evaluations=None)) + 50
+    monkeypatch.setattr(main, "token_budget", lambda model: small)
+
+    response = client.post("/webpage-analysis", data={"htmlText": "<h1>Hello</h1>", "specification": "Must follow accessibility. " * 200})
+
+    assert response.status_code == 200
+    assert response.headers["X-Prompt-Plan"] == "specification"
+    prompt = mock_generate.call_args.kwargs["contents"][0]
+    assert "specification truncated" in prompt
+
+
+@patch("app.main.client.models.generate_content")
+def test_prompt_that_cannot_fit_is_rejected(mock_generate, monkeypatch):
+    """Test that a prompt still over budget after trimming is rejected with 413 and never sent."""
+    monkeypatch.setattr(main, "token_budget", lambda model: 10)
+
+    response = client.post("/webpage-analysis", data=html_json)
+
+    assert response.status_code == 413
+    assert "budget" in response.json()["detail"]
+    mock_generate.assert_not_called()
+
+
+@patch("app.main.client.models.generate_content")
+def test_stages_are_reported_in_server_timing_and_metrics(mock_generate):
+    """Test that the analysis stages show up in the Server-Timing header and at /metrics."""
+    mock_generate.return_value.text = json.dumps(mock_api_response)
+    mock_generate.return_value.usage_metadata = Mock(prompt_token_count=1000, candidates_token_count=200, cached_content_token_count=None)
+
+    response = client.post("/webpage-analysis", data=html_spec_json)
+
+    assert response.status_code == 200
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert {"intake", "validate", "reduce", "compact", "budget", "prompt", "generate", "parse"} <= set(stages)
+
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{route="/webpage-analysis",method="POST",status="200"}' in metrics.text
+    assert 'analysis_stage_seconds_count{stage="generate"}' in metrics.text
+    assert f'gemini_tokens_sum{{model="{main.model}",kind="prompt"}}' in metrics.text
+    assert f'generation_attempts_total{{model="{main.model}",kind="first",outcome="ok"}}' in metrics.text
+    assert 'gemini_client_in_flight{client="client-1"} 0' in metrics.text
@@ -0,0 +1,73 @@
+import pytest
+from types import SimpleNamespace
+from app.metrics import Registry, RequestTimings, stage, current_timings, record_usage, upstream_tokens, errors_total, _timings
+
+
+def test_counter_and_gauge_render_with_labels():
+    registry = Registry()
+    counter = registry.counter("calls_total", "Calls.", ("route",))
+    gauge = registry.gauge("queued", "Queued calls.")
+    counter.inc("/a")
+    counter.inc("/a", amount=2)
+    counter.inc('/b"')
+    gauge.set(value=1.5)
+
+    text = registry.render()
+
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{route="/a"} 3' in text
+    assert 'calls_total{route="/b\\""} 1' in text
+    assert "# TYPE queued gauge\nqueued 1.5" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1))
+    histogram.observe("generate", value=0.05)
+    histogram.observe("generate", value=0.5)
+    histogram.observe("generate", value=5)
+
+    lines = registry.render().splitlines()
+
+    assert 'latency_seconds_bucket{stage="generate",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="generate",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="generate",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="generate"} 5.55' in lines
+    assert 'latency_seconds_count{stage="generate"} 3' in lines
+
+
+def test_server_timing_sums_repeated_stages():
+    now = iter([0.0, 0.25])
+    timings = RequestTimings(clock=lambda: next(now))
+    timings.add("generate", 0.5)
+    timings.add("generate", 0.25)
+    timings.add("parse", 0.001)
+
+    assert timings.server_timing() == "generate;dur=750.0, parse;dur=1.0"
+    assert timings.elapsed() == 0.25
+
+
+def test_stage_records_into_current_request_and_counts_errors():
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        with stage("validate"):
+            pass
+        with pytest.raises(KeyError):
+            with stage("parse"):
+                raise KeyError("x")
+        assert current_timings() is timings
+    finally:
+        _timings.reset(token)
+
+    assert set(timings.stages) == {"validate", "parse"}
+    assert errors_total.values[("parse", "KeyError")] >= 1
+
+
+def test_usage_metadata_skips_missing_counts():
+    record_usage("usage-model", SimpleNamespace(prompt_token_count=1200, candidates_token_count=300, cached_content_token_count=None))
+    record_usage("usage-model", None)
+
+    assert upstream_tokens.counts[("usage-model", "prompt")][-1] == 1
+    assert upstream_tokens.sums[("usage-model", "output")] == 300
+    assert ("usage-model", "cached") not in upstream_tokens.counts
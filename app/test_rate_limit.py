@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from app.rate_limit import RateLimiter, RateLimiters, RateLimited, parse_model_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def limiter(clock, **kwargs):
+    return RateLimiter(clock=clock, sleep=clock.sleep, **{"rpm": 0, "tpm": 0, "queue_size": 10, "max_wait": 30, **kwargs})
+
+
+def test_disabled_limiter_admits_everything():
+    clock = Clock()
+    disabled = limiter(clock)
+
+    for _ in range(100):
+        assert asyncio.run(disabled.acquire(10**9)) == 0.0
+    assert not disabled.enabled
+
+
+def test_rpm_spaces_calls_once_the_bucket_is_empty():
+    clock = Clock()
+    rpm = limiter(clock, rpm=60)
+
+    async def calls():
+        for _ in range(61):
+            await rpm.acquire(1)
+
+    asyncio.run(calls())
+
+    # 60 calls from the full bucket, then one per second
+    assert clock.sleeps == [pytest.approx(1.0)]
+    assert rpm.stats["admitted"] == 61
+
+
+def test_tpm_waits_for_token_refill():
+    clock = Clock()
+    tpm = limiter(clock, tpm=6000)
+
+    asyncio.run(tpm.acquire(6000))
+    waited = asyncio.run(tpm.acquire(3000))
+
+    assert waited == pytest.approx(30.0)
+    assert tpm.stats["wait_seconds_max"] == pytest.approx(30.0)
+
+
+def test_oversized_prompt_is_capped_at_tpm():
+    clock = Clock()
+    tpm = limiter(clock, tpm=1000)
+
+    assert asyncio.run(tpm.acquire(50_000)) == 0.0
+
+
+def test_call_over_max_wait_is_rejected_with_retry_after():
+    clock = Clock()
+    rpm = limiter(clock, rpm=1, max_wait=5)
+    asyncio.run(rpm.acquire(1))
+
+    with pytest.raises(RateLimited) as rejected:
+        asyncio.run(rpm.acquire(1))
+
+    assert rejected.value.retry_after == 60
+    assert rejected.value.status_code == 429
+    assert rpm.stats["rejected"] == 1
+    assert clock.sleeps == []
+
+
+def test_full_queue_is_rejected():
+    clock = Clock()
+    rpm = limiter(clock, rpm=60, queue_size=0)
+
+    with pytest.raises(RateLimited):
+        rpm.check()
+
+
+def test_limiters_are_per_model_with_overrides():
+    limiters = RateLimiters(rpm=10, tpm=1000, model_limits={"pro": (2, 500)})
+
+    assert limiters.for_model("flash").rpm == 10
+    assert (limiters.for_model("pro").rpm, limiters.for_model("pro").tpm) == (2, 500)
+    assert limiters.for_model("pro") is limiters.for_model("pro")
+    assert set(limiters.snapshot()) == {"flash", "pro"}
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("a=1:2, models/b=30:4000") == {"a": (1, 2), "models/b": (30, 4000)}
+    assert parse_model_limits("") == {}
+    with pytest.raises(ValueError):
+        parse_model_limits("a=1")
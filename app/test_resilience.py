@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from pydantic import BaseModel
+from app.rate_limit import RateLimited
+from app.resilience import ResilientGenerator, is_transient
+
+
+class Output(BaseModel):
+    value: int
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def generator(**kwargs):
+    return ResilientGenerator(**{"max_retries": 2, "backoff": 1, "backoff_max": 10, "revalidate": True, "hedge_after": 0, "fallback_model": "", "sleep": AsyncMock(), "jitter": lambda: 1.0, **kwargs})
+
+
+def scripted(*outcomes):
+    """A call returning (or raising) the given outcomes in order, recording the models it was called with."""
+    remaining = list(outcomes)
+    models = []
+
+    async def call(model):
+        models.append(model)
+        outcome = remaining.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call, models
+
+
+def outcomes(gen):
+    return [(entry["model"], entry["kind"], entry["outcome"], entry["count"]) for entry in gen.stats.snapshot()]
+
+
+def test_transient_errors_are_retried_with_backoff():
+    gen = generator()
+    call, models = scripted(ApiError(503), asyncio.TimeoutError(), '{"value": 1}')
+
+    assert asyncio.run(gen.run("m", call, Output.model_validate_json)) == Output(value=1)
+
+    assert models == ["m", "m", "m"]
+    assert [args.args[0] for args in gen._sleep.await_args_list] == [1, 2]
+    assert ("m", "retry", "ok", 1) in outcomes(gen)
+
+
+def test_retries_are_bounded():
+    gen = generator(max_retries=1)
+    call, models = scripted(ApiError(500), ApiError(500))
+
+    with pytest.raises(ApiError):
+        asyncio.run(gen.run("m", call, Output.model_validate_json))
+    assert len(models) == 2
+
+
+def test_non_transient_errors_and_rate_limiting_are_not_retried():
+    for error in (ApiError(400), ValueError("bad"), RateLimited(5)):
+        gen = generator(fallback_model="backup")
+        call, models = scripted(error)
+
+        with pytest.raises(type(error)):
+            asyncio.run(gen.run("m", call, Output.model_validate_json))
+        assert models == ["m"]
+
+
+def test_invalid_output_is_reissued_once():
+    gen = generator()
+    call, models = scripted("not json", '{"value": 2}')
+
+    assert asyncio.run(gen.run("m", call, Output.model_validate_json)) == Output(value=2)
+    assert outcomes(gen) == [("m", "first", "invalid", 1), ("m", "revalidate", "ok", 1)]
+
+    gen = generator()
+    call, models = scripted("not json", "still not json")
+    with pytest.raises(ValueError):
+        asyncio.run(gen.run("m", call, Output.model_validate_json))
+    assert len(models) == 2
+
+
+def test_fallback_model_after_primary_fails():
+    gen = generator(max_retries=1, fallback_model="backup")
+    call, models = scripted(ApiError(503), ApiError(503), '{"value": 3}')
+
+    assert asyncio.run(gen.run("m", call, Output.model_validate_json)) == Output(value=3)
+    assert models == ["m", "m", "backup"]
+    assert ("backup", "first", "ok", 1) in outcomes(gen)
+
+
+def test_hedge_request_wins_over_slow_call():
+    gen = generator(hedge_after=0.01)
+    started = []
+
+    async def call(model):
+        started.append(model)
+        if len(started) == 1:
+            await asyncio.sleep(10)
+        return '{"value": 4}'
+
+    assert asyncio.run(gen.run("m", call, Output.model_validate_json)) == Output(value=4)
+    assert len(started) == 2
+    assert outcomes(gen) == [("m", "first", "cancelled", 1), ("m", "hedge", "ok", 1)]
+
+
+def test_hedge_is_not_sent_for_fast_calls():
+    gen = generator(hedge_after=5)
+    call, models = scripted('{"value": 5}')
+
+    asyncio.run(gen.run("m", call, Output.model_validate_json))
+    assert models == ["m"]
+
+
+def test_is_transient():
+    assert is_transient(ApiError(429))
+    assert is_transient(ConnectionError())
+    assert not is_transient(ApiError(404))
+    assert not is_transient(RateLimited(1))
+    assert not is_transient(RuntimeError("boom"))
@@ -0,0 +1,51 @@
+import json
+from app.result_cache import MemoryTier, SqliteTier, analysis_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_ignores_audit_formatting_and_line_endings():
+    audit = {"axeCoreResult": [1], "pageSpeedResult": None}
+    key = analysis_cache_key("<h1>a</h1>\r\n", "spec", json.dumps(audit, indent=2), None, "m", "1")
+    same = analysis_cache_key("<h1>a</h1>\n", "spec ", json.dumps(dict(reversed(audit.items()))), None, "m", "1")
+    assert key == same
+
+
+def test_cache_key_changes_with_model_design_and_prompt_version():
+    base = analysis_cache_key("<h1>a</h1>", "", "", None, "m", "1")
+    assert base != analysis_cache_key("<h1>a</h1>", "", "", None, "other", "1")
+    assert base != analysis_cache_key("<h1>a</h1>", "", "", "abc", "m", "1")
+    assert base != analysis_cache_key("<h1>a</h1>", "", "", None, "m", "2")
+
+
+def test_memory_tier_expires_and_evicts_lru():
+    clock = FakeClock()
+    tier = MemoryTier(max_entries=2, ttl_seconds=10, clock=clock)
+    tier.set("a", "A")
+    tier.set("b", "B")
+    tier.get("a")
+    tier.set("c", "C")
+    assert tier.get("b") is None
+    assert tier.get("a") == "A"
+    clock.now += 11
+    assert tier.get("a") is None
+
+
+def test_sqlite_tier_is_bounded_and_expires(tmp_path):
+    clock = FakeClock()
+    tier = SqliteTier(str(tmp_path / "cache.sqlite3"), max_entries=2, ttl_seconds=10, clock=clock)
+    tier.set("a", "A")
+    clock.now += 1
+    tier.set("b", "B")
+    clock.now += 1
+    tier.set("c", "C")
+    assert tier.get("a") is None
+    assert tier.get("c") == "C"
+    clock.now += 11
+    assert tier.get("c") is None
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from app.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+        gate = asyncio.Event()
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await gate.wait()
+            return "result"
+
+        tasks = [asyncio.create_task(flight.do("key", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flight.waiters("key") == 5
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        return calls, results, len(flight)
+
+    calls, results, remaining = asyncio.run(run())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert remaining == 0
+
+
+def test_failure_reaches_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def run():
+        flight = SingleFlight()
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return "result"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        return first, await second
+
+    first, result = asyncio.run(run())
+    assert first.cancelled()
+    assert result == "result"
+
+
+def test_shared_call_is_cancelled_when_all_waiters_leave():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.create_task(flight.do("key", work))
+        await started.wait()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.wait_for(cancelled.wait(), 1)
+        for _ in range(3):
+            await asyncio.sleep(0)  # let the task finish and run its done callback
+        return len(flight)
+
+    assert asyncio.run(run()) == 0
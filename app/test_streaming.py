@@ -0,0 +1,44 @@
+import json
+from app.streaming import SectionParser, validate_section, sse_event
+
+
+def feed_all(text, size=3):
+    parser = SectionParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return parser, completed
+
+
+def test_sections_complete_in_order_with_tricky_strings():
+    document = {
+        "Executive Summary": 'Quotes " and braces } inside {strings}',
+        "Detailed Analysis": {"Content Discrepancies": {"Summary": "a\\nb", "Findings": []}, "Styling Discrepancies": None},
+        "Non-LLM Evaluations": None,
+        "Other Issues": [{"Issue": "x", "Code": "<div>[1, 2]</div>"}],
+    }
+    parser, completed = feed_all("Here you go:\n" + json.dumps(document))
+
+    assert [path for path, _ in completed] == [
+        ("Executive Summary",),
+        ("Detailed Analysis", "Content Discrepancies"),
+        ("Detailed Analysis", "Styling Discrepancies"),
+        ("Non-LLM Evaluations",),
+        ("Other Issues",),
+    ]
+    assert completed[0][1] == document["Executive Summary"]
+    assert json.loads(parser.document()) == document
+
+
+def test_unknown_keys_are_not_emitted():
+    _, completed = feed_all('{"Unexpected": {"a": 1}, "Executive Summary": "ok"}')
+    assert completed == [(("Executive Summary",), "ok")]
+
+
+def test_validate_section_uses_sub_models():
+    assert validate_section(("Other Issues",), [{"Issue": "x"}]) == [{"Issue": "x", "Details": None, "Code": None, "Recommended Fix": None}]
+    assert validate_section(("Other Issues",), "not a list") is None
+
+
+def test_sse_event_format():
+    assert sse_event("complete", {"a": 1}) == 'event: complete\ndata: {"a": 1}\n\n'
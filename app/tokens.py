@@ -0,0 +1,61 @@
+"""
+Cheap, local prompt-size estimates.
+
+Gemini tokenizes English prose and markup at roughly four characters per token. The estimate is only
+used for reporting and budgeting, never for billing, so a fast heuristic beats a count-tokens round-trip.
+"""
+
+import math
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str | None) -> int:
+    """
+    Estimates the number of model tokens in a piece of text.
+
+    Args:
+        text (str | None): The text to measure.
+
+    Returns:
+        int: The estimated token count (0 for empty input).
+    """
+    if not text:
+        return 0
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+# Gemini bills an image of up to 384x384 pixels as 258 tokens (larger images are tiled); used as the
+# estimate for every non-text part
+IMAGE_TOKENS = 258
+# Larger images are cropped and scaled into tiles of this size, each billed as IMAGE_TOKENS
+IMAGE_TILE_PIXELS = 768
+
+
+def image_tokens(width: int | None = None, height: int | None = None) -> int:
+    """
+    Estimates the input tokens of an image.
+
+    Args:
+        width (int | None, optional): The image width in pixels. Defaults to None (unknown size).
+        height (int | None, optional): The image height in pixels. Defaults to None (unknown size).
+
+    Returns:
+        int: The estimated token count (`IMAGE_TOKENS` when the size is unknown).
+    """
+    if not width or not height or (width <= 384 and height <= 384):
+        return IMAGE_TOKENS
+    return math.ceil(width / IMAGE_TILE_PIXELS) * math.ceil(height / IMAGE_TILE_PIXELS) * IMAGE_TOKENS
+
+
+def estimate_contents_tokens(contents: list) -> int:
+    """
+    Estimates the input tokens of a `generate_content` call.
+
+    Args:
+        contents (list): Prompt strings and design file parts/handles.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return sum(estimate_tokens(part) if isinstance(part, str) else IMAGE_TOKENS for part in contents)